@@ -12,6 +12,8 @@ import traceback
 from config import COLORS, EMOJIS, get_server_config, update_server_config, user_has_permission, is_module_enabled
 from utils.helpers import create_embed, format_duration
 from utils.database import get_user_data, update_user_data, get_guild_data, update_guild_data
+from utils import async_database as adb
+from utils import metrics
 
 logger = logging.getLogger(__name__)
 
@@ -102,8 +104,10 @@ class PrefixModal(discord.ui.Modal):
             await interaction.response.send_message("❌ Prefix cannot be empty!", ephemeral=True)
             return
             
+        # Apply the change to the current config, not the copy taken when the view opened
+        self.config = await adb.get_server_config(self.guild_id)
         self.config['prefix'] = new_prefix
-        update_server_config(self.guild_id, self.config)
+        await adb.update_server_config(self.guild_id, self.config)
         
         embed = create_embed(
             "✅ Prefix Changed",
@@ -197,8 +201,9 @@ class AIChannelModal(discord.ui.Modal):
         import re
         channel_ids = re.findall(r'<#(\d+)>', channels_text)
         
+        self.config = await adb.get_server_config(self.guild_id)
         self.config['ai_channels'] = [int(ch) for ch in channel_ids]
-        update_server_config(self.guild_id, self.config)
+        await adb.update_server_config(self.guild_id, self.config)
         
         if channel_ids:
             channel_mentions = [f"<#{ch}>" for ch in channel_ids]
@@ -260,10 +265,11 @@ class ModLogModal(discord.ui.Modal):
     async def on_submit(self, interaction: discord.Interaction):
         """Handle mod log channel setting."""
         channel_text = self.channel_input.value.strip()
+        self.config = await adb.get_server_config(self.guild_id)
         
         if not channel_text:
             self.config['mod_log_channel'] = None
-            update_server_config(self.guild_id, self.config)
+            await adb.update_server_config(self.guild_id, self.config)
             
             embed = create_embed(
                 "✅ Mod Log Cleared",
@@ -278,7 +284,7 @@ class ModLogModal(discord.ui.Modal):
             if channel_match:
                 channel_id = int(channel_match.group(1))
                 self.config['mod_log_channel'] = channel_id
-                update_server_config(self.guild_id, self.config)
+                await adb.update_server_config(self.guild_id, self.config)
                 
                 embed = create_embed(
                     "✅ Mod Log Set",
@@ -476,6 +482,130 @@ class AdminCog(commands.Cog):
         except Exception as e:
             await interaction.response.send_message(f"❌ Failed to sync commands: {e}", ephemeral=True)
 
+    @commands.command(name='rebuildleaderboards', help='Rebuild leaderboard indexes from all profiles (Owner only)')
+    @commands.is_owner()
+    async def rebuild_leaderboards_command(self, ctx):
+        """Rebuild leaderboard indexes."""
+        message = await ctx.send("🔄 Rebuilding leaderboard indexes...")
+        started = datetime.now()
+        count = await adb.rebuild_leaderboard_index()
+        elapsed = (datetime.now() - started).total_seconds()
+        await message.edit(content=f"✅ Rebuilt leaderboard indexes from {count:,} profiles in {elapsed:.1f}s.")
+
+    @commands.command(name='migrateprofiles', help='Upgrade all stored profiles to the latest schema (Owner only)')
+    @commands.is_owner()
+    async def migrate_profiles_command(self, ctx):
+        """Run the bulk profile migration in the background, reporting progress."""
+        message = await ctx.send("🔄 Migrating profiles...")
+        started = datetime.now()
+        last_update = started
+
+        async def report(done: int, total: int, migrated: int):
+            nonlocal last_update
+            now = datetime.now()
+            # Edits are rate limited; refresh at most every few seconds
+            if done < total and (now - last_update).total_seconds() < 3:
+                return
+            last_update = now
+            await message.edit(content=f"🔄 Migrating profiles... {done:,}/{total:,} checked, {migrated:,} upgraded")
+
+        async def run():
+            try:
+                result = await adb.migrate_profiles(progress=report)
+                elapsed = (datetime.now() - started).total_seconds()
+                await message.edit(content=f"✅ Checked {result['total']:,} profiles, upgraded {result['migrated']:,} in {elapsed:.1f}s.")
+            except Exception as e:
+                logger.error(f"Profile migration failed: {e}")
+                await message.edit(content=f"❌ Profile migration failed: {e}")
+
+        asyncio.create_task(run())
+
+    @commands.command(name='backup', help='Export a compressed backup of all bot data (Owner only)')
+    @commands.is_owner()
+    async def backup_command(self, ctx, mode: str = 'full'):
+        """Export a full or incremental backup to the backups directory."""
+        incremental = mode.lower() == 'incremental'
+        backup_dir = os.getenv('BACKUP_DIR', 'backups')
+        os.makedirs(backup_dir, exist_ok=True)
+        path = os.path.join(backup_dir, f"backup-{datetime.now().strftime('%Y%m%d-%H%M%S')}{'-incr' if incremental else ''}.jsonl.gz")
+        checkpoint = os.path.join(backup_dir, 'checkpoint.json.gz')
+        if incremental and not os.path.exists(checkpoint):
+            await ctx.send("❌ No checkpoint yet. Run a full `$backup` first.")
+            return
+
+        message = await ctx.send(f"🔄 Exporting {'incremental' if incremental else 'full'} backup...")
+        result = await adb.export_backup(path, incremental=incremental, checkpoint_path=checkpoint)
+        if result is None:
+            await message.edit(content="❌ Backup failed, check the logs.")
+            return
+        deleted = f" and {result['deleted']:,} deletions" if incremental else ""
+        await message.edit(content=(
+            f"✅ Backed up {result['written']:,} of {result['scanned']:,} keys{deleted} "
+            f"to `{path}` ({result['bytes'] / 1024:,.0f} KB, {result['seconds']:.1f}s)."
+        ))
+
+    @commands.command(name='dbstats', help='Storage latency, hot keys and per-command I/O (Owner only)')
+    @commands.is_owner()
+    async def db_stats_command(self, ctx, action: Optional[str] = None):
+        """Show storage call metrics, or clear them with `$dbstats reset`."""
+        if action and action.lower() == 'reset':
+            metrics.registry.reset()
+            await ctx.send("✅ Storage metrics reset.")
+            return
+
+        snapshot = metrics.registry.snapshot(hot_keys=8)
+        storage = await adb.get_storage_stats()
+        since = format_duration(int(datetime.now().timestamp() - snapshot['since']))
+        embed = discord.Embed(
+            title="📈 Storage Metrics",
+            description=f"Collected over the last {since}. Latencies are p50 / p95 / p99.",
+            color=COLORS['info']
+        )
+
+        operations = sorted(snapshot['operations'].items(), key=lambda item: -item[1]['total_ms'])[:8]
+        embed.add_field(
+            name="⏱️ Operations (by total time)",
+            value="\n".join(
+                f"`{name}` {stats['calls']:,}× · {stats['p50_ms']:.2f} / {stats['p95_ms']:.2f} / "
+                f"{stats['p99_ms']:.2f} ms · {stats['error_rate']:.1%} err · ~{stats['avg_bytes']:,} B"
+                for name, stats in operations
+            ) or "No calls recorded yet.",
+            inline=False
+        )
+
+        commands_by_io = sorted(snapshot['commands'].items(),
+                                key=lambda item: -item[1]['storage_ms_per_invocation'])[:8]
+        embed.add_field(
+            name="🐢 Most I/O-bound commands",
+            value="\n".join(
+                f"`{name}` {stats['storage_ms_per_invocation']:.1f} ms/run · "
+                f"{stats['storage_calls'] / max(stats['invocations'], 1):.1f} calls/run · {stats['invocations']:,} runs"
+                for name, stats in commands_by_io
+            ) or "No commands recorded yet.",
+            inline=False
+        )
+
+        embed.add_field(
+            name="🔥 Hot keys",
+            value="\n".join(f"`{entry['key']}` ~{entry['count']:,}" for entry in snapshot['hot_keys'])
+                  or "No keys recorded yet.",
+            inline=True
+        )
+
+        cache = storage.get('profile_cache', {})
+        lookups = cache.get('hits', 0) + cache.get('misses', 0)
+        hit_rate = cache.get('hits', 0) / lookups if lookups else 0
+        reclaimed = sum(storage.get('key_expiry', {}).get('reclaimed', {}).values())
+        embed.add_field(
+            name="🗄️ Profile cache",
+            value=f"**Size:** {cache.get('size', 0):,}/{cache.get('max_entries', 0):,}\n"
+                  f"**Hit rate:** {hit_rate:.1%}\n"
+                  f"**Dirty:** {cache.get('dirty', 0) + cache.get('patched', 0):,}\n"
+                  f"**Expired keys reclaimed:** {reclaimed:,}",
+            inline=True
+        )
+        await ctx.send(embed=embed)
+
 async def setup(bot):
     """Setup function for the cog."""
     await bot.add_cog(AdminCog(bot))
@@ -1,6 +1,7 @@
 import discord
 from discord.ext import commands
 from discord import app_commands
+import atexit
 import json
 import logging
 import os
@@ -10,9 +11,11 @@ from typing import Optional, Dict, Any
 from google import genai
 from google.genai import types
 
-from config import COLORS, EMOJIS, get_server_config, is_module_enabled, get_ai_api_key
+from config import COLORS, EMOJIS, get_ai_api_key
 from utils.helpers import create_embed
-from replit import db
+from utils import async_database as adb
+from utils import database
+from utils.conversation_store import ConversationStore
 
 logger = logging.getLogger(__name__)
 
@@ -22,8 +25,27 @@ class AIChatbotCog(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
         self.client = None
-        self.conversation_history = {}  # Store conversation history per user
+        self.conversations = self.create_conversation_store()
+        atexit.register(self.conversations.stop)
         self.initialize_ai()
+
+    @staticmethod
+    def create_conversation_store() -> ConversationStore:
+        """Create the conversation store, persisted write-behind unless disabled."""
+        persist = os.getenv("CONVERSATION_PERSIST", "true").lower() in ("1", "true", "yes")
+        return ConversationStore(
+            max_bytes=int(float(os.getenv("CONVERSATION_MEMORY_MB", 64)) * 1024 * 1024),
+            idle_ttl=float(os.getenv("CONVERSATION_IDLE_TTL", 3600)),
+            max_messages=20,  # Keep only last 20 messages to avoid token limits
+            loader=(lambda guild_id, user_id: database.get_conversation_history(user_id, guild_id)) if persist else None,
+            writer=(lambda guild_id, user_id, history: database.update_conversation_history(user_id, guild_id, history)) if persist else None,
+            deleter=(lambda guild_id, user_id: database.clear_conversation_history(user_id, guild_id)) if persist else None,
+            flush_interval=float(os.getenv("CONVERSATION_FLUSH_INTERVAL", 30))
+        )
+
+    async def cog_unload(self):
+        """Write pending conversations when the cog is unloaded."""
+        await adb.run_blocking(self.conversations.stop)
         
     def initialize_ai(self):
         """Initialize the AI client."""
@@ -37,32 +59,26 @@ class AIChatbotCog(commands.Cog):
         except Exception as e:
             logger.error(f"❌ Failed to initialize AI client: {e}")
             
-    def get_conversation_history(self, user_id: int, guild_id: int) -> list:
+    async def get_conversation_history(self, user_id: int, guild_id: int) -> list:
         """Get conversation history for a user in a guild."""
-        key = f"{guild_id}_{user_id}"
-        return self.conversation_history.get(key, [])
+        history = self.conversations.get_cached(guild_id, user_id)
+        if history is None:
+            # Not in memory: load the stored conversation off the event loop
+            history = await adb.run_blocking(self.conversations.get, guild_id, user_id)
+        return history
         
-    def add_to_conversation_history(self, user_id: int, guild_id: int, role: str, content: str):
+    async def add_to_conversation_history(self, user_id: int, guild_id: int, role: str, content: str):
         """Add message to conversation history."""
-        key = f"{guild_id}_{user_id}"
-        if key not in self.conversation_history:
-            self.conversation_history[key] = []
-            
-        self.conversation_history[key].append({
+        # Off the event loop: a conversation evicted since it was read is loaded first
+        await adb.run_blocking(self.conversations.append, guild_id, user_id, {
             'role': role,
             'content': content,
             'timestamp': datetime.now().isoformat()
         })
-        
-        # Keep only last 20 messages to avoid token limits
-        if len(self.conversation_history[key]) > 20:
-            self.conversation_history[key] = self.conversation_history[key][-20:]
             
-    def clear_conversation_history(self, user_id: int, guild_id: int):
+    async def clear_conversation_history(self, user_id: int, guild_id: int):
         """Clear conversation history for a user."""
-        key = f"{guild_id}_{user_id}"
-        if key in self.conversation_history:
-            del self.conversation_history[key]
+        await adb.run_blocking(self.conversations.clear, guild_id, user_id)
             
     async def generate_response(self, user_message: str, user_id: int, guild_id: int, user_name: str) -> str:
         """Generate AI response."""
@@ -71,7 +87,7 @@ class AIChatbotCog(commands.Cog):
             
         try:
             # Get conversation history
-            history = self.get_conversation_history(user_id, guild_id)
+            history = await self.get_conversation_history(user_id, guild_id)
             
             # Build system prompt
             system_prompt = (
@@ -93,8 +109,8 @@ class AIChatbotCog(commands.Cog):
             # Create the prompt
             full_prompt = f"{system_prompt}\n\nConversation history:\n" + "\n".join(conversation_parts)
             
-            # Generate response
-            response = self.client.models.generate_content(
+            # Generate response without blocking the event loop
+            response = await self.client.aio.models.generate_content(
                 model="gemini-2.5-flash",
                 contents=full_prompt,
                 config=types.GenerateContentConfig(
@@ -105,8 +121,8 @@ class AIChatbotCog(commands.Cog):
             
             if response.text:
                 # Add to conversation history
-                self.add_to_conversation_history(user_id, guild_id, "user", user_message)
-                self.add_to_conversation_history(user_id, guild_id, "assistant", response.text)
+                await self.add_to_conversation_history(user_id, guild_id, "user", user_message)
+                await self.add_to_conversation_history(user_id, guild_id, "assistant", response.text)
                 
                 return response.text
             else:
@@ -133,11 +149,11 @@ class AIChatbotCog(commands.Cog):
             return
             
         # Check if AI is enabled
-        if not is_module_enabled("ai_chatbot", message.guild.id):
+        if not await adb.is_module_enabled("ai_chatbot", message.guild.id):
             return
             
         # Check if in allowed channels
-        config = get_server_config(message.guild.id)
+        config = await adb.get_server_config(message.guild.id)
         ai_channels = config.get('ai_channels', [])
         
         if ai_channels and message.channel.id not in ai_channels:
@@ -172,11 +188,11 @@ class AIChatbotCog(commands.Cog):
     @commands.command(name='chat', help='Chat with AI')
     async def chat_command(self, ctx, *, message: str):
         """Direct chat command."""
-        if not is_module_enabled("ai_chatbot", ctx.guild.id):
+        if not await adb.is_module_enabled("ai_chatbot", ctx.guild.id):
             return
             
         # Check if in allowed channels
-        config = get_server_config(ctx.guild.id)
+        config = await adb.get_server_config(ctx.guild.id)
         ai_channels = config.get('ai_channels', [])
         
         if ai_channels and ctx.channel.id not in ai_channels:
@@ -197,12 +213,12 @@ class AIChatbotCog(commands.Cog):
     @app_commands.describe(message="Your message to the AI")
     async def chat_slash(self, interaction: discord.Interaction, message: str):
         """Chat with AI (slash command)."""
-        if not is_module_enabled("ai_chatbot", interaction.guild.id):
+        if not await adb.is_module_enabled("ai_chatbot", interaction.guild.id):
             await interaction.response.send_message("❌ AI chatbot module is disabled!", ephemeral=True)
             return
             
         # Check if in allowed channels
-        config = get_server_config(interaction.guild.id)
+        config = await adb.get_server_config(interaction.guild.id)
         ai_channels = config.get('ai_channels', [])
         
         if ai_channels and interaction.channel.id not in ai_channels:
@@ -223,10 +239,10 @@ class AIChatbotCog(commands.Cog):
     @commands.command(name='clear_chat', help='Clear your chat history')
     async def clear_chat_command(self, ctx):
         """Clear user's chat history."""
-        if not is_module_enabled("ai_chatbot", ctx.guild.id):
+        if not await adb.is_module_enabled("ai_chatbot", ctx.guild.id):
             return
             
-        self.clear_conversation_history(ctx.author.id, ctx.guild.id)
+        await self.clear_conversation_history(ctx.author.id, ctx.guild.id)
         
         embed = create_embed(
             "✅ Chat History Cleared",
@@ -238,11 +254,11 @@ class AIChatbotCog(commands.Cog):
     @app_commands.command(name="clear_chat", description="Clear your chat history")
     async def clear_chat_slash(self, interaction: discord.Interaction):
         """Clear user's chat history (slash command)."""
-        if not is_module_enabled("ai_chatbot", interaction.guild.id):
+        if not await adb.is_module_enabled("ai_chatbot", interaction.guild.id):
             await interaction.response.send_message("❌ AI chatbot module is disabled!", ephemeral=True)
             return
             
-        self.clear_conversation_history(interaction.user.id, interaction.guild.id)
+        await self.clear_conversation_history(interaction.user.id, interaction.guild.id)
         
         embed = create_embed(
             "✅ Chat History Cleared",
@@ -254,7 +270,7 @@ class AIChatbotCog(commands.Cog):
     @commands.command(name='ai_status', help='Check AI system status')
     async def ai_status_command(self, ctx):
         """Check AI system status."""
-        if not is_module_enabled("ai_chatbot", ctx.guild.id):
+        if not await adb.is_module_enabled("ai_chatbot", ctx.guild.id):
             return
             
         embed = discord.Embed(
@@ -277,7 +293,7 @@ class AIChatbotCog(commands.Cog):
             )
             
         # Check configuration
-        config = get_server_config(ctx.guild.id)
+        config = await adb.get_server_config(ctx.guild.id)
         ai_channels = config.get('ai_channels', [])
         
         if ai_channels:
@@ -295,7 +311,7 @@ class AIChatbotCog(commands.Cog):
             )
             
         # Conversation stats
-        user_history = self.get_conversation_history(ctx.author.id, ctx.guild.id)
+        user_history = await self.get_conversation_history(ctx.author.id, ctx.guild.id)
         embed.add_field(
             name="💬 Your Chat History",
             value=f"{len(user_history)} messages",
@@ -307,7 +323,7 @@ class AIChatbotCog(commands.Cog):
     @app_commands.command(name="ai_status", description="Check AI system status")
     async def ai_status_slash(self, interaction: discord.Interaction):
         """Check AI system status (slash command)."""
-        if not is_module_enabled("ai_chatbot", interaction.guild.id):
+        if not await adb.is_module_enabled("ai_chatbot", interaction.guild.id):
             await interaction.response.send_message("❌ AI chatbot module is disabled!", ephemeral=True)
             return
             
@@ -331,7 +347,7 @@ class AIChatbotCog(commands.Cog):
             )
             
         # Check configuration
-        config = get_server_config(interaction.guild.id)
+        config = await adb.get_server_config(interaction.guild.id)
         ai_channels = config.get('ai_channels', [])
         
         if ai_channels:
@@ -349,7 +365,7 @@ class AIChatbotCog(commands.Cog):
             )
             
         # Conversation stats
-        user_history = self.get_conversation_history(interaction.user.id, interaction.guild.id)
+        user_history = await self.get_conversation_history(interaction.user.id, interaction.guild.id)
         embed.add_field(
             name="💬 Your Chat History",
             value=f"{len(user_history)} messages",
@@ -3,18 +3,31 @@ from discord.ext import commands
 from discord import app_commands
 import random
 from datetime import datetime, timedelta
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Tuple
 import logging
 
-from config import COLORS, EMOJIS, get_server_config, is_module_enabled, user_has_permission
+from config import COLORS, EMOJIS, user_has_permission
 from utils.helpers import create_embed, format_number, get_random_work_job, format_time_remaining, get_time_until_next_use
-from utils.database import get_user_rpg_data, update_user_rpg_data, ensure_user_exists
+from utils import async_database as adb
 from utils.constants import RPG_CONSTANTS, SHOP_ITEMS, DAILY_REWARDS
-from utils.rng_system import generate_loot_with_luck
-from replit import db
+from utils.rng_system import generate_loot_with_luck, LuckContext
 
 logger = logging.getLogger(__name__)
 
+def claim_daily_reward(player_data: Dict[str, Any]) -> Tuple[int, int]:
+    """Apply the daily reward to a profile and return (coins, xp) granted."""
+    base_reward = DAILY_REWARDS['base']
+    level_bonus = player_data.get('level', 1) * DAILY_REWARDS['level_multiplier']
+    streak_bonus = min(player_data.get('daily_streak', 0), DAILY_REWARDS['max_streak']) * DAILY_REWARDS['streak_bonus']
+
+    total_coins = base_reward + level_bonus + streak_bonus
+    total_xp = int(total_coins * 0.5)  # XP is half of coins
+
+    player_data['coins'] = player_data.get('coins', 0) + total_coins
+    player_data['xp'] = player_data.get('xp', 0) + total_xp
+    player_data['daily_streak'] = player_data.get('daily_streak', 0) + 1
+    return total_coins, total_xp
+
 class ShopView(discord.ui.View):
     """Interactive shop view."""
 
@@ -80,41 +93,40 @@ class EconomyCog(commands.Cog):
     @app_commands.command(name="work", description="Work to earn coins")
     async def work_slash(self, interaction: discord.Interaction):
         """Work to earn coins (slash command)."""
-        if not is_module_enabled("economy", interaction.guild.id):
+        if not await adb.is_module_enabled("economy", interaction.guild.id):
             await interaction.response.send_message("❌ Economy module is disabled!", ephemeral=True)
             return
 
         user_id = str(interaction.user.id)
 
-        if not ensure_user_exists(user_id):
+        if not await adb.ensure_user_exists(user_id):
             await interaction.response.send_message("❌ You need to start your adventure first!", ephemeral=True)
             return
 
-        player_data = get_user_rpg_data(user_id)
-        if not player_data:
-            await interaction.response.send_message("❌ Could not retrieve your data. Please try again.", ephemeral=True)
-            return
-
         # Get random job
         job = get_random_work_job()
         base_coins = random.randint(job["min_coins"], job["max_coins"])
         base_xp = random.randint(job["min_xp"], job["max_xp"])
 
-        # Apply luck bonuses
-        enhanced_loot = generate_loot_with_luck(user_id, {
-            'coins': base_coins,
-            'xp': base_xp
-        })
+        def pay_wages(player_data):
+            # Apply luck bonuses, resolved from the profile being updated
+            enhanced_loot = generate_loot_with_luck(user_id, {
+                'coins': base_coins,
+                'xp': base_xp
+            }, luck=LuckContext.from_player_data(player_data))
 
-        coins_earned = enhanced_loot['coins']
-        xp_earned = enhanced_loot['xp']
+            player_data['coins'] = player_data.get('coins', 0) + enhanced_loot['coins']
+            player_data['xp'] = player_data.get('xp', 0) + enhanced_loot['xp']
+            player_data['work_count'] = player_data.get('work_count', 0) + 1
+            return enhanced_loot
 
-        # Update player data
-        player_data['coins'] = player_data.get('coins', 0) + coins_earned
-        player_data['xp'] = player_data.get('xp', 0) + xp_earned
-        player_data['work_count'] = player_data.get('work_count', 0) + 1
+        result = await adb.mutate_user_rpg_data(user_id, pay_wages)
+        if result is None:
+            await interaction.response.send_message("❌ Could not retrieve your data. Please try again.", ephemeral=True)
+            return
 
-        update_user_rpg_data(user_id, player_data)
+        coins_earned = result[1]['coins']
+        xp_earned = result[1]['xp']
 
         embed = create_embed(
             f"💼 Work Complete - {job['name']}",
@@ -128,34 +140,21 @@ class EconomyCog(commands.Cog):
     @commands.cooldown(1, RPG_CONSTANTS['daily_cooldown'], commands.BucketType.user)
     async def daily_command(self, ctx):
         """Claim daily reward."""
-        if not is_module_enabled("economy", ctx.guild.id):
+        if not await adb.is_module_enabled("economy", ctx.guild.id):
             return
 
         user_id = str(ctx.author.id)
 
-        if not ensure_user_exists(user_id):
+        if not await adb.ensure_user_exists(user_id):
             await ctx.send("❌ You need to start your adventure first!")
             return
 
-        player_data = get_user_rpg_data(user_id)
-        if not player_data:
+        result = await adb.mutate_user_rpg_data(user_id, claim_daily_reward)
+        if result is None:
             await ctx.send("❌ Could not retrieve your data. Please try again.")
             return
 
-        # Calculate daily reward
-        base_reward = DAILY_REWARDS['base']
-        level_bonus = player_data.get('level', 1) * DAILY_REWARDS['level_multiplier']
-        streak_bonus = min(player_data.get('daily_streak', 0), DAILY_REWARDS['max_streak']) * DAILY_REWARDS['streak_bonus']
-
-        total_coins = base_reward + level_bonus + streak_bonus
-        total_xp = int(total_coins * 0.5)  # XP is half of coins
-
-        # Update player data
-        player_data['coins'] = player_data.get('coins', 0) + total_coins
-        player_data['xp'] = player_data.get('xp', 0) + total_xp
-        player_data['daily_streak'] = player_data.get('daily_streak', 0) + 1
-
-        update_user_rpg_data(user_id, player_data)
+        player_data, (total_coins, total_xp) = result
 
         embed = create_embed(
             "🎁 Daily Reward Claimed!",
@@ -170,35 +169,22 @@ class EconomyCog(commands.Cog):
     @app_commands.command(name="daily", description="Claim your daily reward")
     async def daily_slash(self, interaction: discord.Interaction):
         """Claim daily reward (slash command)."""
-        if not is_module_enabled("economy", interaction.guild.id):
+        if not await adb.is_module_enabled("economy", interaction.guild.id):
             await interaction.response.send_message("❌ Economy module is disabled!", ephemeral=True)
             return
 
         user_id = str(interaction.user.id)
 
-        if not ensure_user_exists(user_id):
+        if not await adb.ensure_user_exists(user_id):
             await interaction.response.send_message("❌ You need to start your adventure first!", ephemeral=True)
             return
 
-        player_data = get_user_rpg_data(user_id)
-        if not player_data:
+        result = await adb.mutate_user_rpg_data(user_id, claim_daily_reward)
+        if result is None:
             await interaction.response.send_message("❌ Could not retrieve your data. Please try again.", ephemeral=True)
             return
 
-        # Calculate daily reward
-        base_reward = DAILY_REWARDS['base']
-        level_bonus = player_data.get('level', 1) * DAILY_REWARDS['level_multiplier']
-        streak_bonus = min(player_data.get('daily_streak', 0), DAILY_REWARDS['max_streak']) * DAILY_REWARDS['streak_bonus']
-
-        total_coins = base_reward + level_bonus + streak_bonus
-        total_xp = int(total_coins * 0.5)  # XP is half of coins
-
-        # Update player data
-        player_data['coins'] = player_data.get('coins', 0) + total_coins
-        player_data['xp'] = player_data.get('xp', 0) + total_xp
-        player_data['daily_streak'] = player_data.get('daily_streak', 0) + 1
-
-        update_user_rpg_data(user_id, player_data)
+        player_data, (total_coins, total_xp) = result
 
         embed = create_embed(
             "🎁 Daily Reward Claimed!",
@@ -213,7 +199,7 @@ class EconomyCog(commands.Cog):
     @commands.command(name='shop', help='Browse the item shop')
     async def shop_command(self, ctx):
         """Browse the item shop."""
-        if not is_module_enabled("economy", ctx.guild.id):
+        if not await adb.is_module_enabled("economy", ctx.guild.id):
             return
 
         user_id = str(ctx.author.id)
@@ -225,7 +211,7 @@ class EconomyCog(commands.Cog):
     @app_commands.command(name="shop", description="Browse the item shop")
     async def shop_slash(self, interaction: discord.Interaction):
         """Browse the item shop (slash command)."""
-        if not is_module_enabled("economy", interaction.guild.id):
+        if not await adb.is_module_enabled("economy", interaction.guild.id):
             await interaction.response.send_message("❌ Economy module is disabled!", ephemeral=True)
             return
 
@@ -238,17 +224,17 @@ class EconomyCog(commands.Cog):
     @commands.command(name='balance', help='Check your coin balance')
     async def balance_command(self, ctx, member: Optional[discord.Member] = None):
         """Check coin balance."""
-        if not is_module_enabled("economy", ctx.guild.id):
+        if not await adb.is_module_enabled("economy", ctx.guild.id):
             return
 
         target = member or ctx.author
         user_id = str(target.id)
 
-        if not ensure_user_exists(user_id):
+        if not await adb.ensure_user_exists(user_id):
             await ctx.send(f"❌ {target.display_name} hasn't started their adventure yet!")
             return
 
-        player_data = get_user_rpg_data(user_id)
+        player_data = await adb.get_user_rpg_data(user_id)
         if not player_data:
             await ctx.send("❌ Could not retrieve data.")
             return
@@ -270,18 +256,18 @@ class EconomyCog(commands.Cog):
     @app_commands.describe(member="User to check balance for (optional)")
     async def balance_slash(self, interaction: discord.Interaction, member: Optional[discord.Member] = None):
         """Check coin balance (slash command)."""
-        if not is_module_enabled("economy", interaction.guild.id):
+        if not await adb.is_module_enabled("economy", interaction.guild.id):
             await interaction.response.send_message("❌ Economy module is disabled!", ephemeral=True)
             return
 
         target = member or interaction.user
         user_id = str(target.id)
 
-        if not ensure_user_exists(user_id):
+        if not await adb.ensure_user_exists(user_id):
             await interaction.response.send_message(f"❌ {target.display_name} hasn't started their adventure yet!", ephemeral=True)
             return
 
-        player_data = get_user_rpg_data(user_id)
+        player_data = await adb.get_user_rpg_data(user_id)
         if not player_data:
             await interaction.response.send_message("❌ Could not retrieve data.", ephemeral=True)
             return
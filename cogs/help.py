@@ -99,7 +99,8 @@ class HelpView(discord.ui.View):
                 name="⚔️ Combat Features",
                 value="**`$pvp <user>`** - Challenge players (Level 5+)\n"
                       "**`$battle`** - Fight AI monsters\n"
-                      "**`$heal`** - Restore HP for 50 coins\n\n"
+                      "**`$heal`** - Restore HP for 50 coins\n"
+                      "**`$leaderboard [category] [global]`** - Top players and your rank\n\n"
                       "**PvP Unlocks:**\n"
                       "🔓 Level 5: Basic PvP\n"
                       "🔓 Level 15: Advanced arenas\n"
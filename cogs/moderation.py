@@ -7,10 +7,9 @@ import re
 import logging
 from typing import Optional, Dict, List, Any
 
-from config import COLORS, EMOJIS, user_has_permission, is_module_enabled, get_server_config, update_server_config
+from config import COLORS, EMOJIS, user_has_permission
 from utils.helpers import create_embed, format_duration
-from utils.database import get_user_data, update_user_data
-from replit import db
+from utils import async_database as adb
 
 logger = logging.getLogger(__name__)
 
@@ -48,44 +47,17 @@ class ModerationCog(commands.Cog):
             
         return True
         
-    def add_warning(self, user_id: int, guild_id: int, reason: str, moderator_id: int) -> int:
+    async def add_warning(self, user_id: int, guild_id: int, reason: str, moderator_id: int) -> int:
         """Add a warning to user."""
-        try:
-            warnings_key = f"warnings_{guild_id}_{user_id}"
-            warnings = db.get(warnings_key, [])
-            
-            warning = {
-                'reason': reason,
-                'moderator_id': moderator_id,
-                'timestamp': datetime.now().isoformat()
-            }
-            
-            warnings.append(warning)
-            db[warnings_key] = warnings
+        return await adb.add_user_warning(user_id, guild_id, reason, moderator_id)
             
-            return len(warnings)
-        except Exception as e:
-            logger.error(f"Error adding warning: {e}")
-            return 0
-            
-    def get_user_warnings(self, user_id: int, guild_id: int) -> List[Dict[str, Any]]:
+    async def get_user_warnings(self, user_id: int, guild_id: int) -> List[Dict[str, Any]]:
         """Get user warnings."""
-        try:
-            warnings_key = f"warnings_{guild_id}_{user_id}"
-            return db.get(warnings_key, [])
-        except Exception as e:
-            logger.error(f"Error getting warnings: {e}")
-            return []
+        return await adb.get_user_warnings(user_id, guild_id)
             
-    def clear_user_warnings(self, user_id: int, guild_id: int) -> bool:
+    async def clear_user_warnings(self, user_id: int, guild_id: int) -> bool:
         """Clear user warnings."""
-        try:
-            warnings_key = f"warnings_{guild_id}_{user_id}"
-            db[warnings_key] = []
-            return True
-        except Exception as e:
-            logger.error(f"Error clearing warnings: {e}")
-            return False
+        return await adb.clear_user_warnings(user_id, guild_id)
             
     def is_spam(self, message: discord.Message) -> bool:
         """Check if message is spam."""
@@ -138,7 +110,7 @@ class ModerationCog(commands.Cog):
             return
             
         # Check if auto-moderation is enabled
-        config = get_server_config(message.guild.id)
+        config = await adb.get_server_config(message.guild.id)
         if not config.get('auto_moderation', {}).get('enabled', False):
             return
             
@@ -155,7 +127,7 @@ class ModerationCog(commands.Cog):
                 actions_taken.append("deleted spam message")
                 
                 # Add warning
-                warning_count = self.add_warning(
+                warning_count = await self.add_warning(
                     message.author.id, 
                     message.guild.id, 
                     "Automatic spam detection", 
@@ -180,7 +152,7 @@ class ModerationCog(commands.Cog):
                 actions_taken.append("deleted inappropriate content")
                 
                 # Add warning
-                warning_count = self.add_warning(
+                warning_count = await self.add_warning(
                     message.author.id, 
                     message.guild.id, 
                     "Inappropriate content", 
@@ -223,7 +195,7 @@ class ModerationCog(commands.Cog):
     @commands.bot_has_permissions(kick_members=True)
     async def kick_command(self, ctx, member: discord.Member, *, reason="No reason provided"):
         """Kick a member from the server."""
-        if not is_module_enabled("moderation", ctx.guild.id):
+        if not await adb.is_module_enabled("moderation", ctx.guild.id):
             return
             
         if not self.can_moderate(ctx.author, member):
@@ -255,7 +227,7 @@ class ModerationCog(commands.Cog):
     @commands.bot_has_permissions(ban_members=True)
     async def ban_command(self, ctx, member: discord.Member, *, reason="No reason provided"):
         """Ban a member from the server."""
-        if not is_module_enabled("moderation", ctx.guild.id):
+        if not await adb.is_module_enabled("moderation", ctx.guild.id):
             return
             
         if not self.can_moderate(ctx.author, member):
@@ -286,7 +258,7 @@ class ModerationCog(commands.Cog):
     @commands.has_permissions(kick_members=True)
     async def warn_command(self, ctx, member: discord.Member, *, reason="No reason provided"):
         """Warn a member."""
-        if not is_module_enabled("moderation", ctx.guild.id):
+        if not await adb.is_module_enabled("moderation", ctx.guild.id):
             return
             
         if not self.can_moderate(ctx.author, member):
@@ -294,7 +266,7 @@ class ModerationCog(commands.Cog):
             return
             
         try:
-            warning_count = self.add_warning(member.id, ctx.guild.id, reason, ctx.author.id)
+            warning_count = await self.add_warning(member.id, ctx.guild.id, reason, ctx.author.id)
             
             embed = create_embed(
                 "⚠️ Member Warned",
@@ -316,13 +288,13 @@ class ModerationCog(commands.Cog):
     @commands.has_permissions(kick_members=True)
     async def warnings_command(self, ctx, member: discord.Member = None):
         """View user warnings."""
-        if not is_module_enabled("moderation", ctx.guild.id):
+        if not await adb.is_module_enabled("moderation", ctx.guild.id):
             return
             
         if not member:
             member = ctx.author
             
-        warnings = self.get_user_warnings(member.id, ctx.guild.id)
+        warnings = await self.get_user_warnings(member.id, ctx.guild.id)
         
         if not warnings:
             await ctx.send(f"No warnings found for {member.mention}")
@@ -349,7 +321,7 @@ class ModerationCog(commands.Cog):
     @commands.bot_has_permissions(manage_messages=True)
     async def purge_command(self, ctx, amount: int):
         """Delete multiple messages."""
-        if not is_module_enabled("moderation", ctx.guild.id):
+        if not await adb.is_module_enabled("moderation", ctx.guild.id):
             return
             
         if amount < 1 or amount > 100:
@@ -387,7 +359,7 @@ class ModerationCog(commands.Cog):
             await interaction.response.send_message("❌ You need moderator permissions!", ephemeral=True)
             return
             
-        if not is_module_enabled("moderation", interaction.guild.id):
+        if not await adb.is_module_enabled("moderation", interaction.guild.id):
             await interaction.response.send_message("❌ Moderation module is disabled!", ephemeral=True)
             return
             
@@ -423,7 +395,7 @@ class ModerationCog(commands.Cog):
             await interaction.response.send_message("❌ You need moderator permissions!", ephemeral=True)
             return
             
-        if not is_module_enabled("moderation", interaction.guild.id):
+        if not await adb.is_module_enabled("moderation", interaction.guild.id):
             await interaction.response.send_message("❌ Moderation module is disabled!", ephemeral=True)
             return
             
@@ -459,7 +431,7 @@ class ModerationCog(commands.Cog):
             await interaction.response.send_message("❌ You need moderator permissions!", ephemeral=True)
             return
             
-        if not is_module_enabled("moderation", interaction.guild.id):
+        if not await adb.is_module_enabled("moderation", interaction.guild.id):
             await interaction.response.send_message("❌ Moderation module is disabled!", ephemeral=True)
             return
             
@@ -468,7 +440,7 @@ class ModerationCog(commands.Cog):
             return
             
         try:
-            warning_count = self.add_warning(member.id, interaction.guild.id, reason, interaction.user.id)
+            warning_count = await self.add_warning(member.id, interaction.guild.id, reason, interaction.user.id)
             
             embed = create_embed(
                 "⚠️ Member Warned",
@@ -494,14 +466,14 @@ class ModerationCog(commands.Cog):
             await interaction.response.send_message("❌ You need moderator permissions!", ephemeral=True)
             return
             
-        if not is_module_enabled("moderation", interaction.guild.id):
+        if not await adb.is_module_enabled("moderation", interaction.guild.id):
             await interaction.response.send_message("❌ Moderation module is disabled!", ephemeral=True)
             return
             
         if not member:
             member = interaction.user
             
-        warnings = self.get_user_warnings(member.id, interaction.guild.id)
+        warnings = await self.get_user_warnings(member.id, interaction.guild.id)
         
         if not warnings:
             await interaction.response.send_message(f"No warnings found for {member.mention}", ephemeral=True)
@@ -531,7 +503,7 @@ class ModerationCog(commands.Cog):
             await interaction.response.send_message("❌ You need moderator permissions!", ephemeral=True)
             return
             
-        if not is_module_enabled("moderation", interaction.guild.id):
+        if not await adb.is_module_enabled("moderation", interaction.guild.id):
             await interaction.response.send_message("❌ Moderation module is disabled!", ephemeral=True)
             return
             
@@ -567,7 +539,7 @@ class ModerationCog(commands.Cog):
             await interaction.response.send_message("❌ You need moderator permissions!", ephemeral=True)
             return
             
-        if not is_module_enabled("moderation", interaction.guild.id):
+        if not await adb.is_module_enabled("moderation", interaction.guild.id):
             await interaction.response.send_message("❌ Moderation module is disabled!", ephemeral=True)
             return
             
@@ -604,7 +576,7 @@ class ModerationCog(commands.Cog):
     async def log_moderation_action(self, guild: discord.Guild, action: str, target: Optional[discord.Member], moderator: discord.Member, reason: str):
         """Log moderation action to mod log channel."""
         try:
-            config = get_server_config(guild.id)
+            config = await adb.get_server_config(guild.id)
             log_channel_id = config.get('mod_log_channel')
             
             if not log_channel_id:
@@ -3,16 +3,18 @@ from discord.ext import commands
 from discord import app_commands
 import random
 import asyncio
+from collections import Counter
 from datetime import datetime, timedelta
 from typing import Optional, Dict, Any, List
 import logging
 
-from config import COLORS, EMOJIS, get_server_config, is_module_enabled
-from utils.helpers import create_embed, format_number, create_progress_bar
-from utils.database import get_user_rpg_data, update_user_rpg_data, ensure_user_exists, create_user_profile, get_leaderboard
-from utils.constants import RPG_CONSTANTS, WEAPONS, ARMOR, RARITY_COLORS, RARITY_WEIGHTS, PVP_ARENAS, OMNIPOTENT_ITEM
-from utils.rng_system import roll_with_luck, check_rare_event, get_luck_status, generate_loot_with_luck, weighted_random_choice
-from replit import db
+from config import COLORS, EMOJIS
+from utils.helpers import create_embed, format_number, create_progress_bar, create_leaderboard_display
+from utils import async_database as adb
+from utils.constants import RPG_CONSTANTS, RARITY_COLORS, RARITY_WEIGHTS, PVP_ARENAS
+from utils.catalog import catalog
+from utils.rng_system import roll_with_luck, check_rare_event, get_luck_status, generate_loot_with_luck, weighted_random_choice, rarity_sampler, LuckContext, SessionRNG, start_session
+from utils.inventory import get_inventory, add_item, add_items, remove_item, format_item, total_items, MAX_SLOTS
 
 logger = logging.getLogger(__name__)
 
@@ -119,7 +121,7 @@ def level_up_player(player_data):
     player_data['max_xp'] = xp_needed
     return None
 
-def get_random_adventure_outcome():
+def get_random_adventure_outcome(rng=random):
     """Get a random adventure outcome."""
     outcomes = [
         {
@@ -147,15 +149,50 @@ def get_random_adventure_outcome():
             'items': ['Health Potion', 'Lucky Charm', 'Iron Sword']
         }
     ]
-    return random.choice(outcomes)
+    return rng.choice(outcomes)
 
-def calculate_battle_damage(attack, defense):
+def calculate_battle_damage(attack, defense, rng=random):
     """Calculate battle damage."""
     base_damage = max(1, attack - defense)
     # Add some randomness
-    damage = random.randint(int(base_damage * 0.8), int(base_damage * 1.2))
+    damage = rng.randint(int(base_damage * 0.8), int(base_damage * 1.2))
     return max(1, damage)
 
+def resolve_battle_turn(action: str, player: Dict[str, int], enemy: Dict[str, Any], rng=random) -> Dict[str, Any]:
+    """Resolve one turn of a battle against an enemy.
+
+    player holds hp/attack/defense and enemy hp/attack/name as of the start
+    of the turn. Returns the turn text, both new HP values and, on victory,
+    the coin and XP rewards.
+    """
+    player_hp = player['hp']
+    enemy_hp = enemy['hp']
+    battle_result = ""
+
+    if action == "attack":
+        # Player attacks
+        damage = calculate_battle_damage(player['attack'], 0, rng)
+        enemy_hp -= damage
+        battle_result += f"You dealt {damage} damage to {enemy['name']}!\n"
+
+        # Enemy attacks back if still alive
+        if enemy_hp > 0:
+            enemy_damage = calculate_battle_damage(enemy['attack'], player['defense'], rng)
+            player_hp -= enemy_damage
+            battle_result += f"{enemy['name']} dealt {enemy_damage} damage to you!\n"
+
+    elif action == "defend":
+        # Reduced damage when defending
+        enemy_damage = calculate_battle_damage(enemy['attack'], player['defense'] * 2, rng)
+        player_hp -= enemy_damage
+        battle_result += f"You defended! {enemy['name']} dealt {enemy_damage} damage!\n"
+
+    turn = {'battle_result': battle_result, 'player_hp': player_hp, 'enemy_hp': enemy_hp}
+    if enemy_hp <= 0:
+        turn['coins_reward'] = rng.randint(50, 150)
+        turn['xp_reward'] = rng.randint(20, 50)
+    return turn
+
 class ProfileView(discord.ui.View):
     """Interactive profile view."""
 
@@ -192,7 +229,8 @@ class ProfileView(discord.ui.View):
             await interaction.response.send_message("This is not your profile!", ephemeral=True)
             return
 
-        embed = self.create_luck_embed()
+        luck_status = get_luck_status(str(self.user.id), LuckContext.from_player_data(self.player_data))
+        embed = self.create_luck_embed(luck_status)
         await interaction.response.edit_message(embed=embed, view=self)
 
     def create_stats_embed(self) -> discord.Embed:
@@ -258,7 +296,7 @@ class ProfileView(discord.ui.View):
 
     def create_inventory_embed(self) -> discord.Embed:
         """Create inventory embed."""
-        inventory = self.player_data.get('inventory', [])
+        inventory = get_inventory(self.player_data)
         equipped = self.player_data.get('equipped', {})
 
         embed = discord.Embed(
@@ -282,24 +320,23 @@ class ProfileView(discord.ui.View):
         # Inventory items
         if inventory:
             items_text = ""
-            for item in inventory[:10]:  # Show first 10 items
-                items_text += f"• {item}\n"
+            for item, quantity in list(inventory.items())[:10]:  # Show first 10 stacks
+                items_text += f"• {format_item(item, quantity)}\n"
             if len(inventory) > 10:
                 items_text += f"... and {len(inventory) - 10} more items"
         else:
             items_text = "Your inventory is empty!"
 
         embed.add_field(
-            name="📦 Items",
+            name=f"📦 Items ({len(inventory)}/{MAX_SLOTS} slots, {total_items(inventory)} total)",
             value=items_text,
             inline=False
         )
 
         return embed
 
-    def create_luck_embed(self) -> discord.Embed:
+    def create_luck_embed(self, luck_status: Dict[str, Any]) -> discord.Embed:
         """Create luck embed."""
-        luck_status = get_luck_status(str(self.user.id))
 
         embed = discord.Embed(
             title=f"🍀 {self.user.display_name}'s Luck",
@@ -316,33 +353,145 @@ class ProfileView(discord.ui.View):
 
         return embed
 
-def generate_random_item():
+# Random item drop pools per item type and rarity; rarities without items fall back to common
+LOOT_POOLS = {
+    source: {
+        rarity: catalog.find(source=source, rarity=rarity) or catalog.find(source=source, rarity="common")
+        for rarity in RARITY_WEIGHTS
+    }
+    for source in ("weapons", "armor")
+}
+
+def generate_random_item(rng=random):
     """Generate a random item with rarity."""
     # Choose item type
-    item_type = random.choice(["weapon", "armor"])
-
-    # Choose rarity based on weights
-    rarity_list = []
-    for rarity, weight in RARITY_WEIGHTS.items():
-        rarity_list.extend([rarity] * int(weight * 100))
-
-    chosen_rarity = random.choice(rarity_list)
-
-    # Get items of chosen rarity
-    if item_type == "weapon":
-        items = {k: v for k, v in WEAPONS.items() if v["rarity"] == chosen_rarity}
-    else:
-        items = {k: v for k, v in ARMOR.items() if v["rarity"] == chosen_rarity}
-
-    if not items:
-        # Fallback to common items
-        if item_type == "weapon":
-            items = {k: v for k, v in WEAPONS.items() if v["rarity"] == "common"}
-        else:
-            items = {k: v for k, v in ARMOR.items() if v["rarity"] == "common"}
-
-    item_name = random.choice(list(items.keys()))
-    return item_name, items[item_name]
+    item_type = rng.choice(["weapon", "armor"])
+
+    # Choose rarity based on weights, then an item from its pool
+    chosen_rarity = rarity_sampler.sample(rng)
+    source = "weapons" if item_type == "weapon" else "armor"
+    item = rng.choice(LOOT_POOLS[source][chosen_rarity])
+    return item.name, item.data
+
+def roll_lootboxes(count: int, luck: LuckContext, rng=random) -> tuple[int, List[str]]:
+    """Roll the loot of count lootboxes in one pass; returns (coins, items found).
+
+    Each box gives 100-1000 coins, three 40% item rolls and a 0.1% roll for
+    an omnipotent item, all scaled by luck.
+    """
+    coins = sum(rng.randint(100, 1000) for _ in range(count))
+
+    item_chance = max(0.0, min(1.0, 0.4 * luck.multiplier))
+    item_hits = sum(rng.random() < item_chance for _ in range(3 * count))
+    rewards = [generate_random_item(rng)[0] for _ in range(item_hits)]
+
+    omnipotent_chance = max(0.0, min(1.0, 0.001 * luck.multiplier))
+    for _ in range(sum(rng.random() < omnipotent_chance for _ in range(count))):
+        rewards.append(rng.choice(["World Ender", "Reality Stone"]))
+
+    return coins, rewards
+
+# Adventure locations: coin and XP ranges, possible item drops and flavor text
+ADVENTURE_AREAS = {
+    'training': {
+        'coins': (10, 30),
+        'xp': (5, 15),
+        'items': ['Training Sword', 'Health Potion'],
+        'description': 'You practice your combat skills in safety.'
+    },
+    'forest': {
+        'coins': (30, 70),
+        'xp': (15, 35),
+        'items': ['Iron Sword', 'Leather Armor', 'Health Potion'],
+        'description': 'You venture through peaceful woodlands.'
+    },
+    'mountains': {
+        'coins': (60, 120),
+        'xp': (30, 60),
+        'items': ['Steel Sword', 'Chain Mail', 'Mana Potion'],
+        'description': 'You brave the treacherous mountain paths.'
+    },
+    'dungeon': {
+        'coins': (100, 200),
+        'xp': (50, 100),
+        'items': ['Mystic Blade', 'Plate Armor', 'Lucky Charm'],
+        'description': 'You explore dark underground chambers.'
+    },
+    'dragon_lair': {
+        'coins': (200, 500),
+        'xp': (100, 250),
+        'items': ['Dragon Slayer', 'Dragon Scale Armor', 'Phoenix Feather'],
+        'description': 'You dare to enter the legendary dragon\'s domain.'
+    }
+}
+
+def roll_adventure_rewards(user_id: str, rewards: Dict[str, Any], luck: LuckContext, rng=random,
+                           multiplier: float = 1.0, item_chance: float = 0.3) -> tuple[int, int, List[str]]:
+    """Roll an adventure's coins, XP and item drop; returns (coins, xp, items found)."""
+    base_coins = rng.randint(*rewards['coins'])
+    base_xp = rng.randint(*rewards['xp'])
+
+    enhanced_rewards = generate_loot_with_luck(user_id, {
+        'coins': int(base_coins * multiplier),
+        'xp': int(base_xp * multiplier)
+    }, luck=luck)
+
+    items_found = []
+    if roll_with_luck(user_id, item_chance, luck=luck, rng=rng):
+        items_found = [rng.choice(rewards['items'])]
+
+    return enhanced_rewards['coins'], enhanced_rewards['xp'], items_found
+
+def roll_area_adventure(user_id: str, location: str, level: int, luck: LuckContext,
+                        rng=random) -> tuple[int, int, List[str]]:
+    """Roll the rewards of an adventure in one of ADVENTURE_AREAS, scaled by level."""
+    area = ADVENTURE_AREAS.get(location, ADVENTURE_AREAS['training'])
+    # Level-based multiplier, 40% item chance
+    return roll_adventure_rewards(user_id, area, luck, rng, multiplier=1 + (level - 1) * 0.1, item_chance=0.4)
+
+def _replay_lootbox(record: Dict[str, Any], rng: SessionRNG) -> Dict[str, Any]:
+    coins, items = roll_lootboxes(record['count'], LuckContext(record['luck_points']), rng)
+    return {'coins': coins, 'items': dict(Counter(items))}
+
+def _replay_adventure(record: Dict[str, Any], rng: SessionRNG) -> Dict[str, Any]:
+    coins, xp, items = roll_area_adventure(record['user_id'], record['location'], record['level'],
+                                           LuckContext(record['luck_points']), rng)
+    return {'coins': coins, 'xp': xp, 'items': items}
+
+def _replay_explore(record: Dict[str, Any], rng: SessionRNG) -> Dict[str, Any]:
+    outcome = get_random_adventure_outcome(rng)
+    coins, xp, items = roll_adventure_rewards(record['user_id'], outcome, LuckContext(record['luck_points']), rng)
+    return {'description': outcome['description'], 'coins': coins, 'xp': xp, 'items': items}
+
+def _replay_battle(record: Dict[str, Any], rng: SessionRNG) -> Dict[str, Any]:
+    turns = []
+    for turn in record['turns']:
+        enemy = dict(record['enemy'], hp=turn['enemy_hp'])
+        turns.append(_battle_turn_summary(resolve_battle_turn(turn['action'], turn['player'], enemy, rng)))
+    return {'turns': turns}
+
+def _battle_turn_summary(turn: Dict[str, Any]) -> Dict[str, Any]:
+    """Get the part of a resolved battle turn kept in session records."""
+    return {key: value for key, value in turn.items() if key != 'battle_result'}
+
+# Session kinds that can be re-executed offline from their record
+SESSION_REPLAYERS = {
+    'lootbox': _replay_lootbox,
+    'adventure': _replay_adventure,
+    'explore': _replay_explore,
+    'battle': _replay_battle,
+}
+
+def replay_session(record: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Re-execute a recorded session from its seed and inputs; returns its outcome.
+
+    Returns None for kinds that can't be replayed offline (PvP depends on
+    both players' live state).
+    """
+    replayer = SESSION_REPLAYERS.get(record['kind'])
+    if replayer is None:
+        return None
+    return replayer(record, SessionRNG(record['kind'], record['user_id'], record['seed']))
 
 def get_rarity_emoji(rarity):
     """Get emoji for rarity."""
@@ -408,46 +557,33 @@ class AdventureView(discord.ui.View):
     async def process_adventure(self, interaction: discord.Interaction, location: str):
         """Process the adventure."""
         try:
-            player_data = get_user_rpg_data(self.user_id)
-            if not player_data:
-                await interaction.followup.send("❌ Could not retrieve your data!", ephemeral=True)
-                return
-
-            # Get adventure outcome
-            outcome = get_random_adventure_outcome()
-
-            # Calculate rewards with luck
-            base_coins = random.randint(*outcome['coins'])
-            base_xp = random.randint(*outcome['xp'])
-
-            enhanced_rewards = generate_loot_with_luck(self.user_id, {
-                'coins': base_coins,
-                'xp': base_xp
+            # One profile read for every luck roll of this adventure
+            luck = await adb.run_blocking(LuckContext.for_user, self.user_id)
+
+            # Every roll comes from the adventure's own seeded stream
+            rng = start_session("explore", self.user_id)
+            outcome = get_random_adventure_outcome(rng)
+            coins_earned, xp_earned, items_found = roll_adventure_rewards(self.user_id, outcome, luck, rng)
+            rng.record(luck_points=luck.points, outcome={
+                'description': outcome['description'], 'coins': coins_earned, 'xp': xp_earned, 'items': items_found
             })
 
-            coins_earned = enhanced_rewards['coins']
-            xp_earned = enhanced_rewards['xp']
+            def apply_rewards(player_data):
+                player_data['coins'] = player_data.get('coins', 0) + coins_earned
+                player_data['xp'] = player_data.get('xp', 0) + xp_earned
+                player_data['adventure_count'] = player_data.get('adventure_count', 0) + 1
 
-            # Random item reward
-            items_found = []
-            if roll_with_luck(self.user_id, 0.3):  # 30% chance for item
-                items_found = [random.choice(outcome['items'])]
-
-            # Update player data
-            player_data['coins'] = player_data.get('coins', 0) + coins_earned
-            player_data['xp'] = player_data.get('xp', 0) + xp_earned
-            player_data['adventure_count'] = player_data.get('adventure_count', 0) + 1
-
-            # Add items to inventory
-            if items_found:
-                inventory = player_data.get('inventory', [])
-                inventory.extend(items_found)
-                player_data['inventory'] = inventory
+                # Add items to inventory; whatever doesn't fit is left behind
+                left_behind = add_items(get_inventory(player_data), items_found)
 
-            # Check for level up
-            level_up_msg = level_up_player(player_data)
+                # Check for level up
+                return level_up_player(player_data), left_behind
 
-            update_user_rpg_data(self.user_id, player_data)
+            result = await adb.mutate_user_rpg_data(self.user_id, apply_rewards)
+            if result is None:
+                await interaction.followup.send("❌ Could not retrieve your data!", ephemeral=True)
+                return
+            _, (level_up_msg, left_behind) = result
 
             # Create result embed
             embed = discord.Embed(
@@ -470,6 +606,13 @@ class AdventureView(discord.ui.View):
                     inline=True
                 )
 
+            if left_behind:
+                embed.add_field(
+                    name="🎒 Inventory Full",
+                    value="Left behind: " + ", ".join(left_behind),
+                    inline=False
+                )
+
             if level_up_msg:
                 embed.add_field(
                     name="📊 Level Up!",
@@ -635,14 +778,7 @@ class ShopView(discord.ui.View):
 
     def get_category_items(self) -> Dict[str, Any]:
         """Get items for the current category."""
-        from utils.constants import SHOP_ITEMS
-
-        category_items = {}
-        for item_id, item_data in SHOP_ITEMS.items():
-            if item_data.get('category') == self.current_category:
-                category_items[item_id] = item_data
-
-        return category_items
+        return {item.key: item.data for item in catalog.find(source="shop", category=self.current_category)}
 
     async def category_callback(self, interaction: discord.Interaction):
         """Handle category selection."""
@@ -655,7 +791,7 @@ class ShopView(discord.ui.View):
         self.selected_item = None
         self.update_shop_display()
 
-        embed = self.create_shop_embed()
+        embed = await self.create_shop_embed()
         await interaction.response.edit_message(embed=embed, view=self)
 
     async def item_callback(self, interaction: discord.Interaction):
@@ -667,7 +803,7 @@ class ShopView(discord.ui.View):
         self.selected_item = interaction.data['values'][0]
         self.update_shop_display()
 
-        embed = self.create_item_detail_embed()
+        embed = await self.create_item_detail_embed()
         await interaction.response.edit_message(embed=embed, view=self)
 
     async def prev_page_callback(self, interaction: discord.Interaction):
@@ -680,7 +816,7 @@ class ShopView(discord.ui.View):
         self.selected_item = None
         self.update_shop_display()
 
-        embed = self.create_shop_embed()
+        embed = await self.create_shop_embed()
         await interaction.response.edit_message(embed=embed, view=self)
 
     async def next_page_callback(self, interaction: discord.Interaction):
@@ -693,7 +829,7 @@ class ShopView(discord.ui.View):
         self.selected_item = None
         self.update_shop_display()
 
-        embed = self.create_shop_embed()
+        embed = await self.create_shop_embed()
         await interaction.response.edit_message(embed=embed, view=self)
 
     async def refresh_callback(self, interaction: discord.Interaction):
@@ -705,7 +841,7 @@ class ShopView(discord.ui.View):
         self.selected_item = None
         self.update_shop_display()
 
-        embed = self.create_shop_embed()
+        embed = await self.create_shop_embed()
         await interaction.response.edit_message(embed=embed, view=self)
 
     async def purchase_callback(self, interaction: discord.Interaction):
@@ -720,9 +856,9 @@ class ShopView(discord.ui.View):
 
         await self.process_purchase(interaction)
 
-    def create_shop_embed(self) -> discord.Embed:
+    async def create_shop_embed(self) -> discord.Embed:
         """Create the main shop embed."""
-        player_data = get_user_rpg_data(self.user_id)
+        player_data = await adb.get_user_rpg_data(self.user_id)
         coins = player_data.get('coins', 0) if player_data else 0
 
         embed = discord.Embed(
@@ -797,14 +933,13 @@ class ShopView(discord.ui.View):
         embed.set_footer(text="💡 Select an item to view detailed information and purchase options!")
         return embed
 
-    def create_item_detail_embed(self) -> discord.Embed:
+    async def create_item_detail_embed(self) -> discord.Embed:
         """Create detailed item view embed."""
-        from utils.constants import SHOP_ITEMS
-
-        if not self.selected_item or self.selected_item not in SHOP_ITEMS:
-            return self.create_shop_embed()
+        item = catalog.lookup("shop", self.selected_item) if self.selected_item else None
+        if item is None:
+            return await self.create_shop_embed()
 
-        item_data = SHOP_ITEMS[self.selected_item]
+        item_data = item.data
         rarity = item_data.get('rarity', 'common')
         color = RARITY_COLORS.get(rarity, COLORS['primary'])
         emoji = get_rarity_emoji(rarity)
@@ -822,7 +957,6 @@ class ShopView(discord.ui.View):
         if item_data.get('defense'):
             stats_text += f"🛡️ **Defense:** +{item_data['defense']}\n"
         if item_data.get('hp'):
-            ```python
             stats_text += f"❤️ **Health:** +{item_data['hp']}\n"
         if item_data.get('mana'):
             stats_text += f"💙 **Mana:** +{item_data['mana']}\n"
@@ -846,7 +980,7 @@ class ShopView(discord.ui.View):
         )
 
         # Player's current coins
-        player_data = get_user_rpg_data(self.user_id)
+        player_data = await adb.get_user_rpg_data(self.user_id)
         coins = player_data.get('coins', 0) if player_data else 0
         
         can_afford = coins >= price
@@ -891,23 +1025,47 @@ class ShopView(discord.ui.View):
 
     async def process_purchase(self, interaction: discord.Interaction):
         """Process the item purchase."""
-        from utils.constants import SHOP_ITEMS
-        
         try:
-            player_data = get_user_rpg_data(self.user_id)
-            if not player_data:
-                await interaction.response.send_message("❌ Could not retrieve your data!", ephemeral=True)
-                return
-
-            if self.selected_item not in SHOP_ITEMS:
+            item = catalog.lookup("shop", self.selected_item) if self.selected_item else None
+            if item is None:
                 await interaction.response.send_message("❌ Invalid item selected!", ephemeral=True)
                 return
 
-            item_data = SHOP_ITEMS[self.selected_item]
+            item_data = item.data
             price = item_data.get('price', 0)
-            coins = player_data.get('coins', 0)
 
-            if coins < price:
+            def buy_item(player_data):
+                coins = player_data.get('coins', 0)
+                if coins < price:
+                    return "coins"
+
+                # Process purchase
+                if not add_item(get_inventory(player_data), item_data['name']):
+                    return "full"
+                player_data['coins'] = coins - price
+
+                # Update stats if needed
+                stats = player_data.get('stats', {})
+                stats['items_purchased'] = stats.get('items_purchased', 0) + 1
+                player_data['stats'] = stats
+                return None
+
+            result = await adb.mutate_user_rpg_data(self.user_id, buy_item)
+            if result is None:
+                await interaction.response.send_message("❌ Could not retrieve your data!", ephemeral=True)
+                return
+
+            player_data, failure = result
+            if failure == "full":
+                await interaction.response.send_message(
+                    f"❌ **Inventory full!**\n"
+                    f"You can hold {MAX_SLOTS} different items. Sell or use something first.",
+                    ephemeral=True
+                )
+                return
+
+            if failure == "coins":
+                coins = player_data.get('coins', 0)
                 await interaction.response.send_message(
                     f"❌ **Insufficient funds!**\n"
                     f"You need **{format_number(price)}** coins but only have **{format_number(coins)}**.\n"
@@ -916,19 +1074,6 @@ class ShopView(discord.ui.View):
                 )
                 return
 
-            # Process purchase
-            player_data['coins'] = coins - price
-            inventory = player_data.get('inventory', [])
-            inventory.append(item_data['name'])
-            player_data['inventory'] = inventory
-
-            # Update stats if needed
-            stats = player_data.get('stats', {})
-            stats['items_purchased'] = stats.get('items_purchased', 0) + 1
-            player_data['stats'] = stats
-
-            update_user_rpg_data(self.user_id, player_data)
-
             # Create purchase confirmation
             rarity = item_data.get('rarity', 'common')
             emoji = get_rarity_emoji(rarity)
@@ -943,7 +1088,7 @@ class ShopView(discord.ui.View):
                 name="💰 Transaction Details",
                 value=f"**Item:** {item_data['name']}\n"
                       f"**Price:** {format_number(price)} coins\n"
-                      f"**Remaining Coins:** {format_number(coins - price)}",
+                      f"**Remaining Coins:** {format_number(player_data.get('coins', 0))}",
                 inline=True
             )
 
@@ -970,6 +1115,9 @@ class ShopView(discord.ui.View):
 class LootboxView(discord.ui.View):
     """Lootbox opening view."""
 
+    # Most boxes opened by one click of "Open All"
+    MAX_BATCH = 500
+
     def __init__(self, user_id: str):
         super().__init__(timeout=300)
         self.user_id = user_id
@@ -977,73 +1125,89 @@ class LootboxView(discord.ui.View):
     @discord.ui.button(label="📦 Open Lootbox", style=discord.ButtonStyle.primary, emoji="🎁")
     async def open_lootbox(self, interaction: discord.Interaction, button: discord.ui.Button):
         """Open a lootbox."""
-        player_data = get_user_rpg_data(self.user_id)
-        if not player_data:
-            await interaction.response.send_message("❌ Could not retrieve your data!", ephemeral=True)
+        await self.open_lootboxes(interaction, 1)
+
+    @discord.ui.button(label="Open 10", style=discord.ButtonStyle.secondary, emoji="🎁")
+    async def open_ten(self, interaction: discord.Interaction, button: discord.ui.Button):
+        """Open up to 10 lootboxes."""
+        await self.open_lootboxes(interaction, 10)
+
+    @discord.ui.button(label="Open All", style=discord.ButtonStyle.success, emoji="🎉")
+    async def open_all(self, interaction: discord.Interaction, button: discord.ui.Button):
+        """Open every lootbox."""
+        await self.open_lootboxes(interaction, self.MAX_BATCH)
+
+    async def open_lootboxes(self, interaction: discord.Interaction, count: int):
+        """Open up to count lootboxes with one roll batch and one profile write."""
+        if str(interaction.user.id) != self.user_id:
+            await interaction.response.send_message("❌ These aren't your lootboxes!", ephemeral=True)
             return
 
-        inventory = player_data.get('inventory', [])
-        if "Lootbox" not in inventory:
+        embed = await open_lootboxes(self.user_id, count)
+        if embed is None:
             await interaction.response.send_message("❌ You don't have any lootboxes!", ephemeral=True)
             return
 
-        # Remove lootbox from inventory
-        inventory.remove("Lootbox")
-        player_data['inventory'] = inventory
-
-        # Generate loot
-        rewards = []
-        coins_reward = 0
+        for child in self.children:
+            child.disabled = True
+        await interaction.response.edit_message(embed=embed, view=self)
 
-        # Always get coins
-        coins_reward = random.randint(100, 1000)
+async def open_lootboxes(user_id: str, count: int) -> Optional[discord.Embed]:
+    """Open up to count of a player's lootboxes; returns the summary embed, or None without boxes."""
+    rng = start_session("lootbox", user_id)
 
-        # Chance for items
-        for _ in range(3):  # 3 chances for items
-            if roll_with_luck(self.user_id, 0.4):  # 40% chance per roll
-                item_name, item_data = generate_random_item()
-                rewards.append(item_name)
-                inventory.append(item_name)
+    def open_boxes(player_data):
+        inventory = get_inventory(player_data)
+        opened = min(count, inventory.get("Lootbox", 0))
+        if opened <= 0:
+            return None
+        remove_item(inventory, "Lootbox", opened)
 
-        # Super rare chance for omnipotent items
-        if roll_with_luck(self.user_id, 0.001):  # 0.1% chance
-            if random.choice([True, False]):
-                rewards.append("World Ender")
-                inventory.append("World Ender")
-            else:
-                rewards.append("Reality Stone")
-                inventory.append("Reality Stone")
+        # Luck is resolved from the profile being mutated
+        luck = LuckContext.from_player_data(player_data)
+        coins_reward, rewards = roll_lootboxes(opened, luck, rng)
 
+        left_behind = add_items(inventory, rewards)
         player_data['coins'] = player_data.get('coins', 0) + coins_reward
-        player_data['inventory'] = inventory
-        update_user_rpg_data(self.user_id, player_data)
+        return opened, coins_reward, rewards, left_behind, inventory.get("Lootbox", 0), luck.points
+
+    result = await adb.mutate_user_rpg_data(user_id, rng.attempt(open_boxes))
+    if result is None or result[1] is None:
+        return None
+    opened, coins_reward, rewards, left_behind, remaining, luck_points = result[1]
+    rng.record(count=opened, luck_points=luck_points, outcome={'coins': coins_reward, 'items': dict(Counter(rewards))})
+
+    # Create result embed
+    embed = discord.Embed(
+        title="🎁 Lootbox Opened!" if opened == 1 else f"🎁 {opened} Lootboxes Opened!",
+        description=f"**Coins:** {format_number(coins_reward)}",
+        color=COLORS['success']
+    )
 
-        # Create result embed
-        embed = discord.Embed(
-            title="🎁 Lootbox Opened!",
-            description=f"**Coins:** {format_number(coins_reward)}",
-            color=COLORS['success']
-        )
+    if rewards:
+        # Rarest first, one line per distinct item
+        rarity_rank = {rarity: rank for rank, rarity in enumerate(RARITY_WEIGHTS)}
+        found = sorted(Counter(rewards).items(),
+                       key=lambda entry: (-rarity_rank.get(catalog.rarity_of(entry[0]), 0), entry[0]))
+        lines = []
+        for item, quantity in found:
+            rarity = catalog.rarity_of(item)
+            emoji = get_rarity_emoji(rarity)
+            lines.append(f"{emoji} **{format_item(item, quantity)}** ({rarity})")
+        items_text = "\n".join(lines[:15])
+        if len(lines) > 15:
+            items_text += f"\n... and {len(lines) - 15} more kinds"
 
-        if rewards:
-            items_text = ""
-            for item in rewards:
-                if item in WEAPONS:
-                    rarity = WEAPONS[item]["rarity"]
-                elif item in ARMOR:
-                    rarity = ARMOR[item]["rarity"]
-                elif item == "Reality Stone":
-                    rarity = "omnipotent"
-                else:
-                    rarity = "common"
+        embed.add_field(name=f"🎯 Items Found ({len(rewards)})", value=items_text, inline=False)
 
-                emoji = get_rarity_emoji(rarity)
-                items_text += f"{emoji} **{item}** ({rarity})\n"
+    if left_behind:
+        left_text = ", ".join(format_item(item, quantity) for item, quantity in Counter(left_behind).items())
+        embed.add_field(name="🎒 Inventory Full", value=f"Left behind: {left_text}"[:1024], inline=False)
 
-            embed.add_field(name="🎯 Items Found", value=items_text, inline=False)
+    if remaining:
+        embed.set_footer(text=f"{remaining} lootboxes left")
 
-        button.disabled = True
-        await interaction.response.edit_message(embed=embed, view=self)
+    return embed
 
 class PvPView(discord.ui.View):
     """Enhanced turn-based PvP battle view."""
@@ -1064,6 +1228,8 @@ class PvPView(discord.ui.View):
         self.target_buffs = {}
         self.challenger_energy = 100
         self.target_energy = 100
+        self.consumed_items = {}
+        self.rng = start_session("pvp", challenger_id)
 
     @discord.ui.button(label="⚔️ Accept Challenge", style=discord.ButtonStyle.success, custom_id="accept")
     async def accept_challenge(self, interaction: discord.Interaction, button: discord.ui.Button):
@@ -1214,7 +1380,7 @@ class PvPView(discord.ui.View):
         
         # Check for critical hit
         crit_chance = 0.15
-        is_critical = random.random() < crit_chance
+        is_critical = self.rng.random() < crit_chance
         
         damage = max(1, base_damage - opponent_defense)
         if is_critical:
@@ -1306,16 +1472,16 @@ class PvPView(discord.ui.View):
         user_id = str(interaction.user.id)
         user_data = self.get_user_data(user_id)
         
-        inventory = user_data.get('inventory', [])
-        health_potions = [item for item in inventory if 'Potion' in item]
+        inventory = get_inventory(user_data)
+        potion = next((item for item in inventory if 'Potion' in item), None)
         
-        if not health_potions:
+        if potion is None:
             await interaction.response.send_message("❌ You have no healing items!", ephemeral=True)
             return
 
         # Use first health potion
-        potion = health_potions[0]
-        inventory.remove(potion)
+        remove_item(inventory, potion)
+        self.consumed_items.setdefault(user_id, []).append(potion)
         
         # Heal
         heal_amount = 50
@@ -1366,34 +1532,61 @@ class PvPView(discord.ui.View):
         entry_fee = arena_data["entry_fee"]
         winner_reward = entry_fee * arena_data["winner_multiplier"]
 
-        winner_data = self.get_user_data(winner_id)
-        loser_data = self.get_user_data(loser_id)
-
-        # Award winner
-        winner_data['coins'] = winner_data.get('coins', 0) + winner_reward
-        winner_stats = winner_data.get('stats', {})
-        winner_stats['pvp_wins'] = winner_stats.get('pvp_wins', 0) + 1
-        winner_data['stats'] = winner_stats
-
-        # Update loser
-        loser_data['coins'] = max(0, loser_data.get('coins', 0) - entry_fee)
-        loser_stats = loser_data.get('stats', {})
-        loser_stats['pvp_losses'] = loser_stats.get('pvp_losses', 0) + 1
-        loser_data['stats'] = loser_stats
-
-        # Save data
-        update_user_rpg_data(winner_id, winner_data)
-        update_user_rpg_data(loser_id, loser_data)
-
-        # Create victory embed
-        embed = discord.Embed(
-            title="🏆 PvP Battle Complete!",
-            description=f"**Winner:** <@{winner_id}>\n"
-                       f"**Arena:** {arena_data['name']}\n"
-                       f"**Turns:** {self.turn_count}\n"
-                       f"**Reward:** {format_number(winner_reward)} coins",
-            color=COLORS['success']
-        )
+        def apply_battle_result(user_id: str):
+            """Carry the battle's HP and potion use over to the stored profile."""
+            battle_data = self.get_user_data(user_id)
+
+            def apply(player_data):
+                player_data['hp'] = battle_data['hp']
+                inventory = get_inventory(player_data)
+                for item in self.consumed_items.get(user_id, []):
+                    remove_item(inventory, item)
+                if user_id == winner_id:
+                    # Award winner
+                    player_data['coins'] += winner_reward
+                    player_data['pvp_wins'] += 1
+                else:
+                    # Update loser
+                    player_data['coins'] = max(0, player_data['coins'] - entry_fee)
+                    player_data['pvp_losses'] += 1
+            return apply
+
+        # Save data; each player's profile commits separately
+        results = await adb.mutate_many_user_rpg_data({
+            winner_id: apply_battle_result(winner_id),
+            loser_id: apply_battle_result(loser_id)
+        })
+        unsaved = [user_id for user_id in (winner_id, loser_id) if results.get(user_id) is None]
+        self.rng.record(target_id=self.target_id, arena=self.arena, turns=self.turn_count, winner=winner_id,
+                        unsaved=unsaved)
+
+        if len(unsaved) == 2:
+            embed = discord.Embed(
+                title="❌ Battle Results Not Saved",
+                description=f"<@{winner_id}> won, but the results could not be saved.\n"
+                           f"No coins, stats or items changed. Please try again later.",
+                color=COLORS['error']
+            )
+        elif unsaved:
+            embed = discord.Embed(
+                title="⚠️ Battle Results Partly Saved",
+                description=f"**Winner:** <@{winner_id}>\n"
+                           f"The results were saved for "
+                           f"{', '.join(f'<@{user_id}>' for user_id in (winner_id, loser_id) if user_id not in unsaved)} "
+                           f"but could not be saved for {', '.join(f'<@{user_id}>' for user_id in unsaved)}.\n"
+                           f"Please contact an admin to settle the {format_number(winner_reward)} coin reward.",
+                color=COLORS['warning']
+            )
+        else:
+            # Create victory embed
+            embed = discord.Embed(
+                title="🏆 PvP Battle Complete!",
+                description=f"**Winner:** <@{winner_id}>\n"
+                           f"**Arena:** {arena_data['name']}\n"
+                           f"**Turns:** {self.turn_count}\n"
+                           f"**Reward:** {format_number(winner_reward)} coins",
+                color=COLORS['success']
+            )
 
         # Show final battle log
         if self.battle_log:
@@ -1472,8 +1665,9 @@ class PvPView(discord.ui.View):
 
     async def start_pvp_battle(self, interaction):
         """Start the actual PvP battle."""
-        self.challenger_data = get_user_rpg_data(self.challenger_id)
-        self.target_data = get_user_rpg_data(self.target_id)
+        profiles = await adb.get_many_user_rpg_data([self.challenger_id, self.target_id])
+        self.challenger_data = profiles[str(self.challenger_id)]
+        self.target_data = profiles[str(self.target_id)]
 
         if not self.challenger_data or not self.target_data:
             await interaction.response.send_message("❌ Could not retrieve player data!", ephemeral=True)
@@ -1488,6 +1682,7 @@ class PvPView(discord.ui.View):
         self.target_buffs = {}
         self.challenger_energy = 100
         self.target_energy = 100
+        self.consumed_items = {self.challenger_id: [], self.target_id: []}
 
         # Make copies of data to avoid modifying original
         self.challenger_data = self.challenger_data.copy()
@@ -1560,7 +1755,6 @@ class TradeView(discord.ui.View):
             await interaction.response.send_message("❌ You're not part of this trade!", ephemeral=True)
             return
 
-```python
         await interaction.response.send_message("💰 Please type the amount of coins you want to add:", ephemeral=True)
 
     @discord.ui.button(label="✅ Ready", style=discord.ButtonStyle.success)
@@ -1597,8 +1791,9 @@ class TradeView(discord.ui.View):
 
     async def execute_trade(self, interaction):
         """Execute the trade between players."""
-        trader1_data = get_user_rpg_data(self.trader1_id)
-        trader2_data = get_user_rpg_data(self.trader2_id)
+        profiles = await adb.get_many_user_rpg_data([self.trader1_id, self.trader2_id])
+        trader1_data = profiles[str(self.trader1_id)]
+        trader2_data = profiles[str(self.trader2_id)]
 
         if not trader1_data or not trader2_data:
             await interaction.response.send_message("❌ Could not retrieve trader data!", ephemeral=True)
@@ -1625,6 +1820,24 @@ class BattleView(discord.ui.View):
         super().__init__(timeout=300)
         self.user_id = user_id
         self.enemy_data = enemy_data
+        self.rng = start_session("battle", user_id)
+        self.turns = []
+        self.recorded = False
+
+    def record_session(self):
+        """Log the battle's seed with every turn's inputs and result, once."""
+        if self.recorded or not self.turns:
+            return
+        self.recorded = True
+        self.rng.record(
+            enemy={'name': self.enemy_data['name'], 'attack': self.enemy_data.get('attack', 8)},
+            turns=[inputs for inputs, _ in self.turns],
+            outcome={'turns': [result for _, result in self.turns]}
+        )
+
+    async def on_timeout(self):
+        """Record an unfinished battle."""
+        self.record_session()
 
     @discord.ui.button(label="⚔️ Attack", style=discord.ButtonStyle.danger)
     async def attack_button(self, interaction: discord.Interaction, button: discord.ui.Button):
@@ -1644,71 +1857,74 @@ class BattleView(discord.ui.View):
     async def process_battle_action(self, interaction: discord.Interaction, action: str):
         """Process battle action."""
         try:
-            player_data = get_user_rpg_data(self.user_id)
-            if not player_data:
-                await interaction.response.send_message("❌ Could not retrieve your data!", ephemeral=True)
-                return
-
-            player_hp = player_data.get('hp', 100)
-            player_attack = player_data.get('attack', 10)
-            player_defense = player_data.get('defense', 5)
+            def resolve_turn(player_data):
+                player = {
+                    'hp': player_data.get('hp', 100),
+                    'attack': player_data.get('attack', 10),
+                    'defense': player_data.get('defense', 5)
+                }
+                enemy = {
+                    'name': self.enemy_data['name'],
+                    'hp': self.enemy_data.get('hp', 50),
+                    'attack': self.enemy_data.get('attack', 8)
+                }
 
-            enemy_hp = self.enemy_data.get('hp', 50)
-            enemy_attack = self.enemy_data.get('attack', 8)
+                turn = resolve_battle_turn(action, player, enemy, self.rng)
+                turn['inputs'] = {'action': action, 'player': player, 'enemy_hp': enemy['hp']}
+                player_hp = turn['player_hp']
+                enemy_hp = turn['enemy_hp']
 
-            battle_result = ""
+                # Check battle outcome
+                if enemy_hp <= 0:
+                    # Victory
+                    player_data['coins'] = player_data.get('coins', 0) + turn['coins_reward']
+                    player_data['xp'] = player_data.get('xp', 0) + turn['xp_reward']
 
-            if action == "attack":
-                # Player attacks
-                damage = calculate_battle_damage(player_attack, 0)
-                enemy_hp -= damage
-                battle_result += f"You dealt {damage} damage to {self.enemy_data['name']}!\n"
+                    stats = player_data.get('stats', {})
+                    stats['battles_won'] = stats.get('battles_won', 0) + 1
+                    player_data['stats'] = stats
 
-                # Enemy attacks back if still alive
-                if enemy_hp > 0:
-                    enemy_damage = calculate_battle_damage(enemy_attack, player_defense)
-                    player_hp -= enemy_damage
-                    battle_result += f"{self.enemy_data['name']} dealt {enemy_damage} damage to you!\n"
+                elif player_hp <= 0:
+                    # Defeat
+                    player_data['hp'] = 0
+                    stats = player_data.get('stats', {})
+                    stats['battles_lost'] = stats.get('battles_lost', 0) + 1
+                    player_data['stats'] = stats
 
-            elif action == "defend":
-                # Reduced damage when defending
-                enemy_damage = calculate_battle_damage(enemy_attack, player_defense * 2)
-                player_hp -= enemy_damage
-                battle_result += f"You defended! {self.enemy_data['name']} dealt {enemy_damage} damage!\n"
+                else:
+                    # Battle continues
+                    player_data['hp'] = player_hp
 
-            # Check battle outcome
-            if enemy_hp <= 0:
-                # Victory
-                coins_reward = random.randint(50, 150)
-                xp_reward = random.randint(20, 50)
+                return turn
 
-                player_data['coins'] = player_data.get('coins', 0) + coins_reward
-                player_data['xp'] = player_data.get('xp', 0) + xp_reward
+            result = await adb.mutate_user_rpg_data(self.user_id, self.rng.attempt(resolve_turn))
+            if result is None:
+                await interaction.response.send_message("❌ Could not retrieve your data!", ephemeral=True)
+                return
 
-                stats = player_data.get('stats', {})
-                stats['battles_won'] = stats.get('battles_won', 0) + 1
-                player_data['stats'] = stats
+            player_data, turn = result
+            inputs = turn.pop('inputs')
+            self.turns.append((inputs, _battle_turn_summary(turn)))
+            battle_result = turn['battle_result']
+            player_hp = turn['player_hp']
+            enemy_hp = turn['enemy_hp']
 
+            if enemy_hp <= 0:
                 embed = discord.Embed(
                     title="🎉 Victory!",
                     description=f"{battle_result}\n**You defeated {self.enemy_data['name']}!**\n\n"
                                 f"**Rewards:**\n"
-                                f"Coins: {format_number(coins_reward)}\n"
-                                f"XP: {xp_reward}",
+                                f"Coins: {format_number(turn['coins_reward'])}\n"
+                                f"XP: {turn['xp_reward']}",
                     color=COLORS['success']
                 )
 
                 # Disable all buttons
                 for item in self.children:
                     item.disabled = True
+                self.record_session()
 
             elif player_hp <= 0:
-                # Defeat
-                player_data['hp'] = 0
-                stats = player_data.get('stats', {})
-                stats['battles_lost'] = stats.get('battles_lost', 0) + 1
-                player_data['stats'] = stats
-
                 embed = discord.Embed(
                     title="💀 Defeat!",
                     description=f"{battle_result}\n**You were defeated by {self.enemy_data['name']}!**\n\n"
@@ -1719,11 +1935,10 @@ class BattleView(discord.ui.View):
                 # Disable all buttons
                 for item in self.children:
                     item.disabled = True
+                self.record_session()
 
             else:
-                # Battle continues
                 self.enemy_data['hp'] = enemy_hp
-                player_data['hp'] = player_hp
 
                 embed = discord.Embed(
                     title=f"⚔️ Battle vs {self.enemy_data['name']}",
@@ -1733,9 +1948,6 @@ class BattleView(discord.ui.View):
                     color=COLORS['warning']
                 )
 
-            # Update player data
-            update_user_rpg_data(self.user_id, player_data)
-
             await interaction.response.edit_message(embed=embed, view=self)
 
         except Exception as e:
@@ -1745,19 +1957,24 @@ class BattleView(discord.ui.View):
 class ProgressiveShopView(discord.ui.View):
     """Shop organized by player progression."""
 
-    def __init__(self, user_id: str):
+    def __init__(self, user_id: str, player_data: Optional[Dict[str, Any]]):
         super().__init__(timeout=600)
         self.user_id = user_id
+        self.player_data = player_data or {}
         self.current_category = "beginner"
         self.current_page = 0
         self.selected_item = None
         self.update_shop_display()
 
+    async def refresh_player_data(self):
+        """Reload the player's profile from storage."""
+        self.player_data = await adb.get_user_rpg_data(self.user_id) or {}
+
     def update_shop_display(self):
         """Update shop based on player level and progression."""
         self.clear_items()
 
-        player_data = get_user_rpg_data(self.user_id)
+        player_data = self.player_data
         level = player_data.get('level', 1) if player_data else 1
         player_class = player_data.get('player_class') if player_data else None
 
@@ -1863,48 +2080,36 @@ class ProgressiveShopView(discord.ui.View):
 
     def get_category_items(self) -> Dict[str, Any]:
         """Get items based on category and player level."""
-        from utils.constants import SHOP_ITEMS
-
-        player_data = get_user_rpg_data(self.user_id)
+        player_data = self.player_data
         level = player_data.get('level', 1) if player_data else 1
         player_class = player_data.get('player_class') if player_data else None
 
-        category_items = {}
-
-        for item_id, item_data in SHOP_ITEMS.items():
-            item_level_req = item_data.get('level_requirement', 1)
+        # Each category is one indexed catalog query, capped at the player's level
+        items = ()
+        if self.current_category == "beginner":
+            items = catalog.find(source="shop", category=("weapons", "armor"), rarity=("common", "uncommon"),
+                                 max_level=min(level, 5))
 
-            # Skip items above player level
-            if level < item_level_req:
-                continue
+        elif self.current_category == "combat" and level >= 5:
+            items = catalog.find(source="shop", category="consumables", max_level=level)
 
-            # Category filtering
-            if self.current_category == "beginner" and item_level_req <= 5:
-                if item_data.get('category') in ['weapons', 'armor'] and item_data.get('rarity') in ['common', 'uncommon']:
-                    category_items[item_id] = item_data
+        elif self.current_category == "advanced" and level >= 10:
+            items = catalog.find(source="shop", category=("weapons", "armor"), rarity=("rare", "epic"),
+                                 max_level=level)
 
-            elif self.current_category == "combat" and level >= 5:
-                if item_data.get('category') == 'consumables':
-                    category_items[item_id] = item_data
+        elif self.current_category == "class_specific" and player_class and level >= 15:
+            items = catalog.find(source="shop", class_req=(player_class, "any"), rarity=("epic", "legendary"),
+                                 max_level=level)
 
-            elif self.current_category == "advanced" and level >= 10:
-                if item_data.get('category') in ['weapons', 'armor'] and item_data.get('rarity') in ['rare', 'epic']:
-                    category_items[item_id] = item_data
+        elif self.current_category == "rare" and level >= 25:
+            items = catalog.find(source="shop", rarity=("legendary", "mythic"), max_level=level)
+            lootboxes = catalog.find(source="shop", name="Lootbox", max_level=level)
+            items = sorted({item.id: item for item in items + lootboxes}.values(), key=lambda item: item.id)
 
-            elif self.current_category == "class_specific" and player_class and level >= 15:
-                if item_data.get('class_req') == player_class or item_data.get('class_req') == 'any':
-                    if item_data.get('rarity') in ['epic', 'legendary']:
-                        category_items[item_id] = item_data
+        elif self.current_category == "legendary" and level >= 40:
+            items = catalog.find(source="shop", rarity=("mythic", "divine", "omnipotent"), max_level=level)
 
-            elif self.current_category == "rare" and level >= 25:
-                if item_data.get('rarity') in ['legendary', 'mythic'] or item_data.get('name') == 'Lootbox':
-                    category_items[item_id] = item_data
-
-            elif self.current_category == "legendary" and level >= 40:
-                if item_data.get('rarity') in ['mythic', 'divine', 'omnipotent']:
-                    category_items[item_id] = item_data
-
-        return category_items
+        return {item.key: item.data for item in items}
 
     def get_rarity_emoji(self, rarity):
         """Get emoji for rarity."""
@@ -1928,6 +2133,7 @@ class ProgressiveShopView(discord.ui.View):
 
         self.current_category = interaction.data['values'][0]
         self.selected_item = None
+        await self.refresh_player_data()
         self.update_shop_display()
 
         embed = self.create_shop_embed()
@@ -1955,7 +2161,7 @@ class ProgressiveShopView(discord.ui.View):
 
     def create_shop_embed(self) -> discord.Embed:
         """Create the shop embed."""
-        player_data = get_user_rpg_data(self.user_id)
+        player_data = self.player_data
         coins = player_data.get('coins', 0) if player_data else 0
         level = player_data.get('level', 1) if player_data else 1
 
@@ -2012,12 +2218,11 @@ class ProgressiveShopView(discord.ui.View):
 
     def create_item_detail_embed(self) -> discord.Embed:
         """Create detailed item view."""
-        from utils.constants import SHOP_ITEMS
-
-        if not self.selected_item or self.selected_item not in SHOP_ITEMS:
+        item = catalog.lookup("shop", self.selected_item) if self.selected_item else None
+        if item is None:
             return self.create_shop_embed()
 
-        item_data = SHOP_ITEMS[self.selected_item]
+        item_data = item.data
         rarity = item_data.get('rarity', 'common')
         color = RARITY_COLORS.get(rarity, COLORS['primary'])
         emoji = self.get_rarity_emoji(rarity)
@@ -2054,7 +2259,7 @@ class ProgressiveShopView(discord.ui.View):
         )
 
         # Player status
-        player_data = get_user_rpg_data(self.user_id)
+        player_data = self.player_data
         coins = player_data.get('coins', 0) if player_data else 0
         level = player_data.get('level', 1) if player_data else 1
 
@@ -2075,48 +2280,60 @@ class ProgressiveShopView(discord.ui.View):
 
     async def process_purchase(self, interaction: discord.Interaction):
         """Process item purchase."""
-        from utils.constants import SHOP_ITEMS
-
         try:
-            player_data = get_user_rpg_data(self.user_id)
-            if not player_data:
-                await interaction.response.send_message("❌ Could not retrieve your data!", ephemeral=True)
-                return
-
-            if self.selected_item not in SHOP_ITEMS:
+            item = catalog.lookup("shop", self.selected_item) if self.selected_item else None
+            if item is None:
                 await interaction.response.send_message("❌ Invalid item selected!", ephemeral=True)
                 return
 
-            item_data = SHOP_ITEMS[self.selected_item]
+            item_data = item.data
             price = item_data.get('price', 0)
             level_req = item_data.get('level_requirement', 1)
-            coins = player_data.get('coins', 0)
-            level = player_data.get('level', 1)
 
-            # Check requirements
-            if level < level_req:
+            def buy_item(player_data):
+                # Check requirements
+                if player_data.get('level', 1) < level_req:
+                    return "level"
+                if player_data.get('coins', 0) < price:
+                    return "coins"
+
+                # Process purchase
+                if not add_item(get_inventory(player_data), item_data['name']):
+                    return "full"
+                player_data['coins'] = player_data.get('coins', 0) - price
+                return None
+
+            result = await adb.mutate_user_rpg_data(self.user_id, buy_item)
+            if result is None:
+                await interaction.response.send_message("❌ Could not retrieve your data!", ephemeral=True)
+                return
+
+            player_data, failure = result
+            self.player_data = player_data
+
+            if failure == "level":
                 await interaction.response.send_message(
                     f"❌ **Level requirement not met!**\n"
-                    f"Required: Level {level_req} | Your Level: {level}",
+                    f"Required: Level {level_req} | Your Level: {player_data.get('level', 1)}",
                     ephemeral=True
                 )
                 return
 
-            if coins < price:
+            if failure == "coins":
                 await interaction.response.send_message(
                     f"❌ **Insufficient funds!**\n"
-                    f"Price: {format_number(price)} | Your coins: {format_number(coins)}",
+                    f"Price: {format_number(price)} | Your coins: {format_number(player_data.get('coins', 0))}",
                     ephemeral=True
                 )
                 return
 
-            # Process purchase
-            player_data['coins'] = coins - price
-            inventory = player_data.get('inventory', [])
-            inventory.append(item_data['name'])
-            player_data['inventory'] = inventory
-
-            update_user_rpg_data(self.user_id, player_data)
+            if failure == "full":
+                await interaction.response.send_message(
+                    f"❌ **Inventory full!**\n"
+                    f"You can hold {MAX_SLOTS} different items. Sell or use something first.",
+                    ephemeral=True
+                )
+                return
 
             embed = discord.Embed(
                 title="🎉 Purchase Successful!",
@@ -2179,7 +2396,7 @@ class EnhancedAdventureView(discord.ui.View):
         """Start an adventure with level checking."""
         location = select.values[0]
 
-        player_data = get_user_rpg_data(self.user_id)
+        player_data = await adb.get_user_rpg_data(self.user_id)
         if not player_data:
             await interaction.response.send_message("❌ Could not retrieve your data!", ephemeral=True)
             return
@@ -2213,79 +2430,35 @@ class EnhancedAdventureView(discord.ui.View):
     async def process_adventure(self, interaction: discord.Interaction, location: str):
         """Process adventure with location-specific rewards."""
         try:
-            player_data = get_user_rpg_data(self.user_id)
+            player_data = await adb.get_user_rpg_data(self.user_id)
             level = player_data.get('level', 1)
 
             # Location-specific rewards
-            location_data = {
-                'training': {
-                    'coins': (10, 30),
-                    'xp': (5, 15),
-                    'items': ['Training Sword', 'Health Potion'],
-                    'description': 'You practice your combat skills in safety.'
-                },
-                'forest': {
-                    'coins': (30, 70),
-                    'xp': (15, 35),
-                    'items': ['Iron Sword', 'Leather Armor', 'Health Potion'],
-                    'description': 'You venture through peaceful woodlands.'
-                },
-                'mountains': {
-                    'coins': (60, 120),
-                    'xp': (30, 60),
-                    'items': ['Steel Sword', 'Chain Mail', 'Mana Potion'],
-                    'description': 'You brave the treacherous mountain paths.'
-                },
-                'dungeon': {
-                    'coins': (100, 200),
-                    'xp': (50, 100),
-                    'items': ['Mystic Blade', 'Plate Armor', 'Lucky Charm'],
-                    'description': 'You explore dark underground chambers.'
-                },
-                'dragon_lair': {
-                    'coins': (200, 500),
-                    'xp': (100, 250),
-                    'items': ['Dragon Slayer', 'Dragon Scale Armor', 'Phoenix Feather'],
-                    'description': 'You dare to enter the legendary dragon\'s domain.'
-                }
-            }
-
-            adventure_info = location_data.get(location, location_data['training'])
-
-            # Calculate rewards
-            base_coins = random.randint(*adventure_info['coins'])
-            base_xp = random.randint(*adventure_info['xp'])
-
-            # Level-based multiplier
-            level_multiplier = 1 + (level - 1) * 0.1
-
-            enhanced_rewards = generate_loot_with_luck(self.user_id, {
-                'coins': int(base_coins * level_multiplier),
-                'xp': int(base_xp * level_multiplier)
+            adventure_info = ADVENTURE_AREAS.get(location, ADVENTURE_AREAS['training'])
+
+            # Every roll comes from the adventure's own seeded stream
+            luck = LuckContext.from_player_data(player_data)
+            rng = start_session("adventure", self.user_id)
+            coins_earned, xp_earned, items_found = roll_area_adventure(self.user_id, location, level, luck, rng)
+            rng.record(location=location, level=level, luck_points=luck.points, outcome={
+                'coins': coins_earned, 'xp': xp_earned, 'items': items_found
             })
 
-            coins_earned = enhanced_rewards['coins']
-            xp_earned = enhanced_rewards['xp']
+            def apply_rewards(player_data):
+                player_data['coins'] = player_data.get('coins', 0) + coins_earned
+                player_data['xp'] = player_data.get('xp', 0) + xp_earned
+                player_data['adventure_count'] = player_data.get('adventure_count', 0) + 1
 
-            # Item rewards
-            items_found = []
-            if roll_with_luck(self.user_id, 0.4):  # 40% chance
-                items_found = [random.choice(adventure_info['items'])]
+                left_behind = add_items(get_inventory(player_data), items_found)
 
-            # Update player data
-            player_data['coins'] = player_data.get('coins', 0) + coins_earned
-            player_data['xp'] = player_data.get('xp', 0) + xp_earned
-            player_data['adventure_count'] = player_data.get('adventure_count', 0) + 1
+                # Check for level up
+                return level_up_player(player_data), left_behind
 
-            if items_found:
-                inventory = player_data.get('inventory', [])
-                inventory.extend(items_found)
-                player_data['inventory'] = inventory
-
-            # Check for level up
-            level_up_msg = level_up_player(player_data)
-
-            update_user_rpg_data(self.user_id, player_data)
+            result = await adb.mutate_user_rpg_data(self.user_id, apply_rewards)
+            if result is None:
+                await interaction.followup.send("❌ Could not retrieve your data!", ephemeral=True)
+                return
+            _, (level_up_msg, left_behind) = result
 
             # Create result embed
             embed = discord.Embed(
@@ -2308,6 +2481,13 @@ class EnhancedAdventureView(discord.ui.View):
                     inline=True
                 )
 
+            if left_behind:
+                embed.add_field(
+                    name="🎒 Inventory Full",
+                    value="Left behind: " + ", ".join(left_behind),
+                    inline=False
+                )
+
             if level_up_msg:
                 embed.add_field(
                     name="📊 Level Up!",
@@ -2327,19 +2507,34 @@ class RPGGamesCog(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
 
+    async def cog_before_invoke(self, ctx):
+        """Track which guilds a player is active in for guild leaderboards."""
+        if ctx.guild:
+            await adb.add_guild_member(ctx.guild.id, str(ctx.author.id), players_only=True)
+
+    @commands.Cog.listener()
+    async def on_member_join(self, member: discord.Member):
+        """Add returning players to the guild's leaderboards."""
+        await adb.add_guild_member(member.guild.id, str(member.id), players_only=True)
+
+    @commands.Cog.listener()
+    async def on_member_remove(self, member: discord.Member):
+        """Drop departed members from the guild's leaderboards."""
+        await adb.remove_guild_member(member.guild.id, str(member.id))
+
     @commands.command(name='start', help='Begin your RPG adventure')
     async def start_command(self, ctx):
         """Start RPG adventure."""
-        if not is_module_enabled("rpg", ctx.guild.id):
+        if not await adb.is_module_enabled("rpg", ctx.guild.id):
             return
 
         user_id = str(ctx.author.id)
 
-        if get_user_rpg_data(user_id):
+        if await adb.get_user_rpg_data(user_id):
             await ctx.send("❌ You've already started your adventure! Use `$profile` to see your progress.")
             return
 
-        if create_user_profile(user_id):
+        if await adb.create_user_profile(user_id):
             embed = create_embed(
                 "🎉 Welcome to Your Epic Adventure!",
                 f"**{ctx.author.mention}, your journey begins now!**\n\n"
@@ -2361,15 +2556,15 @@ class RPGGamesCog(commands.Cog):
     @commands.command(name='class', help='Choose your character class (Level 5 required)')
     async def class_command(self, ctx, class_name: str = None):
         """Choose character class with level requirement."""
-        if not is_module_enabled("rpg", ctx.guild.id):
+        if not await adb.is_module_enabled("rpg", ctx.guild.id):
             return
 
         user_id = str(ctx.author.id)
-        if not ensure_user_exists(user_id):
+        if not await adb.ensure_user_exists(user_id):
             await ctx.send("❌ Start your adventure first with `$start`!")
             return
 
-        player_data = get_user_rpg_data(user_id)
+        player_data = await adb.get_user_rpg_data(user_id)
         if not player_data:
             await ctx.send("❌ Could not retrieve your data.")
             return
@@ -2411,24 +2606,33 @@ class RPGGamesCog(commands.Cog):
             await ctx.send(f"❌ Invalid class! Use `$class` to see available options.")
             return
 
-        if player_data.get('player_class'):
-            await ctx.send("❌ You already chose a class! Classes cannot be changed.")
-            return
-
-        # Assign class
         class_data = PLAYER_CLASSES[class_name]
-        player_data['player_class'] = class_name
-
-        # Update stats
         base_stats = class_data['base_stats']
-        player_data['max_hp'] = base_stats['hp']
-        player_data['hp'] = base_stats['hp']
-        player_data['attack'] = base_stats['attack']
-        player_data['defense'] = base_stats['defense']
-        player_data['max_mana'] = base_stats['mana']
-        player_data['mana'] = base_stats['mana']
 
-        update_user_rpg_data(user_id, player_data)
+        def assign_class(player_data):
+            if player_data.get('player_class'):
+                return False
+
+            # Assign class
+            player_data['player_class'] = class_name
+
+            # Update stats
+            player_data['max_hp'] = base_stats['hp']
+            player_data['hp'] = base_stats['hp']
+            player_data['attack'] = base_stats['attack']
+            player_data['defense'] = base_stats['defense']
+            player_data['max_mana'] = base_stats['mana']
+            player_data['mana'] = base_stats['mana']
+            return True
+
+        result = await adb.mutate_user_rpg_data(user_id, assign_class)
+        if result is None:
+            await ctx.send("❌ Could not retrieve your data.")
+            return
+
+        if not result[1]:
+            await ctx.send("❌ You already chose a class! Classes cannot be changed.")
+            return
 
         embed = create_embed(
             f"🎭 Class Selected: {class_data['name']}",
@@ -2444,11 +2648,11 @@ class RPGGamesCog(commands.Cog):
     @commands.command(name='skills', help='View your class abilities')
     async def skills_command(self, ctx):
         """View class skills and progression."""
-        if not is_module_enabled("rpg", ctx.guild.id):
+        if not await adb.is_module_enabled("rpg", ctx.guild.id):
             return
 
         user_id = str(ctx.author.id)
-        player_data = get_user_rpg_data(user_id)
+        player_data = await adb.get_user_rpg_data(user_id)
         if not player_data:
             await ctx.send("❌ Start your adventure first!")
             return
@@ -2508,11 +2712,11 @@ class RPGGamesCog(commands.Cog):
     @commands.cooldown(1, RPG_CONSTANTS['adventure_cooldown'], commands.BucketType.user)
     async def adventure_command(self, ctx):
         """Go on progressive adventures."""
-        if not is_module_enabled("rpg", ctx.guild.id):
+        if not await adb.is_module_enabled("rpg", ctx.guild.id):
             return
 
         user_id = str(ctx.author.id)
-        if not ensure_user_exists(user_id):
+        if not await adb.ensure_user_exists(user_id):
             await ctx.send("❌ Start your adventure first with `$start`!")
             return
 
@@ -2531,26 +2735,68 @@ class RPGGamesCog(commands.Cog):
     @commands.command(name='shop', help='Browse equipment and items')
     async def shop_command(self, ctx):
         """Browse the progressive shop."""
-        if not is_module_enabled("rpg", ctx.guild.id):
+        if not await adb.is_module_enabled("rpg", ctx.guild.id):
             return
 
         user_id = str(ctx.author.id)
-        if not ensure_user_exists(user_id):
+        if not await adb.ensure_user_exists(user_id):
             await ctx.send("❌ Start your adventure first with `$start`!")
             return
 
-        view = ProgressiveShopView(user_id)
+        player_data = await adb.get_user_rpg_data(user_id)
+        view = ProgressiveShopView(user_id, player_data)
         embed = view.create_shop_embed()
         await ctx.send(embed=embed, view=view)
 
+    @commands.command(name='lootbox', help='Open your lootboxes (lootbox [amount|all])')
+    async def lootbox_command(self, ctx, amount: str = None):
+        """Open lootboxes, one at a time or in bulk."""
+        if not await adb.is_module_enabled("rpg", ctx.guild.id):
+            return
+
+        user_id = str(ctx.author.id)
+        if not await adb.ensure_user_exists(user_id):
+            await ctx.send("❌ Start your adventure first with `$start`!")
+            return
+
+        if amount is not None:
+            if amount.lower() == "all":
+                count = LootboxView.MAX_BATCH
+            elif amount.isdigit() and int(amount) > 0:
+                count = min(int(amount), LootboxView.MAX_BATCH)
+            else:
+                await ctx.send("❌ Usage: `$lootbox [amount|all]`")
+                return
+
+            embed = await open_lootboxes(user_id, count)
+            if embed is None:
+                await ctx.send("❌ You don't have any lootboxes!")
+                return
+            await ctx.send(embed=embed)
+            return
+
+        player_data = await adb.get_user_rpg_data(user_id)
+        owned = get_inventory(player_data).get("Lootbox", 0) if player_data else 0
+        if not owned:
+            await ctx.send("❌ You don't have any lootboxes! Find them in the `$shop` (Level 25+).")
+            return
+
+        embed = create_embed(
+            "🎁 Lootboxes",
+            f"You have **{owned}** lootboxes.\n"
+            f"Open them one at a time, ten at once, or all together.",
+            COLORS['primary']
+        )
+        await ctx.send(embed=embed, view=LootboxView(user_id))
+
     @commands.command(name='pvp', help='Challenge another player (Level 5 required)')
     async def pvp_command(self, ctx, member: discord.Member, arena: str = "Training Ground"):
         """PvP with level requirements."""
-        if not is_module_enabled("rpg", ctx.guild.id):
+        if not await adb.is_module_enabled("rpg", ctx.guild.id):
             return
 
         user_id = str(ctx.author.id)
-        player_data = get_user_rpg_data(user_id)
+        player_data = await adb.get_user_rpg_data(user_id)
         if not player_data:
             await ctx.send("❌ Start your adventure first!")
             return
@@ -2566,11 +2812,11 @@ class RPGGamesCog(commands.Cog):
     @commands.command(name='profession', help='Learn crafting skills (Level 10 required)')
     async def profession_command(self, ctx, profession_name: str = None):
         """Choose profession with level gate."""
-        if not is_module_enabled("rpg", ctx.guild.id):
+        if not await adb.is_module_enabled("rpg", ctx.guild.id):
             return
 
         user_id = str(ctx.author.id)
-        player_data = get_user_rpg_data(user_id)
+        player_data = await adb.get_user_rpg_data(user_id)
         if not player_data:
             await ctx.send("❌ Start your adventure first!")
             return
@@ -2586,17 +2832,17 @@ class RPGGamesCog(commands.Cog):
     @commands.command(name='profile', help='View your character profile and progression')
     async def profile_command(self, ctx, member: Optional[discord.Member] = None):
         """Enhanced profile with progression info."""
-        if not is_module_enabled("rpg", ctx.guild.id):
+        if not await adb.is_module_enabled("rpg", ctx.guild.id):
             return
 
         target = member or ctx.author
         user_id = str(target.id)
 
-        if not ensure_user_exists(user_id):
+        if not await adb.ensure_user_exists(user_id):
             await ctx.send(f"❌ {target.display_name} hasn't started their adventure yet!")
             return
 
-        player_data = get_user_rpg_data(user_id)
+        player_data = await adb.get_user_rpg_data(user_id)
         if not player_data:
             await ctx.send("❌ Could not retrieve profile data.")
             return
@@ -2673,6 +2919,33 @@ class RPGGamesCog(commands.Cog):
         embed.set_footer(text="Use $adventure to gain experience and unlock new features!")
         await ctx.send(embed=embed)
 
+    @commands.command(name='leaderboard', aliases=['lb'], help='View the top players (level, coins, pvp_rating, stats.<name>) in this server or globally')
+    async def leaderboard_command(self, ctx, category: str = 'level', scope: str = 'server'):
+        """Show the top players in a category and your own rank."""
+        if not await adb.is_module_enabled("rpg", ctx.guild.id):
+            return
+
+        category = category.lower()
+        if category not in await adb.get_leaderboard_categories():
+            await ctx.send("❌ Unknown leaderboard! Try `level`, `coins`, `pvp_rating` or `stats.battles_won`.")
+            return
+
+        guild_id = None if scope.lower() == 'global' else ctx.guild.id
+        leaderboard = await adb.get_leaderboard(category, guild_id, 10)
+        for entry in leaderboard:
+            member = ctx.guild.get_member(int(entry['user_id'])) or self.bot.get_user(int(entry['user_id']))
+            entry['username'] = member.display_name if member else f"User {entry['user_id']}"
+
+        title = category.replace('stats.', '').replace('_', ' ').title()
+        where = "Global" if guild_id is None else ctx.guild.name
+        embed = create_leaderboard_display(leaderboard, f"{title} Leaderboard - {where}")
+
+        rank = await adb.get_leaderboard_rank(category, str(ctx.author.id), guild_id)
+        if rank:
+            embed.add_field(name="📍 Your Rank", value=f"#{rank:,}", inline=False)
+
+        await ctx.send(embed=embed)
+
 async def setup(bot):
     """Setup function for the cog."""
     await bot.add_cog(RPGGamesCog(bot))
\ No newline at end of file
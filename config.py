@@ -1,10 +1,15 @@
+import copy
 import discord
-from replit import db
 import logging
 import os
+import threading
 from typing import Dict, Any, Optional
 
+from utils.metrics import instrumented, watch_errors
+from utils.storage import get_storage
+
 logger = logging.getLogger(__name__)
+watch_errors(logger)
 
 # Bot configuration
 COLORS = {
@@ -40,57 +45,70 @@ EMOJIS = {
     'luck': '🍀'
 }
 
+# Per-guild server configs with defaults already merged, filled on first read
+# and kept current by update_server_config. Listeners read them on every
+# message, so a cached read must not touch storage.
+_server_configs: Dict[int, Dict[str, Any]] = {}
+_server_configs_lock = threading.Lock()
+
+def _load_server_config(guild_id: int) -> Dict[str, Any]:
+    """Read a server config from storage and merge in defaults."""
+    config = get_storage().get(f"server_config_{guild_id}", {})
+    for key, value in DEFAULT_SERVER_CONFIG.items():
+        if key not in config:
+            config[key] = copy.deepcopy(value)
+    return config
+
+def is_server_config_cached(guild_id: int) -> bool:
+    """Check whether a guild's server config can be read without storage I/O."""
+    return guild_id in _server_configs
+
+def get_cached_server_config(guild_id: int) -> Optional[Dict[str, Any]]:
+    """Get a copy of a cached server config without touching storage (None if not cached)."""
+    config = _server_configs.get(guild_id)
+    return copy.deepcopy(config) if config is not None else None
+
+@instrumented(key="server_config_{guild_id}")
 def get_server_config(guild_id: int) -> Dict[str, Any]:
     """Get server configuration from database."""
     try:
-        config_key = f"server_config_{guild_id}"
-        config = db.get(config_key, {})
-        
-        # Ensure default values exist
-        default_config = {
-            'prefix': '$',
-            'currency_name': 'coins',
-            'enabled_modules': {
-                'rpg': True,
-                'economy': True,
-                'moderation': True,
-                'ai_chatbot': True,
-                'admin': True
-            },
-            'ai_channels': [],
-            'mod_log_channel': None,
-            'auto_moderation': {
-                'enabled': True,
-                'spam_detection': True,
-                'inappropriate_content': True,
-                'max_warnings': 3
-            }
-        }
-        
-        # Merge with defaults
-        for key, value in default_config.items():
-            if key not in config:
-                config[key] = value
-                
-        return config
+        config = _server_configs.get(guild_id)
+        if config is None:
+            config = _load_server_config(guild_id)
+            with _server_configs_lock:
+                # Keep a config stored by a concurrent update
+                config = _server_configs.setdefault(guild_id, config)
+        return copy.deepcopy(config)
     except Exception as e:
         logger.error(f"Error getting server config for {guild_id}: {e}")
         return {}
 
+def invalidate_server_config(guild_id: int):
+    """Drop a cached server config so the next read reloads it."""
+    with _server_configs_lock:
+        _server_configs.pop(guild_id, None)
+
+@instrumented(key="server_config_{guild_id}", size="config")
 def update_server_config(guild_id: int, config: Dict[str, Any]) -> bool:
     """Update server configuration in database."""
     try:
         config_key = f"server_config_{guild_id}"
-        db[config_key] = config
+        get_storage().set(config_key, config)
+        with _server_configs_lock:
+            _server_configs[guild_id] = copy.deepcopy(config)
         return True
     except Exception as e:
         logger.error(f"Error updating server config for {guild_id}: {e}")
+        invalidate_server_config(guild_id)
         return False
 
+@instrumented()
 def is_module_enabled(module_name: str, guild_id: int) -> bool:
     """Check if a module is enabled for a guild."""
     try:
-        config = get_server_config(guild_id)
+        config = _server_configs.get(guild_id)
+        if config is None:
+            config = get_server_config(guild_id)
         return config.get('enabled_modules', {}).get(module_name, True)
     except Exception as e:
         logger.error(f"Error checking module status: {e}")
@@ -1,4 +1,5 @@
 import discord
+from discord import app_commands
 from discord.ext import commands
 import os
 import logging
@@ -7,7 +8,10 @@ from datetime import datetime
 import threading
 from web_server import run_web_server
 from config import COLORS, EMOJIS, get_server_config
-from utils.database import initialize_database
+from utils.database import initialize_database, replay_profile_journal, shutdown_database
+from utils.async_database import shutdown_executor
+from utils.metrics import command_context
+from utils.storage import close_storage
 from cogs.help import HelpView
 
 # Configure logging
@@ -27,7 +31,16 @@ intents.message_content = True
 intents.members = True
 intents.guilds = True
 
+class BotCommandTree(app_commands.CommandTree):
+    """Command tree that attributes storage metrics to the invoked slash command."""
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        if interaction.command is not None:
+            command_context(f"/{interaction.command.qualified_name}")
+        return True
+
 bot = commands.Bot(
+    tree_cls=BotCommandTree,
     command_prefix='$',
     intents=intents,
     help_command=None,  # We'll implement our own
@@ -87,6 +100,11 @@ async def on_ready():
         except Exception as e:
             logger.error(f"Error sending online message to {guild.name}: {e}")
 
+@bot.before_invoke
+async def track_command(ctx):
+    """Attribute storage metrics to the invoked prefix command."""
+    command_context(f"${ctx.command.qualified_name}")
+
 @bot.event
 async def on_disconnect():
     """Called when the bot disconnects."""
@@ -252,6 +270,9 @@ async def main():
     web_thread = threading.Thread(target=run_web_server, daemon=True)
     web_thread.start()
 
+    # Recover profile writes acknowledged before a crash
+    replay_profile_journal()
+
     # Load cogs
     await load_cogs()
 
@@ -270,6 +291,9 @@ async def main():
         logger.error(f"Bot error: {e}")
     finally:
         await bot.close()
+        shutdown_executor()
+        shutdown_database()
+        close_storage()
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
@@ -0,0 +1,65 @@
+"""
+Export or restore the bot's key-value store.
+
+Usage:
+  python scripts/backup.py export backups/full.jsonl.gz [--checkpoint backups/checkpoint.json.gz]
+  python scripts/backup.py export backups/incr.jsonl.gz --incremental --checkpoint backups/checkpoint.json.gz
+  python scripts/backup.py restore backups/full.jsonl.gz [--workers 4]
+
+The backend comes from STORAGE_BACKEND / SQLITE_DB_PATH, as for the bot.
+Restore while the bot is stopped: its caches would not see restored keys.
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.backup import DEFAULT_PAGE_SIZE, export_backup, restore_backup
+from utils.storage import close_storage, get_storage
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = subparsers.add_parser("export", help="Stream keys to a compressed JSONL backup")
+    export_parser.add_argument("path")
+    export_parser.add_argument("--prefix", action="append", dest="prefixes",
+                               help="Only export keys with this prefix (repeatable)")
+    export_parser.add_argument("--checkpoint", help="Checkpoint file to write (and read with --incremental)")
+    export_parser.add_argument("--incremental", action="store_true",
+                               help="Only export keys changed since the checkpoint")
+    export_parser.add_argument("--page-size", type=int, default=DEFAULT_PAGE_SIZE)
+    export_parser.add_argument("--pause", type=float, default=0.0,
+                               help="Seconds to sleep between pages when exporting from a live store")
+
+    restore_parser = subparsers.add_parser("restore", help="Replay a backup into the store")
+    restore_parser.add_argument("path")
+    restore_parser.add_argument("--workers", type=int, default=4)
+    restore_parser.add_argument("--batch-size", type=int, default=DEFAULT_PAGE_SIZE)
+
+    args = parser.parse_args()
+    storage = get_storage()
+    try:
+        if args.command == "export":
+            result = export_backup(
+                storage, args.path, prefixes=args.prefixes, checkpoint_path=args.checkpoint,
+                incremental=args.incremental, page_size=args.page_size, pause=args.pause,
+                progress=lambda done, total: print(f"\r{done}/{total} keys", end="", flush=True)
+            )
+            print(f"\nExported {result['written']} of {result['scanned']} keys "
+                  f"({result['deleted']} deletions, {result['bytes']} bytes) in {result['seconds']:.1f}s")
+        else:
+            result = restore_backup(
+                storage, args.path, workers=args.workers, batch_size=args.batch_size,
+                progress=lambda done: print(f"\r{done} records", end="", flush=True)
+            )
+            print(f"\nRestored {result['restored']} keys ({result['deleted']} deletions) "
+                  f"in {result['seconds']:.1f}s")
+    finally:
+        close_storage()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Compare stored profile size and encode/decode latency across serializations.
+
+Usage: python scripts/bench_codec.py [--ops 5000]
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.codec import profile_codec
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+def new_profile():
+    """A freshly created profile: every field at its default."""
+    profile = profile_codec.decode(profile_codec.encode({}))
+    profile["user_id"] = "123456789012345678"
+    profile["created_at"] = "2025-07-12T16:20:34.829000"
+    return profile
+
+
+def veteran_profile():
+    """A profile after some play: levels, items, stats and cooldowns set."""
+    profile = new_profile()
+    profile.update({
+        "level": 23, "xp": 1840, "max_xp": 2300, "hp": 310, "max_hp": 340,
+        "attack": 58, "defense": 31, "coins": 18250, "player_class": "warrior",
+        "inventory": {"Health Potion": 6, "Iron Sword": 6, "Lucky Charm": 6, "Mana Potion": 6},
+        "luck_points": 420, "adventure_count": 96, "work_count": 41, "daily_streak": 12,
+        "last_daily": "2025-07-20T08:00:00", "last_work": "2025-07-20T09:13:02",
+        "last_adventure": "2025-07-20T09:40:51", "pvp_rating": 1184, "pvp_wins": 14,
+        "achievements": ["first_blood", "treasure_hunter"],
+    })
+    profile["equipped"]["weapon"] = "Iron Sword"
+    profile["stats"].update({"battles_won": 61, "battles_lost": 9, "items_found": 44})
+    return profile
+
+
+def formats():
+    """Map format name to (encode, decode) callables producing/consuming bytes."""
+    result = {
+        "json": (lambda doc: json.dumps(doc).encode(), lambda raw: json.loads(raw)),
+        "compact-json": (
+            lambda doc: json.dumps(profile_codec.encode(doc), separators=(",", ":")).encode(),
+            lambda raw: profile_codec.decode(json.loads(raw)),
+        ),
+    }
+    if msgpack is not None:
+        result["msgpack"] = (msgpack.packb, msgpack.unpackb)
+        result["compact-msgpack"] = (
+            lambda doc: msgpack.packb(profile_codec.encode(doc)),
+            lambda raw: profile_codec.decode(msgpack.unpackb(raw)),
+        )
+    return result
+
+
+def time_us(operation, arg, ops: int):
+    """Time an operation over ops runs and return per-call samples in microseconds."""
+    samples = []
+    for _ in range(ops):
+        start = time.perf_counter()
+        operation(arg)
+        samples.append((time.perf_counter() - start) * 1e6)
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--ops", type=int, default=5000)
+    args = parser.parse_args()
+
+    if msgpack is None:
+        print("msgpack not installed; skipping msgpack formats")
+
+    for label, profile in (("new", new_profile()), ("veteran", veteran_profile())):
+        print(f"== {label} profile ({args.ops} ops) ==")
+        for name, (encode, decode) in formats().items():
+            raw = encode(profile)
+            assert decode(raw) == profile, f"{name} did not round-trip"
+            enc = time_us(encode, profile, args.ops)
+            dec = time_us(decode, raw, args.ops)
+            print(f"  {name:<16} bytes={len(raw):<5} "
+                  f"encode p50={statistics.median(enc):.1f}us decode p50={statistics.median(dec):.1f}us")
+
+
+if __name__ == "__main__":
+    main()
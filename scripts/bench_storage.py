@@ -0,0 +1,84 @@
+"""
+Benchmark storage backends against each other.
+
+Usage: python scripts/bench_storage.py [--backends sqlite replit] [--ops 500]
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.storage import create_backend
+
+SAMPLE_PROFILE = {
+    "user_id": "0",
+    "level": 12,
+    "xp": 340,
+    "coins": 4820,
+    "inventory": {"Health Potion": 5, "Iron Sword": 5, "Lucky Charm": 5},
+    "equipped": {"weapon": "Iron Sword", "armor": None, "accessory": None},
+    "stats": {"battles_won": 31, "battles_lost": 4, "items_found": 17},
+    "luck_points": 120,
+}
+
+
+def percentile(samples, pct):
+    """Get the pct-th percentile of a list of samples."""
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(len(ordered) * pct / 100))
+    return ordered[index]
+
+
+def run_benchmark(backend, ops: int):
+    """Time set/get/keys operations against a backend."""
+    results = {}
+    keys = [f"bench_user_rpg_{i}" for i in range(ops)]
+
+    for name, operation in (
+        ("set", lambda key: backend.set(key, SAMPLE_PROFILE)),
+        ("get", lambda key: backend.get(key)),
+    ):
+        samples = []
+        for key in keys:
+            start = time.perf_counter()
+            operation(key)
+            samples.append((time.perf_counter() - start) * 1000)
+        results[name] = samples
+
+    start = time.perf_counter()
+    backend.keys("bench_user_rpg_")
+    results["keys"] = [(time.perf_counter() - start) * 1000]
+
+    for key in keys:
+        backend.delete(key)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--backends", nargs="+", default=["sqlite"])
+    parser.add_argument("--ops", type=int, default=500)
+    args = parser.parse_args()
+
+    for name in args.backends:
+        options = {}
+        if name == "sqlite":
+            options["path"] = os.path.join(tempfile.mkdtemp(), "bench.sqlite3")
+        backend = create_backend(name, **options)
+        try:
+            results = run_benchmark(backend, args.ops)
+        finally:
+            backend.close()
+
+        print(f"== {name} ({args.ops} ops) ==")
+        for op, samples in results.items():
+            print(f"  {op:<5} mean={statistics.mean(samples):.3f}ms "
+                  f"p50={percentile(samples, 50):.3f}ms p99={percentile(samples, 99):.3f}ms")
+
+
+if __name__ == "__main__":
+    main()
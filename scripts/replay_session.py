@@ -0,0 +1,105 @@
+"""
+Re-execute recorded game sessions (lootbox openings, adventures, battles) offline.
+
+Every session draws its rolls from its own seeded stream and logs one
+"RNG session {...}" line with the seed, its inputs and its outcome. This
+tool replays those records and checks that the outcome comes out the same.
+
+Usage:
+  python scripts/replay_session.py bot.log [--kind lootbox] [--user 1234] [--seed 42]
+  python scripts/replay_session.py --record '{"kind": "lootbox", "user_id": "1", "seed": 42, ...}'
+  python scripts/replay_session.py bot.log --workers 8 --quiet
+
+Sessions are independent, so --workers replays them in parallel processes.
+PvP sessions are listed but can't be replayed offline. Exits with 1 if any
+replayed outcome differs from the recorded one.
+"""
+import argparse
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterator, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cogs.rpg_games import replay_session
+from utils.rng_system import SESSION_LOG_PREFIX
+
+
+def read_records(path: str) -> Iterator[Dict[str, Any]]:
+    """Yield the session records logged in a log file."""
+    with open(path, encoding="utf-8") as log:
+        for line in log:
+            _, found, payload = line.partition(SESSION_LOG_PREFIX)
+            if found:
+                yield json.loads(payload)
+
+
+def replay(record: Dict[str, Any]) -> Dict[str, Any]:
+    """Replay one record and compare with its logged outcome."""
+    # JSON round trip so the replay compares like the logged line (tuples as lists etc.)
+    replayed = replay_session(record)
+    if replayed is not None:
+        replayed = json.loads(json.dumps(replayed, sort_keys=True, default=str))
+    return {
+        "record": record,
+        "replayed": replayed,
+        "ok": replayed is None or replayed == record.get("outcome"),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("logs", nargs="*", help="Log files to read session records from")
+    parser.add_argument("--record", action="append", default=[], help="A session record as JSON (repeatable)")
+    parser.add_argument("--kind", help="Only replay sessions of this kind")
+    parser.add_argument("--user", help="Only replay sessions of this user ID")
+    parser.add_argument("--seed", type=int, help="Only replay the session with this seed")
+    parser.add_argument("--workers", type=int, default=1, help="Replay in this many processes")
+    parser.add_argument("--quiet", action="store_true", help="Only print mismatches and the summary")
+    args = parser.parse_args()
+
+    if not args.logs and not args.record:
+        parser.error("Give a log file or --record")
+
+    records: List[Dict[str, Any]] = [json.loads(record) for record in args.record]
+    for path in args.logs:
+        records.extend(read_records(path))
+    records = [
+        record for record in records
+        if (args.kind is None or record["kind"] == args.kind)
+        and (args.user is None or record["user_id"] == args.user)
+        and (args.seed is None or record["seed"] == args.seed)
+    ]
+
+    if args.workers > 1:
+        with ProcessPoolExecutor(max_workers=args.workers) as pool:
+            results = list(pool.map(replay, records, chunksize=64))
+    else:
+        results = [replay(record) for record in records]
+
+    mismatches = skipped = 0
+    for result in results:
+        record = result["record"]
+        label = f"{record['kind']} session of {record['user_id']} (seed {record['seed']})"
+        if result["replayed"] is None:
+            skipped += 1
+            if not args.quiet:
+                print(f"  SKIPPED {label}: not replayable offline")
+        elif result["ok"]:
+            if not args.quiet:
+                print(f"  OK {label}: {json.dumps(result['replayed'], sort_keys=True)}")
+        else:
+            mismatches += 1
+            print(f"  MISMATCH {label}")
+            print(f"    recorded: {json.dumps(record.get('outcome'), sort_keys=True)}")
+            print(f"    replayed: {json.dumps(result['replayed'], sort_keys=True)}")
+
+    print(f"Replayed {len(results) - skipped} sessions, {mismatches} mismatches, {skipped} skipped")
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.conversation_store import ConversationStore
+
+
+def message(n):
+    return {"role": "user", "content": f"message {n}"}
+
+
+class ConversationStoreEvictionTest(unittest.TestCase):
+    def setUp(self):
+        self.stored = {(1, 1): [message(n) for n in range(10)]}
+        self.writes = []
+        self.store = ConversationStore(
+            max_bytes=1, max_messages=20, flush_interval=0,
+            loader=lambda guild_id, user_id: list(self.stored.get((guild_id, user_id), [])),
+            writer=self.write,
+        )
+
+    def write(self, guild_id, user_id, messages):
+        self.writes.append((guild_id, user_id))
+        self.stored[(guild_id, user_id)] = list(messages)
+
+    def test_append_after_eviction_keeps_stored_history(self):
+        self.assertEqual(len(self.store.get(1, 1)), 10)
+        # Loading another user evicts the first one before its reply is appended
+        self.store.get(1, 2)
+        self.store.append(1, 1, message("reply"))
+        self.store.flush()
+        self.assertEqual(len(self.stored[(1, 1)]), 11)
+        self.assertEqual(self.stored[(1, 1)][-1], message("reply"))
+
+    def test_evicted_changes_are_written_by_flush_not_append(self):
+        self.store.get(1, 1)
+        self.store.append(1, 1, message("first"))
+        # Evicting the changed conversation must not write on the caller's thread
+        self.store.append(1, 2, message("other"))
+        self.assertEqual(self.writes, [])
+        # A reload before the flush sees the unwritten change
+        self.store.append(1, 1, message("second"))
+        self.store.flush()
+        self.assertEqual(self.stored[(1, 1)][-2:], [message("first"), message("second")])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,199 @@
+"""
+Awaitable twin of the utils.database API.
+
+Every storage call in utils.database and config is blocking. Cogs await these
+wrappers instead, which run the blocking call on a bounded thread pool so the
+gateway event loop keeps serving heartbeats and other users' interactions.
+"""
+import asyncio
+import contextvars
+import functools
+import logging
+import os
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import config
+from utils import database
+
+logger = logging.getLogger(__name__)
+
+_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("DB_THREAD_POOL_SIZE", 8)),
+    thread_name_prefix="db"
+)
+
+async def run_blocking(func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    """Run a blocking storage call on the database thread pool."""
+    loop = asyncio.get_running_loop()
+    # Carry context variables (the invoking command, for metrics) to the worker
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(_executor, functools.partial(context.run, func, *args, **kwargs))
+
+def _awaitable(func: Callable[..., Any]) -> Callable[..., Any]:
+    """Wrap a blocking function into a coroutine function with the same signature."""
+    @functools.wraps(func)
+    async def wrapper(*args: Any, **kwargs: Any) -> Any:
+        return await run_blocking(func, *args, **kwargs)
+    return wrapper
+
+# One lock per profile key, dropped once no coroutine holds a reference
+_profile_locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+def _profile_lock(user_id: str) -> asyncio.Lock:
+    """Get the in-process lock serializing mutations of one profile."""
+    lock = _profile_locks.get(user_id)
+    if lock is None:
+        lock = asyncio.Lock()
+        _profile_locks[user_id] = lock
+    return lock
+
+def shutdown_executor():
+    """Stop accepting new work and wait for in-flight storage calls."""
+    _executor.shutdown(wait=True)
+
+# Player profiles
+get_user_rpg_data = _awaitable(database.get_user_rpg_data)
+update_user_rpg_data = _awaitable(database.update_user_rpg_data)
+ensure_user_exists = _awaitable(database.ensure_user_exists)
+create_user_profile = _awaitable(database.create_user_profile)
+patch_user_rpg_data = _awaitable(database.patch_user_rpg_data)
+incr_user_rpg_field = _awaitable(database.incr_user_rpg_field)
+set_user_rpg_field = _awaitable(database.set_user_rpg_field)
+push_user_rpg_field = _awaitable(database.push_user_rpg_field)
+get_many_user_rpg_data = _awaitable(database.get_many_user_rpg_data)
+update_many_user_rpg_data = _awaitable(database.update_many_user_rpg_data)
+get_many = _awaitable(database.get_many)
+set_many = _awaitable(database.set_many)
+
+async def mutate_user_rpg_data(user_id: str, fn: Callable[[Dict[str, Any]], Any]) -> Optional[Tuple[Dict[str, Any], Any]]:
+    """Apply fn to user's RPG data under the profile lock (see database.mutate_user_rpg_data).
+
+    fn runs on the database thread pool, so it must not await or touch Discord.
+    """
+    async with _profile_lock(str(user_id)):
+        return await run_blocking(database.mutate_user_rpg_data, user_id, fn)
+
+async def mutate_many_user_rpg_data(mutations: Dict[str, Callable[[Dict[str, Any]], Any]]) -> Dict[str, Optional[Tuple[Dict[str, Any], Any]]]:
+    """Mutate several profiles, holding all of their locks for the duration.
+
+    Locks are taken in sorted key order so two multi-profile updates touching
+    the same players (a trade and a PvP payout, say) cannot deadlock.
+
+    This is not all-or-nothing: each profile is committed on its own. Every
+    profile is checked to exist before any is changed (otherwise nothing is
+    written and every result is None), but a later mutation that fails or
+    keeps conflicting leaves the earlier ones committed. Callers moving
+    value between players must be able to tolerate or undo that.
+    """
+    user_ids = sorted(str(user_id) for user_id in mutations)
+    locks = [_profile_lock(user_id) for user_id in user_ids]
+    for lock in locks:
+        await lock.acquire()
+    try:
+        profiles = await run_blocking(database.get_many_user_rpg_data, user_ids)
+        if not all(profiles.get(user_id) for user_id in user_ids):
+            return {user_id: None for user_id in mutations}
+
+        results = {}
+        for user_id, fn in mutations.items():
+            results[user_id] = await run_blocking(database.mutate_user_rpg_data, user_id, fn)
+        return results
+    finally:
+        for lock in reversed(locks):
+            lock.release()
+
+async def migrate_profiles(progress: Optional[Callable[[int, int, int], Any]] = None,
+                           batch_size: int = 200) -> Dict[str, int]:
+    """Upgrade every stored profile in batches without blocking the event loop.
+
+    progress(done, total, migrated) is awaited after each batch.
+    """
+    user_ids = await run_blocking(database.list_profile_ids)
+    total = len(user_ids)
+    migrated = 0
+    for start in range(0, total, batch_size):
+        batch = user_ids[start:start + batch_size]
+        result = await run_blocking(database.migrate_profiles, batch, None, batch_size, False)
+        migrated += result["migrated"]
+        if progress is not None:
+            await progress(start + len(batch), total, migrated)
+    if migrated:
+        await run_blocking(database.rebuild_leaderboard_index)
+    return {"total": total, "migrated": migrated}
+
+export_backup = _awaitable(database.export_backup)
+get_leaderboard = _awaitable(database.get_leaderboard)
+get_leaderboard_rank = _awaitable(database.get_leaderboard_rank)
+get_leaderboard_categories = _awaitable(database.get_leaderboard_categories)
+rebuild_leaderboard_index = _awaitable(database.rebuild_leaderboard_index)
+add_guild_member = _awaitable(database.add_guild_member)
+remove_guild_member = _awaitable(database.remove_guild_member)
+
+# Guilds and users
+get_guild_data = _awaitable(database.get_guild_data)
+update_guild_data = _awaitable(database.update_guild_data)
+get_user_data = _awaitable(database.get_user_data)
+update_user_data = _awaitable(database.update_user_data)
+
+# Moderation
+get_user_warnings = _awaitable(database.get_user_warnings)
+add_user_warning = _awaitable(database.add_user_warning)
+clear_user_warnings = _awaitable(database.clear_user_warnings)
+
+# AI conversations
+get_conversation_history = _awaitable(database.get_conversation_history)
+update_conversation_history = _awaitable(database.update_conversation_history)
+clear_conversation_history = _awaitable(database.clear_conversation_history)
+
+# Expiry of ephemeral keys (parties, quests, events, conversations, warnings)
+sweep_expired_keys = _awaitable(database.sweep_expired_keys)
+get_key_expiry_stats = _awaitable(database.get_key_expiry_stats)
+get_storage_stats = _awaitable(database.get_storage_stats)
+
+# Daily luck decay
+run_luck_decay = _awaitable(database.run_luck_decay)
+
+# RPG guilds, parties, quests and events
+get_guild_rpg_data = _awaitable(database.get_guild_rpg_data)
+update_guild_rpg_data = _awaitable(database.update_guild_rpg_data)
+create_guild_rpg_profile = _awaitable(database.create_guild_rpg_profile)
+get_party_data = _awaitable(database.get_party_data)
+update_party_data = _awaitable(database.update_party_data)
+create_party = _awaitable(database.create_party)
+get_quest_data = _awaitable(database.get_quest_data)
+update_quest_data = _awaitable(database.update_quest_data)
+get_world_event_data = _awaitable(database.get_world_event_data)
+update_world_event_data = _awaitable(database.update_world_event_data)
+
+# Auction house and seasons
+get_auction_listings = _awaitable(database.get_auction_listings)
+update_auction_listings = _awaitable(database.update_auction_listings)
+add_auction_listing = _awaitable(database.add_auction_listing)
+get_cheapest_auction_listing = _awaitable(database.get_cheapest_auction_listing)
+get_auction_listing = _awaitable(database.get_auction_listing)
+get_auction_item_names = _awaitable(database.get_auction_item_names)
+update_auction_listing = _awaitable(database.update_auction_listing)
+remove_auction_listing = _awaitable(database.remove_auction_listing)
+expire_auction_listings = _awaitable(database.expire_auction_listings)
+get_seasonal_data = _awaitable(database.get_seasonal_data)
+update_seasonal_data = _awaitable(database.update_seasonal_data)
+
+# Server configuration: cached configs are served on the event loop, only a
+# first read per guild goes to the thread pool
+async def get_server_config(guild_id: int) -> Dict[str, Any]:
+    """Get a guild's server config, loading it on the pool only on a cache miss."""
+    cached = config.get_cached_server_config(guild_id)
+    if cached is not None:
+        return cached
+    return await run_blocking(config.get_server_config, guild_id)
+
+async def is_module_enabled(module_name: str, guild_id: int) -> bool:
+    """Check if a module is enabled, without a thread hop once the config is cached."""
+    if config.is_server_config_cached(guild_id):
+        return config.is_module_enabled(module_name, guild_id)
+    return await run_blocking(config.is_module_enabled, module_name, guild_id)
+
+update_server_config = _awaitable(config.update_server_config)
+invalidate_server_config = config.invalidate_server_config
@@ -0,0 +1,237 @@
+"""
+Auction house listings stored one record per listing.
+
+Each listing lives under ``auction_listing_<id>``, so adding, buying or
+expiring a listing touches only that record. Two in-memory indexes are kept
+current by every write through this module:
+
+- a min-heap of ``(expires_at, listing_id)``, so expiring stale listings only
+  looks at the ones that are due;
+- a price-sorted index per item name, so browsing an item or finding its
+  cheapest listing reads just the listings on the requested page;
+- an expiry-sorted index over every listing, so browsing the whole house a
+  page at a time is O(log n + page) and reads just that page.
+
+Removing a listing claims it under the lock first, so when two buyers race
+for the same listing only one of them gets it.
+
+The indexes are built on first use from a paged scan of the listing records
+(and the old single ``auction_house`` list is split into records then).
+"""
+import heapq
+import logging
+import threading
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from utils.leaderboard import SortedIndex
+
+logger = logging.getLogger(__name__)
+
+LISTING_KEY_PREFIX = "auction_listing_"
+LEGACY_KEY = "auction_house"
+# Listings read per batch when building the indexes
+LOAD_BATCH_SIZE = 500
+
+
+def _expiry_timestamp(listing: Dict[str, Any]) -> float:
+    """Get a listing's expiry as a timestamp (listings without one never expire)."""
+    expires_at = listing.get("expires_at")
+    if not expires_at:
+        return float("inf")
+    try:
+        return datetime.fromisoformat(expires_at).timestamp()
+    except (TypeError, ValueError):
+        return float("inf")
+
+
+class AuctionHouse:
+    """Per-listing auction storage with expiry and price indexes."""
+
+    def __init__(self, storage: Callable[[], Any]):
+        self.storage = storage
+        self._lock = threading.RLock()
+        self._loaded = False
+        # listing_id -> (item_name, price, expires_at timestamp)
+        self._listings: Dict[str, Tuple[str, float, float]] = {}
+        # Prices and expiries are stored negated: SortedIndex ranks by descending score
+        self._prices: Dict[str, SortedIndex] = {}
+        self._by_expiry = SortedIndex()
+        # Entries are left in place on removal and skipped when popped
+        self._expiry: List[Tuple[float, str]] = []
+
+    def load(self) -> int:
+        """Build the indexes from stored listings; returns the active listing count."""
+        with self._lock:
+            if self._loaded:
+                return len(self._listings)
+
+            db = self.storage()
+            self._migrate_legacy(db)
+
+            keys = db.keys(LISTING_KEY_PREFIX)
+            for start in range(0, len(keys), LOAD_BATCH_SIZE):
+                for listing in db.get_many(keys[start:start + LOAD_BATCH_SIZE]).values():
+                    if listing.get("status", "active") == "active":
+                        self._index(listing)
+
+            self._loaded = True
+            logger.info(f"Loaded {len(self._listings)} active auction listings")
+            return len(self._listings)
+
+    def add(self, listing: Dict[str, Any]) -> None:
+        """Store a new listing and index it."""
+        self.load()
+        self.storage().set(self._key(listing["listing_id"]), listing)
+        with self._lock:
+            self._index(listing)
+
+    def update(self, listing: Dict[str, Any]) -> None:
+        """Rewrite one listing, re-indexing it (or dropping it once no longer active)."""
+        self.load()
+        self.storage().set(self._key(listing["listing_id"]), listing)
+        with self._lock:
+            self._unindex(listing["listing_id"])
+            if listing.get("status", "active") == "active":
+                self._index(listing)
+
+    def get(self, listing_id: str) -> Optional[Dict[str, Any]]:
+        """Get one listing."""
+        return self.storage().get(self._key(listing_id))
+
+    def remove(self, listing_id: str) -> Optional[Dict[str, Any]]:
+        """Claim and delete an active listing (sold or cancelled) and return it.
+
+        Returns None if the listing is not active, including when a concurrent
+        remove or expiry claimed it first.
+        """
+        self.load()
+        with self._lock:
+            if listing_id not in self._listings:
+                return None
+            self._unindex(listing_id)
+        db = self.storage()
+        listing = db.get(self._key(listing_id))
+        db.delete(self._key(listing_id))
+        return listing
+
+    def cheapest(self, item_name: str, limit: int = 1, offset: int = 0) -> List[Dict[str, Any]]:
+        """Get an item's active listings ordered by price, cheapest first."""
+        self.load()
+        self.expire()
+        with self._lock:
+            index = self._prices.get(item_name)
+            listing_ids = [listing_id for listing_id, _ in index.top(limit, offset)] if index else []
+        return self._read(listing_ids)
+
+    def all(self, limit: Optional[int] = None, offset: int = 0) -> List[Dict[str, Any]]:
+        """Get active listings soonest to expire first, reading only the requested page."""
+        self.load()
+        self.expire()
+        with self._lock:
+            count = len(self._by_expiry) if limit is None else limit
+            listing_ids = [listing_id for listing_id, _ in self._by_expiry.top(count, offset)]
+        return self._read(listing_ids)
+
+    def item_names(self) -> List[str]:
+        """List item names that have at least one active listing."""
+        self.load()
+        with self._lock:
+            return sorted(name for name, index in self._prices.items() if len(index))
+
+    def count(self, item_name: Optional[str] = None) -> int:
+        """Count active listings, overall or for one item."""
+        self.load()
+        with self._lock:
+            if item_name is None:
+                return len(self._listings)
+            index = self._prices.get(item_name)
+            return len(index) if index else 0
+
+    def expire(self, now: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Remove listings whose expiry has passed and return them."""
+        self.load()
+        now = datetime.now().timestamp() if now is None else now
+        due = []
+        with self._lock:
+            while self._expiry and self._expiry[0][0] <= now:
+                expires_at, listing_id = heapq.heappop(self._expiry)
+                current = self._listings.get(listing_id)
+                if current is None or current[2] != expires_at:
+                    continue
+                self._unindex(listing_id)
+                due.append(listing_id)
+        if not due:
+            return []
+
+        db = self.storage()
+        expired = self._read(due)
+        for listing_id in due:
+            db.delete(self._key(listing_id))
+        return expired
+
+    def replace_all(self, listings: List[Dict[str, Any]]) -> None:
+        """Replace the whole auction house with the given listings."""
+        self.load()
+        db = self.storage()
+        keep = {listing["listing_id"]: listing for listing in listings}
+        for key in db.keys(LISTING_KEY_PREFIX):
+            if key[len(LISTING_KEY_PREFIX):] not in keep:
+                db.delete(key)
+        db.set_many({self._key(listing_id): listing for listing_id, listing in keep.items()})
+        with self._lock:
+            self._listings.clear()
+            self._prices.clear()
+            self._by_expiry = SortedIndex()
+            self._expiry = []
+            for listing in keep.values():
+                if listing.get("status", "active") == "active":
+                    self._index(listing)
+
+    def _read(self, listing_ids: List[str]) -> List[Dict[str, Any]]:
+        """Read listings in one batch, keeping the given order."""
+        if not listing_ids:
+            return []
+        stored = self.storage().get_many([self._key(listing_id) for listing_id in listing_ids])
+        return [stored[self._key(listing_id)] for listing_id in listing_ids if self._key(listing_id) in stored]
+
+    def _migrate_legacy(self, db: Any) -> None:
+        """Split the old single-list auction house into per-listing records."""
+        legacy = db.get(LEGACY_KEY)
+        if legacy is None:
+            return
+        db.set_many({self._key(listing["listing_id"]): listing for listing in legacy})
+        db.delete(LEGACY_KEY)
+        logger.info(f"Moved {len(legacy)} auction listings to per-listing records")
+
+    def _index(self, listing: Dict[str, Any]) -> None:
+        """Add a listing to the indexes (lock held)."""
+        listing_id = listing["listing_id"]
+        item_name = listing.get("item_name", "")
+        price = listing.get("price", 0)
+        expires_at = _expiry_timestamp(listing)
+        self._listings[listing_id] = (item_name, price, expires_at)
+        self._prices.setdefault(item_name, SortedIndex()).set(listing_id, -price)
+        self._by_expiry.set(listing_id, -expires_at)
+        heapq.heappush(self._expiry, (expires_at, listing_id))
+
+    def _unindex(self, listing_id: str) -> None:
+        """Drop a listing from the indexes (lock held); its heap entry goes stale."""
+        current = self._listings.pop(listing_id, None)
+        if current is None:
+            return
+        self._by_expiry.discard(listing_id)
+        index = self._prices.get(current[0])
+        if index is not None:
+            index.discard(listing_id)
+            if not len(index):
+                del self._prices[current[0]]
+        if len(self._expiry) > 2 * len(self._listings) + 64:
+            # Too many stale heap entries; rebuild from the live listings
+            self._expiry = [(expires_at, listing_id)
+                            for listing_id, (_, _, expires_at) in self._listings.items()]
+            heapq.heapify(self._expiry)
+
+    @staticmethod
+    def _key(listing_id: str) -> str:
+        return f"{LISTING_KEY_PREFIX}{listing_id}"
@@ -0,0 +1,241 @@
+"""
+Streaming backup and restore of the key-value store.
+
+Backups are gzip-compressed JSONL: a header line, one ``{"key", "value"}``
+line per key and a footer with the record count. Keys are read in pages with
+``get_many`` and written out as they arrive, so memory stays bounded by the
+page size no matter how large the store is, and each page holds the storage
+lock only briefly while the bot keeps serving commands.
+
+Incremental exports compare a CRC32 of every value against a checkpoint
+written by the previous export, and only write keys that changed, plus
+tombstones (``{"key", "deleted": true}``) for keys that disappeared.
+
+Restores first stream the whole file once to check its header, footer and
+record count, so a truncated or corrupt backup is rejected before anything
+is written. They then replay it with a pool of writer threads, a bounded
+number of batches in flight at a time.
+"""
+import gzip
+import json
+import logging
+import os
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+DEFAULT_PAGE_SIZE = 500
+
+
+def _checksum(value: Any) -> int:
+    """CRC32 of a value's canonical JSON form."""
+    return zlib.crc32(json.dumps(value, sort_keys=True, separators=(",", ":")).encode())
+
+
+def load_checkpoint(path: str) -> Dict[str, int]:
+    """Load the key -> checksum map written by a previous export."""
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        return json.load(f)["checksums"]
+
+
+def _save_checkpoint(path: str, checksums: Dict[str, int], created_at: str) -> None:
+    tmp_path = f"{path}.tmp"
+    with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+        json.dump({"created_at": created_at, "checksums": checksums}, f)
+    os.replace(tmp_path, path)
+
+
+def _iter_keys(storage: Any, prefixes: Optional[List[str]]) -> Iterable[str]:
+    for prefix in prefixes or [""]:
+        yield from storage.keys(prefix)
+
+
+def _matches(key: str, prefixes: Optional[List[str]]) -> bool:
+    return not prefixes or any(key.startswith(prefix) for prefix in prefixes)
+
+
+def export_backup(storage: Any, path: str, prefixes: Optional[List[str]] = None,
+                  checkpoint_path: Optional[str] = None, incremental: bool = False,
+                  page_size: int = DEFAULT_PAGE_SIZE, pause: float = 0.0,
+                  progress: Optional[Callable[[int, int], Any]] = None) -> Dict[str, Any]:
+    """Stream keys to a compressed JSONL backup.
+
+    With a checkpoint path, a checkpoint of every exported key is written
+    afterwards; with incremental=True only keys changed since that
+    checkpoint are exported. pause sleeps between pages to leave the
+    storage backend to the live bot.
+    """
+    started = time.perf_counter()
+    created_at = datetime.now().isoformat()
+    previous: Dict[str, int] = {}
+    if incremental:
+        if not checkpoint_path or not os.path.exists(checkpoint_path):
+            raise ValueError("Incremental export needs an existing checkpoint")
+        previous = load_checkpoint(checkpoint_path)
+
+    keys = list(dict.fromkeys(_iter_keys(storage, prefixes)))
+    checksums: Dict[str, int] = {}
+    written = 0
+    deleted = 0
+
+    tmp_path = f"{path}.tmp"
+    with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+        f.write(json.dumps({
+            "type": "header",
+            "version": FORMAT_VERSION,
+            "created_at": created_at,
+            "prefixes": prefixes or [],
+            "incremental": incremental,
+        }) + "\n")
+
+        for start in range(0, len(keys), page_size):
+            page = storage.get_many(keys[start:start + page_size])
+            for key, value in page.items():
+                checksum = _checksum(value)
+                checksums[key] = checksum
+                if incremental and previous.get(key) == checksum:
+                    continue
+                f.write(json.dumps({"key": key, "value": value}, separators=(",", ":")) + "\n")
+                written += 1
+            if progress is not None:
+                progress(min(start + page_size, len(keys)), len(keys))
+            if pause:
+                time.sleep(pause)
+
+        if incremental:
+            for key in previous:
+                if key not in checksums and _matches(key, prefixes):
+                    f.write(json.dumps({"key": key, "deleted": True}) + "\n")
+                    deleted += 1
+
+        f.write(json.dumps({"type": "footer", "records": written + deleted}) + "\n")
+    os.replace(tmp_path, path)
+
+    if checkpoint_path:
+        if incremental:
+            # Keys outside the exported prefixes keep their previous checksum
+            merged = {key: value for key, value in previous.items() if not _matches(key, prefixes)}
+            merged.update(checksums)
+            checksums = merged
+        _save_checkpoint(checkpoint_path, checksums, created_at)
+
+    elapsed = time.perf_counter() - started
+    logger.info(f"Exported {written} keys ({deleted} deletions) to {path} in {elapsed:.1f}s")
+    return {
+        "path": path,
+        "scanned": len(keys),
+        "written": written,
+        "deleted": deleted,
+        "bytes": os.path.getsize(path),
+        "seconds": elapsed,
+    }
+
+
+def verify_backup(path: str) -> Dict[str, Any]:
+    """Check a backup's header, footer and record count without writing anything.
+
+    Raises ValueError if the file is not a complete, readable backup.
+    """
+    records = 0
+    footer = None
+    try:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            header = json.loads(f.readline())
+            if header.get("type") != "header" or header.get("version") != FORMAT_VERSION:
+                raise ValueError(f"{path} is not a version {FORMAT_VERSION} backup")
+            for line in f:
+                record = json.loads(line)
+                if footer is not None:
+                    raise ValueError(f"{path} has records after its footer")
+                if record.get("type") == "footer":
+                    footer = record
+                elif "key" not in record or ("value" not in record and not record.get("deleted")):
+                    raise ValueError(f"{path} has a malformed record after {records} records")
+                else:
+                    records += 1
+    except (OSError, EOFError, UnicodeDecodeError, json.JSONDecodeError) as e:
+        raise ValueError(f"{path} is unreadable after {records} records: {e}") from e
+
+    if footer is None:
+        raise ValueError(f"{path} is truncated (no footer)")
+    if footer.get("records") != records:
+        raise ValueError(f"{path} has {records} records, footer says {footer.get('records')}")
+    return {"path": path, "header": header, "records": records}
+
+def restore_backup(storage: Any, path: str, workers: int = 4, batch_size: int = DEFAULT_PAGE_SIZE,
+                   progress: Optional[Callable[[int], Any]] = None) -> Dict[str, Any]:
+    """Replay a backup into storage with parallel batched writes.
+
+    The file is verified first (see verify_backup), so a damaged backup
+    raises ValueError before any key is written. Restore incremental backups
+    in order, after the full backup they build on.
+    """
+    started = time.perf_counter()
+    verify_backup(path)
+    # Bound the batches queued for the workers so memory stays flat
+    slots = threading.Semaphore(workers * 2)
+    errors: List[Exception] = []
+    restored = 0
+    deleted = 0
+    footer = None
+
+    def write_batch(values: Dict[str, Any], deletions: List[str]) -> None:
+        try:
+            if values:
+                storage.set_many(values)
+            for key in deletions:
+                storage.delete(key)
+        except Exception as e:
+            errors.append(e)
+            logger.error(f"Error restoring batch: {e}")
+        finally:
+            slots.release()
+
+    def submit(pool: ThreadPoolExecutor, values: Dict[str, Any], deletions: List[str]) -> None:
+        slots.acquire()
+        pool.submit(write_batch, values, deletions)
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="restore") as pool:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            header = json.loads(f.readline())
+            if header.get("type") != "header" or header.get("version") != FORMAT_VERSION:
+                raise ValueError(f"{path} is not a version {FORMAT_VERSION} backup")
+
+            values: Dict[str, Any] = {}
+            deletions: List[str] = []
+            for line in f:
+                record = json.loads(line)
+                if record.get("type") == "footer":
+                    footer = record
+                    break
+                # Each key appears once per backup, so batches can land in any order
+                if record.get("deleted"):
+                    deletions.append(record["key"])
+                    deleted += 1
+                else:
+                    values[record["key"]] = record["value"]
+                    restored += 1
+                if len(values) + len(deletions) >= batch_size:
+                    submit(pool, values, deletions)
+                    values, deletions = {}, []
+                    if progress is not None:
+                        progress(restored + deleted)
+            if values or deletions:
+                submit(pool, values, deletions)
+
+    if footer is None:
+        raise ValueError(f"{path} is truncated (no footer)")
+    if footer["records"] != restored + deleted:
+        raise ValueError(f"{path} has {restored + deleted} records, footer says {footer['records']}")
+    if errors:
+        raise RuntimeError(f"{len(errors)} batches failed to restore; first error: {errors[0]}")
+
+    elapsed = time.perf_counter() - started
+    logger.info(f"Restored {restored} keys ({deleted} deletions) from {path} in {elapsed:.1f}s")
+    return {"path": path, "restored": restored, "deleted": deleted, "seconds": elapsed}
@@ -0,0 +1,528 @@
+"""
+Write-back LRU cache used in front of the storage backend.
+
+Reads are served from memory after the first load. Writes only mark the entry
+dirty; a background thread coalesces dirty entries and writes them to storage
+every ``flush_interval`` seconds. Dirty entries are also written when evicted
+and when the cache is stopped.
+
+Field-level patches are applied to the cached value immediately and queued;
+an entry that only carries patches is flushed with the backend's ``patch``
+instead of a full document write. A full write supersedes queued patches.
+
+An optional ``upgrader`` migrates values as they are loaded; an upgraded
+value is cached dirty so the next flush writes the new form back.
+
+Every load and write stamps the entry with a new version taken from a
+cache-wide counter, so ``put_if_version`` can reject a write based on a stale
+read even if the entry was evicted and reloaded in between.
+
+An optional ``on_change`` hook sees every new value, in cache order, while the
+change is made (for a write-ahead journal); whatever it returns marks the
+change. After a flush that left nothing unwritten, ``on_persisted`` is called
+with the mark of the last change that flush covered.
+"""
+import copy
+import itertools
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from utils.patch import PatchOp, apply_patch
+
+logger = logging.getLogger(__name__)
+
+# Marker for keys known not to exist in storage
+_ABSENT = object()
+
+
+class _Entry:
+    """A cached value with its dirty state and queued patch ops."""
+
+    __slots__ = ("value", "dirty", "ops", "generation")
+
+    def __init__(self, value: Any, generation: int, dirty: bool = False):
+        self.value = value
+        self.dirty = dirty
+        self.ops: List[PatchOp] = []
+        self.generation = generation
+
+    @property
+    def pending(self) -> bool:
+        return self.dirty or bool(self.ops)
+
+
+class WriteBackCache:
+    """Bounded LRU cache with dirty tracking and periodic background flush."""
+
+    def __init__(self, loader: Callable[[str], Any], writer: Callable[[str, Any], None],
+                 max_entries: int = 1000, flush_interval: float = 5.0, name: str = "cache",
+                 after_flush: Optional[Callable[[], Any]] = None,
+                 patcher: Optional[Callable[[str, List[PatchOp]], bool]] = None,
+                 upgrader: Optional[Callable[[Any], bool]] = None,
+                 loader_many: Optional[Callable[[List[str]], Dict[str, Any]]] = None,
+                 on_change: Optional[Callable[[str, Any], Any]] = None,
+                 on_persisted: Optional[Callable[[Any], Any]] = None):
+        self.loader = loader
+        self.loader_many = loader_many
+        self.writer = writer
+        self.patcher = patcher
+        self.upgrader = upgrader
+        self.after_flush = after_flush
+        self.on_change = on_change
+        self.on_persisted = on_persisted
+        self.max_entries = max(1, max_entries)
+        self.flush_interval = flush_interval
+        self.name = name
+
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        # Evicted values still on their way to storage; reloads read these
+        self._evicting: Dict[str, Any] = {}
+        self._lock = threading.RLock()
+        # Serializes storage writes so queued patch ops are never sent twice
+        self._write_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._flush_thread: Optional[threading.Thread] = None
+        self._versions = itertools.count(1)
+        # What on_change returned for the most recent change
+        self._change_mark: Any = None
+
+        self.hits = 0
+        self.misses = 0
+        self.writes_coalesced = 0
+        self.flushed = 0
+        self.patches_flushed = 0
+        self.version_conflicts = 0
+        self.upgraded = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        """Get a copy of the cached value, loading it from storage on a miss."""
+        return self.get_versioned(key)[0]
+
+    def get_versioned(self, key: str) -> Tuple[Optional[Any], int]:
+        """Get a copy of the cached value together with its current version."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._copy_value(entry), entry.generation
+            self.misses += 1
+
+            if key in self._evicting:
+                # Storage doesn't have this value yet, so the entry stays dirty
+                entry = _Entry(self._evicting[key], next(self._versions), dirty=True)
+                self._entries[key] = entry
+                evicted = self._evict_overflow()
+                result = self._copy_value(entry), entry.generation
+            else:
+                result = None
+
+        if result is not None:
+            self._write_evicted(evicted)
+            return result
+
+        value = self.loader(key)
+        upgraded = self._upgrade(key, value)
+
+        with self._lock:
+            # A write may have raced with the load; it always wins
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = _Entry(_ABSENT if value is None else value, next(self._versions), dirty=upgraded)
+                self._entries[key] = entry
+                evicted = self._evict_overflow()
+            else:
+                evicted = []
+            result = self._copy_value(entry), entry.generation
+
+        self._write_evicted(evicted)
+        return result
+
+    def get_many(self, keys: List[str]) -> Dict[str, Optional[Any]]:
+        """Get copies of several values, loading every miss with one batched read.
+
+        Keys that don't exist map to None.
+        """
+        results: Dict[str, Optional[Any]] = {}
+        missing = []
+        with self._lock:
+            for key in dict.fromkeys(keys):
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    results[key] = self._copy_value(entry)
+                    continue
+                self.misses += 1
+                if key in self._evicting:
+                    entry = _Entry(self._evicting[key], next(self._versions), dirty=True)
+                    self._entries[key] = entry
+                    results[key] = self._copy_value(entry)
+                else:
+                    missing.append(key)
+            evicted = self._evict_overflow()
+        self._write_evicted(evicted)
+
+        if not missing:
+            return results
+
+        if self.loader_many is not None:
+            loaded = self.loader_many(missing)
+        else:
+            loaded = {key: self.loader(key) for key in missing}
+        upgraded = {key: self._upgrade(key, loaded.get(key)) for key in missing}
+
+        with self._lock:
+            for key in missing:
+                # A write may have raced with the load; it always wins
+                entry = self._entries.get(key)
+                if entry is None:
+                    value = loaded.get(key)
+                    entry = _Entry(_ABSENT if value is None else value, next(self._versions),
+                                   dirty=upgraded[key])
+                    self._entries[key] = entry
+                results[key] = self._copy_value(entry)
+            evicted = self._evict_overflow()
+        self._write_evicted(evicted)
+        return results
+
+    def put(self, key: str, value: Any) -> None:
+        """Store a value and mark it dirty for the next flush."""
+        value = copy.deepcopy(value)
+        with self._lock:
+            evicted = self._store(key, value)
+
+        self._write_evicted(evicted)
+        self._ensure_flusher()
+
+    def put_many(self, items: Dict[str, Any]) -> None:
+        """Store several values and mark them dirty for the next flush."""
+        items = copy.deepcopy(items)
+        with self._lock:
+            evicted = []
+            for key, value in items.items():
+                evicted.extend(self._store(key, value))
+
+        self._write_evicted(evicted)
+        self._ensure_flusher()
+
+    def put_if_version(self, key: str, value: Any, version: int) -> bool:
+        """Store a value only if the entry is still at the given version."""
+        value = copy.deepcopy(value)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.generation != version:
+                self.version_conflicts += 1
+                return False
+            evicted = self._store(key, value)
+
+        self._write_evicted(evicted)
+        self._ensure_flusher()
+        return True
+
+    def patch(self, key: str, ops: List[PatchOp], version: Optional[int] = None) -> Optional[Any]:
+        """Apply patch ops to a cached document and queue them for the next flush.
+
+        Returns a copy of the patched document, or None if the key does not
+        exist or (when version is given) the entry has moved past that version.
+        """
+        ops = copy.deepcopy(ops)
+        while True:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    if entry.value is _ABSENT:
+                        return None
+                    if version is not None and entry.generation != version:
+                        self.version_conflicts += 1
+                        return None
+
+                    apply_patch(entry.value, ops)
+                    if not entry.dirty:
+                        # A pending full write already carries the change
+                        if entry.ops:
+                            self.writes_coalesced += 1
+                        entry.ops.extend(ops)
+                    entry.generation = next(self._versions)
+                    self._entries.move_to_end(key)
+                    self._changed(key, entry.value)
+                    result = copy.deepcopy(entry.value)
+                    break
+
+            if version is not None:
+                self.version_conflicts += 1
+                return None
+            # Load outside the lock, then retry in case it was evicted meanwhile
+            if self.get_versioned(key)[0] is None:
+                return None
+
+        self._ensure_flusher()
+        return result
+
+    def rewrite(self, key: str) -> bool:
+        """Upgrade a stored value that is not cached and write it straight back.
+
+        Returns True if the value was rewritten. Cached keys are skipped: they
+        were upgraded when loaded and their flush writes the new form.
+        """
+        if self.upgrader is None:
+            return False
+        with self._write_lock:
+            with self._lock:
+                if key in self._entries or key in self._evicting:
+                    return False
+            # Holding the write lock keeps a concurrent flush of a freshly
+            # loaded copy ordered after this write
+            value = self.loader(key)
+            if not self._upgrade(key, value):
+                return False
+            self.writer(key, value)
+            return True
+
+    def patch_stored(self, keys: List[str], compute: Callable[[Any], Optional[List[PatchOp]]]) -> int:
+        """Patch many documents with the ops compute() derives from each current value.
+
+        Cached documents are patched in the cache and flushed as usual. The
+        rest are read in one batch and patched straight in storage without
+        being cached, so a pass over every key leaves the working set alone.
+        compute returns None (or no ops) to leave a document unchanged.
+        Returns how many documents were changed.
+        """
+        changed = 0
+        with self._lock:
+            cached = [key for key in keys if key in self._entries or key in self._evicting]
+        for key in cached:
+            while True:
+                value, version = self.get_versioned(key)
+                ops = compute(value) if value is not None else None
+                if not ops:
+                    break
+                if self.patch(key, ops, version=version) is not None:
+                    changed += 1
+                    break
+                # Changed since it was read; compute again from the new value
+
+        with self._write_lock:
+            with self._lock:
+                stored = [key for key in keys if key not in self._entries and key not in self._evicting]
+            if self.loader_many is not None:
+                values = self.loader_many(stored)
+            else:
+                values = {key: self.loader(key) for key in stored}
+            for key, value in values.items():
+                if value is None:
+                    continue
+                self._upgrade(key, value)
+                ops = compute(value)
+                if not ops:
+                    continue
+                apply_patch(value, ops)
+                self._write(key, value, ops)
+                changed += 1
+                with self._lock:
+                    # A copy loaded while this was written is stale; reload it next time
+                    entry = self._entries.get(key)
+                    if entry is not None and not entry.pending:
+                        del self._entries[key]
+        return changed
+
+    def invalidate(self, key: str) -> None:
+        """Drop a key from the cache without writing it."""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def flush(self) -> int:
+        """Write all pending entries to storage and return how many were written."""
+        written = 0
+        failed = 0
+        with self._write_lock:
+            with self._lock:
+                mark = self._change_mark
+                pending: List[Tuple[str, Any, Optional[List[PatchOp]], int]] = [
+                    (key, copy.deepcopy(entry.value),
+                     None if entry.dirty else list(entry.ops), entry.generation)
+                    for key, entry in self._entries.items() if entry.pending
+                ]
+
+            for key, value, ops, generation in pending:
+                try:
+                    self._write(key, value, ops)
+                except Exception as e:
+                    logger.error(f"Error flushing {key} from {self.name}: {e}")
+                    failed += 1
+                    continue
+
+                written += 1
+                with self._lock:
+                    entry = self._entries.get(key)
+                    if entry is None:
+                        continue
+                    # Only clear what was written; newer changes stay pending
+                    if entry.generation == generation:
+                        entry.dirty = False
+                        entry.ops = []
+                    elif ops is not None and not entry.dirty:
+                        del entry.ops[:len(ops)]
+
+        self.flushed += written
+
+        # Retry evicted values whose write failed earlier
+        with self._lock:
+            leftover = list(self._evicting)
+        self._write_evicted(leftover)
+
+        # Everything changed up to the snapshot is in storage unless a write failed
+        if self.on_persisted is not None and mark is not None and not failed:
+            with self._lock:
+                clean = not self._evicting
+            if clean:
+                try:
+                    self.on_persisted(mark)
+                except Exception as e:
+                    logger.error(f"Error in {self.name} persisted hook: {e}")
+
+        # Let derived state (indexes built from these values) persist alongside
+        if self.after_flush is not None:
+            try:
+                self.after_flush()
+            except Exception as e:
+                logger.error(f"Error in {self.name} after-flush hook: {e}")
+        return written
+
+    def stop(self) -> int:
+        """Stop the background flusher and write any remaining dirty entries."""
+        self._stop_event.set()
+        thread = self._flush_thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout=self.flush_interval + 5)
+        self._flush_thread = None
+        return self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        """Get cache statistics."""
+        with self._lock:
+            dirty = sum(1 for entry in self._entries.values() if entry.dirty)
+            patched = sum(1 for entry in self._entries.values() if entry.ops and not entry.dirty)
+            size = len(self._entries)
+        return {
+            "size": size,
+            "max_entries": self.max_entries,
+            "dirty": dirty,
+            "patched": patched,
+            "hits": self.hits,
+            "misses": self.misses,
+            "writes_coalesced": self.writes_coalesced,
+            "flushed": self.flushed,
+            "patches_flushed": self.patches_flushed,
+            "version_conflicts": self.version_conflicts,
+            "upgraded": self.upgraded,
+        }
+
+    def _upgrade(self, key: str, value: Any) -> bool:
+        """Run the upgrader on a freshly loaded value; True if it changed."""
+        if value is None or self.upgrader is None:
+            return False
+        try:
+            upgraded = self.upgrader(value)
+        except Exception as e:
+            logger.error(f"Error upgrading {key} in {self.name}: {e}")
+            return False
+        if upgraded:
+            self.upgraded += 1
+        return upgraded
+
+    def _copy_value(self, entry: _Entry) -> Optional[Any]:
+        """Return a private copy of an entry's value (None for absent keys)."""
+        return None if entry.value is _ABSENT else copy.deepcopy(entry.value)
+
+    def _changed(self, key: str, value: Any) -> None:
+        """Report a new value to the on_change hook (lock held)."""
+        if self.on_change is not None:
+            self._change_mark = self.on_change(key, value)
+
+    def _store(self, key: str, value: Any) -> List[str]:
+        """Write a value into the cache and bump its version (lock held)."""
+        self._changed(key, value)
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = _Entry(value, next(self._versions), dirty=True)
+            self._entries[key] = entry
+        else:
+            if entry.pending:
+                self.writes_coalesced += 1
+            entry.value = value
+            entry.dirty = True
+            entry.ops = []
+            entry.generation = next(self._versions)
+            self._entries.move_to_end(key)
+        return self._evict_overflow()
+
+    def _write(self, key: str, value: Any, ops: Optional[List[PatchOp]]) -> None:
+        """Send one entry to storage as a patch if possible, else in full (write lock held)."""
+        if ops is not None and self.patcher is not None:
+            if self.patcher(key, ops):
+                self.patches_flushed += 1
+                return
+            # The stored document is missing or not patchable; write it in full
+        self.writer(key, value)
+
+    def _evict_overflow(self) -> List[str]:
+        """Evict least recently used entries past the size bound (lock held)."""
+        evicted = []
+        while len(self._entries) > self.max_entries:
+            key, entry = self._entries.popitem(last=False)
+            if entry.pending:
+                self._evicting[key] = entry.value
+                evicted.append(key)
+        return evicted
+
+    def _write_evicted(self, evicted: List[str]) -> None:
+        """Persist pending entries that were evicted (outside the lock).
+
+        Evicted entries are always written in full: a flush that snapshotted
+        the same entry may already have sent its queued ops.
+        """
+        if not evicted:
+            return
+        with self._write_lock:
+            for key in evicted:
+                with self._lock:
+                    value = self._evicting.get(key)
+                    if value is None:
+                        continue
+                    if key in self._entries:
+                        # Reloaded meanwhile; the live dirty entry carries this value
+                        del self._evicting[key]
+                        continue
+                try:
+                    self.writer(key, value)
+                    self.flushed += 1
+                except Exception as e:
+                    logger.error(f"Error writing evicted {key} from {self.name}: {e}")
+                    continue
+                with self._lock:
+                    if self._evicting.get(key) is value:
+                        del self._evicting[key]
+
+    def _ensure_flusher(self) -> None:
+        """Start the background flush thread if it is not running."""
+        if self._flush_thread is not None or self.flush_interval <= 0:
+            return
+        with self._lock:
+            if self._flush_thread is not None:
+                return
+            self._stop_event.clear()
+            self._flush_thread = threading.Thread(
+                target=self._flush_loop, name=f"{self.name}-flusher", daemon=True
+            )
+            self._flush_thread.start()
+
+    def _flush_loop(self) -> None:
+        """Flush dirty entries every flush_interval seconds until stopped."""
+        while not self._stop_event.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Error in {self.name} flush loop: {e}")
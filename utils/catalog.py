@@ -0,0 +1,176 @@
+"""
+Unified, read-only catalog of every item defined in utils/constants.py.
+
+Item data lives in several tables (WEAPONS, ARMOR, OMNIPOTENT_ITEM keyed by
+name; SHOP_ITEMS, ENHANCED_WEAPONS, ENHANCED_CONSUMABLES keyed by an id with
+a ``name`` field). The catalog is compiled from them once at import:
+
+- every item gets a small integer ID, in table order, and is stored as an
+  immutable ``CatalogItem``;
+- indexes by source table, category, rarity, class requirement and name map
+  to sorted ID tuples, and level requirements are kept sorted for bisection;
+- ``find`` answers filtered queries by intersecting index entries and
+  memoizes the result, since the catalog never changes.
+
+IDs are only stable within a process; stored data (inventories, equipment)
+keeps referring to items by name.
+"""
+import bisect
+from types import MappingProxyType
+from typing import Any, Dict, Iterable, List, Mapping, NamedTuple, Optional, Tuple, Union
+
+from utils.constants import (
+    ARMOR, ENHANCED_CONSUMABLES, ENHANCED_WEAPONS, OMNIPOTENT_ITEM, SHOP_ITEMS, WEAPONS
+)
+
+Filter = Union[None, str, Iterable[str]]
+
+# (source, table, category for tables whose entries don't declare one)
+SOURCES = (
+    ("weapons", WEAPONS, "weapons"),
+    ("armor", ARMOR, "armor"),
+    ("artifacts", OMNIPOTENT_ITEM, "artifacts"),
+    ("shop", SHOP_ITEMS, None),
+    ("enhanced_weapons", ENHANCED_WEAPONS, None),
+    ("enhanced_consumables", ENHANCED_CONSUMABLES, None),
+)
+
+
+class CatalogItem(NamedTuple):
+    """One compiled catalog entry; data is a read-only view of its source record."""
+    id: int
+    source: str
+    key: str
+    name: str
+    category: str
+    rarity: str
+    level_requirement: int
+    class_req: Optional[str]
+    price: int
+    data: Mapping[str, Any]
+
+
+class ItemCatalog:
+    """Frozen item catalog with precomputed lookup indexes."""
+
+    def __init__(self, sources=SOURCES):
+        items: List[CatalogItem] = []
+        for source, table, default_category in sources:
+            for key, record in table.items():
+                items.append(CatalogItem(
+                    id=len(items),
+                    source=source,
+                    key=key,
+                    name=record.get("name", key),
+                    category=record.get("category", default_category),
+                    rarity=record.get("rarity", "common"),
+                    level_requirement=record.get("level_requirement", 1),
+                    class_req=record.get("class_req"),
+                    price=record.get("price", 0),
+                    data=MappingProxyType(dict(record)),
+                ))
+        self._items: Tuple[CatalogItem, ...] = tuple(items)
+
+        self._by_key = MappingProxyType({(item.source, item.key): item.id for item in items})
+        # First definition wins when tables share a name (e.g. a shop copy of a weapon)
+        by_name: Dict[str, int] = {}
+        for item in items:
+            by_name.setdefault(item.name, item.id)
+        self._by_name = MappingProxyType(by_name)
+
+        self._indexes = MappingProxyType({
+            field: self._index(items, field)
+            for field in ("source", "category", "rarity", "class_req", "name")
+        })
+        ordered = sorted(items, key=lambda item: (item.level_requirement, item.id))
+        self._levels = tuple(item.level_requirement for item in ordered)
+        self._level_ids = tuple(item.id for item in ordered)
+        self._queries: Dict[Tuple[Any, ...], Tuple[CatalogItem, ...]] = {}
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __iter__(self):
+        return iter(self._items)
+
+    def get(self, item_id: int) -> CatalogItem:
+        """Get an item by its ID."""
+        return self._items[item_id]
+
+    def lookup(self, source: str, key: str) -> Optional[CatalogItem]:
+        """Get an item by its key in a source table, such as ("shop", "weapon_001")."""
+        item_id = self._by_key.get((source, key))
+        return None if item_id is None else self._items[item_id]
+
+    def id_of(self, name: str) -> Optional[int]:
+        """Get the ID of the item with a display name."""
+        return self._by_name.get(name)
+
+    def by_name(self, name: str) -> Optional[CatalogItem]:
+        """Get an item by its display name."""
+        item_id = self._by_name.get(name)
+        return None if item_id is None else self._items[item_id]
+
+    def rarity_of(self, name: str, default: str = "common") -> str:
+        """Get the rarity of a named item."""
+        item = self.by_name(name)
+        return default if item is None else item.rarity
+
+    def find(self, source: Filter = None, category: Filter = None, rarity: Filter = None,
+             class_req: Filter = None, name: Filter = None, min_level: Optional[int] = None,
+             max_level: Optional[int] = None) -> Tuple[CatalogItem, ...]:
+        """Get items matching every given filter, in catalog order.
+
+        String filters accept one value or several; level bounds apply to
+        the level requirement and are inclusive.
+        """
+        filters = (
+            ("source", _values(source)),
+            ("category", _values(category)),
+            ("rarity", _values(rarity)),
+            ("class_req", _values(class_req)),
+            ("name", _values(name)),
+        )
+        query = filters + ((min_level, max_level),)
+        cached = self._queries.get(query)
+        if cached is not None:
+            return cached
+
+        selected: Optional[set] = None
+        for field, values in filters:
+            if values is None:
+                continue
+            index = self._indexes[field]
+            ids = set()
+            for value in values:
+                ids.update(index.get(value, ()))
+            selected = ids if selected is None else selected & ids
+        if min_level is not None or max_level is not None:
+            start = 0 if min_level is None else bisect.bisect_left(self._levels, min_level)
+            end = len(self._levels) if max_level is None else bisect.bisect_right(self._levels, max_level)
+            ids = set(self._level_ids[start:end])
+            selected = ids if selected is None else selected & ids
+
+        result = self._items if selected is None else tuple(self._items[i] for i in sorted(selected))
+        self._queries[query] = result
+        return result
+
+    @staticmethod
+    def _index(items: List[CatalogItem], field: str) -> Mapping[Any, Tuple[int, ...]]:
+        """Group item IDs by the value of a field."""
+        groups: Dict[Any, List[int]] = {}
+        for item in items:
+            groups.setdefault(getattr(item, field), []).append(item.id)
+        return MappingProxyType({value: tuple(ids) for value, ids in groups.items()})
+
+
+def _values(value: Filter) -> Optional[Tuple[str, ...]]:
+    """Normalize a filter to a sorted tuple (hashable for the query cache)."""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        return (value,)
+    return tuple(sorted(value))
+
+
+catalog = ItemCatalog()
@@ -0,0 +1,253 @@
+"""
+Compact, schema-versioned encoding for stored documents.
+
+Profiles are mostly default values, and every record repeats the same ~60
+field names. The encoded form interns schema field names to short base-36
+ids, drops fields that hold an empty default (None, 0, "", [] or {}) and tags
+the document with its schema version under ``~``:
+
+    {"~": 1, "0": "1234", "1": 7, "a": 2500, "b": ["Iron Sword"]}
+
+Only empty defaults are dropped because that is what a patch assumes for a
+missing field (``incr`` starts from 0, ``push`` from []). Non-empty defaults
+such as ``coins: 100`` are always stored.
+
+It is still a JSON object, so both backends store it as-is and SQLite can
+keep applying field-level patches with JSON paths (see ``encode_ops``).
+Documents without the version tag are legacy plain JSON and decode
+unchanged. Decoding fills in every schema default, so unsetting a schema
+field reads back as its default.
+
+Field ids are positional: append new fields to the end of a schema, or add a
+new version, but never reorder an existing one.
+"""
+import copy
+from typing import Any, Dict, List, Optional, Tuple
+
+from utils.patch import PatchOp, split_path
+
+VERSION_KEY = "~"
+# Prefix for non-schema field names that could be mistaken for ids
+_ESCAPE = "!"
+_DIGITS = "0123456789abcdefghijklmnopqrstuvwxyz"
+
+
+def _is_empty(value: Any) -> bool:
+    """Check whether a default is the value patches assume for a missing field."""
+    if value is None or isinstance(value, bool):
+        return value is None
+    if isinstance(value, (int, float)):
+        return value == 0
+    return value in ("", [], {})
+
+
+class Nested:
+    """Schema for an object-valued field whose own fields are interned too."""
+
+    def __init__(self, fields: List[Tuple[str, Any]]):
+        self.fields = fields
+
+
+def _field_id(index: int) -> str:
+    """Base-36 id for a field position."""
+    if index == 0:
+        return "0"
+    digits = ""
+    while index:
+        index, rem = divmod(index, 36)
+        digits = _DIGITS[rem] + digits
+    return digits
+
+
+class _Schema:
+    """Lookup tables for one level of a versioned schema."""
+
+    def __init__(self, fields: List[Tuple[str, Any]]):
+        self.fields = fields
+        self.ids: Dict[str, str] = {}
+        self.names: Dict[str, str] = {}
+        self.defaults: Dict[str, Any] = {}
+        self.omittable: Dict[str, Any] = {}
+        self.nested: Dict[str, "_Schema"] = {}
+        for index, (name, default) in enumerate(fields):
+            field_id = _field_id(index)
+            self.ids[name] = field_id
+            self.names[field_id] = name
+            if isinstance(default, Nested):
+                self.nested[name] = _Schema(default.fields)
+            else:
+                self.defaults[name] = default
+                if _is_empty(default):
+                    self.omittable[name] = default
+
+    def encode_key(self, name: str) -> str:
+        field_id = self.ids.get(name)
+        if field_id is not None:
+            return field_id
+        if name in self.names or name.startswith(_ESCAPE) or name == VERSION_KEY:
+            return _ESCAPE + name
+        return name
+
+    def decode_key(self, key: str) -> str:
+        name = self.names.get(key)
+        if name is not None:
+            return name
+        return key[len(_ESCAPE):] if key.startswith(_ESCAPE) else key
+
+    def encode(self, document: Dict[str, Any]) -> Dict[str, Any]:
+        encoded = {}
+        for name, value in document.items():
+            nested = self.nested.get(name)
+            if nested is not None and isinstance(value, dict):
+                value = nested.encode(value)
+                if not value:
+                    continue
+            elif name in self.omittable and value == self.omittable[name] and type(value) is type(self.omittable[name]):
+                continue
+            encoded[self.encode_key(name)] = value
+        return encoded
+
+    def decode(self, encoded: Dict[str, Any]) -> Dict[str, Any]:
+        document = {}
+        for name, default in self.fields:
+            if isinstance(default, Nested):
+                document[name] = self.nested[name].decode({})
+            elif isinstance(default, (list, dict)):
+                document[name] = copy.deepcopy(default) if default else type(default)()
+            else:
+                document[name] = default
+        for key, value in encoded.items():
+            if key == VERSION_KEY:
+                continue
+            name = self.decode_key(key)
+            nested = self.nested.get(name)
+            if nested is not None and isinstance(value, dict):
+                value = nested.decode(value)
+            document[name] = value
+        return document
+
+
+class DocumentCodec:
+    """Encode and decode documents against a set of versioned schemas."""
+
+    def __init__(self, versions: Dict[int, List[Tuple[str, Any]]]):
+        self.schemas = {version: _Schema(fields) for version, fields in versions.items()}
+        self.version = max(self.schemas)
+
+    def is_encoded(self, stored: Any) -> bool:
+        """Check whether a stored value is in the compact form."""
+        return isinstance(stored, dict) and VERSION_KEY in stored
+
+    def is_current(self, stored: Any) -> bool:
+        """Check whether a stored value is in the compact form of the newest schema."""
+        return self.is_encoded(stored) and stored[VERSION_KEY] == self.version
+
+    def encode(self, document: Dict[str, Any]) -> Dict[str, Any]:
+        """Convert a plain document into its compact stored form."""
+        encoded = self.schemas[self.version].encode(document)
+        encoded[VERSION_KEY] = self.version
+        return encoded
+
+    def decode(self, stored: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """Convert a stored value back to a plain document (legacy values pass through)."""
+        if not self.is_encoded(stored):
+            return stored
+        version = stored[VERSION_KEY]
+        schema = self.schemas.get(version)
+        if schema is None:
+            raise ValueError(f"Unknown document schema version {version}")
+        return schema.decode(stored)
+
+    def encode_ops(self, ops: List[PatchOp]) -> List[PatchOp]:
+        """Rewrite patch ops written against plain documents for the compact form.
+
+        Only valid for documents already stored at the current version.
+        """
+        encoded_ops = []
+        for op, path, value in ops:
+            schema: Optional[_Schema] = self.schemas[self.version]
+            parts = []
+            for name in split_path(path):
+                if schema is None:
+                    parts.append(name)
+                    continue
+                parts.append(schema.encode_key(name))
+                schema = schema.nested.get(name)
+            if schema is not None and op == "set" and isinstance(value, dict):
+                # Replacing a whole nested object: store it compact as well
+                value = schema.encode(value)
+            encoded_ops.append((op, ".".join(parts), value))
+        return encoded_ops
+
+
+# Player profile schema, in the order fields were introduced
+PROFILE_SCHEMA_V1: List[Tuple[str, Any]] = [
+    ("user_id", None),
+    ("level", 1),
+    ("xp", 0),
+    ("max_xp", 100),
+    ("hp", 100),
+    ("max_hp", 100),
+    ("attack", 10),
+    ("defense", 5),
+    ("mana", 50),
+    ("max_mana", 50),
+    ("coins", 100),
+    # item name -> quantity; stored as a list of names before profile schema v2
+    ("inventory", {}),
+    ("materials", {}),
+    ("equipped", Nested([
+        ("weapon", None),
+        ("armor", None),
+        ("accessory", None),
+    ])),
+    ("player_class", None),
+    ("profession", None),
+    ("profession_level", 0),
+    ("profession_xp", 0),
+    ("faction", None),
+    ("prestige_level", 0),
+    ("legacy_modifiers", []),
+    ("achievements", []),
+    ("titles", []),
+    ("active_title", None),
+    ("stats", Nested([
+        ("battles_won", 0),
+        ("battles_lost", 0),
+        ("items_found", 0),
+        ("bosses_defeated", 0),
+        ("quests_completed", 0),
+        ("items_crafted", 0),
+        ("materials_gathered", 0),
+        ("cheese_consumed", 0),
+        ("dragons_defeated", 0),
+        ("kwami_quests", 0),
+    ])),
+    ("adventure_count", 0),
+    ("work_count", 0),
+    ("daily_streak", 0),
+    ("last_daily", None),
+    ("last_work", None),
+    ("last_adventure", None),
+    ("last_craft", None),
+    ("last_gather", None),
+    ("last_quest", None),
+    ("luck_points", 0),
+    ("status_effects", {}),
+    ("active_quests", []),
+    ("completed_quests", []),
+    ("party_id", None),
+    ("guild_id", None),
+    ("pvp_rating", 1000),
+    ("pvp_wins", 0),
+    ("pvp_losses", 0),
+    ("world_event_contributions", {}),
+    ("seasonal_progress", {}),
+    ("housing", None),
+    ("pets", []),
+    ("created_at", ""),
+    ("schema_version", 0),
+    ("last_luck_decay", None),
+]
+
+profile_codec = DocumentCodec({1: PROFILE_SCHEMA_V1})
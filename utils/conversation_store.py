@@ -0,0 +1,276 @@
+"""
+Bounded in-memory store for AI chat conversations.
+
+Conversations are kept in LRU order under a global memory budget (an
+estimate of the bytes held by message text). Conversations idle for longer
+than ``idle_ttl`` are dropped as well, so memory stays flat no matter how
+many users have ever chatted.
+
+With a loader and writer the store also persists conversations write-behind:
+changed conversations are written by a background flush and on stop, and a
+conversation that is not in memory is loaded on first access (by ``get`` or
+``append``), so warm users keep their context across restarts. Changed
+conversations evicted from memory are held for the next flush, and loads see
+them before storage does, so no append ever starts from stale history.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+ConversationKey = Tuple[int, int]
+
+# Rough per-message overhead of the dict, role and timestamp strings
+_MESSAGE_OVERHEAD = 200
+
+
+def _message_size(message: Dict[str, Any]) -> int:
+    return len(message.get("content", "")) + _MESSAGE_OVERHEAD
+
+
+class _Conversation:
+    """Messages of one conversation with their accounting state."""
+
+    __slots__ = ("messages", "size", "last_access", "dirty")
+
+    def __init__(self, messages: List[Dict[str, Any]]):
+        self.messages = messages
+        self.size = sum(_message_size(message) for message in messages)
+        self.last_access = time.monotonic()
+        self.dirty = False
+
+
+class ConversationStore:
+    """LRU + idle-TTL conversation store with a memory budget."""
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, idle_ttl: float = 3600.0,
+                 max_messages: int = 20,
+                 loader: Optional[Callable[[int, int], List[Dict[str, Any]]]] = None,
+                 writer: Optional[Callable[[int, int, List[Dict[str, Any]]], Any]] = None,
+                 deleter: Optional[Callable[[int, int], Any]] = None,
+                 flush_interval: float = 30.0, name: str = "conversations"):
+        self.max_bytes = max_bytes
+        self.idle_ttl = idle_ttl
+        self.max_messages = max_messages
+        self.loader = loader
+        self.writer = writer
+        self.deleter = deleter
+        self.flush_interval = flush_interval
+        self.name = name
+
+        self._conversations: "OrderedDict[ConversationKey, _Conversation]" = OrderedDict()
+        self._bytes = 0
+        # Changed conversations evicted from memory, kept until the flusher writes them
+        self._unwritten: Dict[ConversationKey, List[Dict[str, Any]]] = {}
+        self._lock = threading.RLock()
+        self._stop_event = threading.Event()
+        self._flush_thread: Optional[threading.Thread] = None
+
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        self.expired = 0
+        self.written = 0
+
+    @property
+    def persistent(self) -> bool:
+        return self.loader is not None and self.writer is not None
+
+    def get_cached(self, guild_id: int, user_id: int) -> Optional[List[Dict[str, Any]]]:
+        """Get a copy of a conversation if it is in memory.
+
+        Returns None on a miss when the store is persistent (call ``get`` off
+        the event loop to load it), and [] for unknown users otherwise.
+        """
+        key = (guild_id, user_id)
+        with self._lock:
+            conversation = self._touch(key)
+            if conversation is not None:
+                self.hits += 1
+                return list(conversation.messages)
+        return None if self.persistent else []
+
+    def get(self, guild_id: int, user_id: int) -> List[Dict[str, Any]]:
+        """Get a copy of a conversation, loading it from storage on a miss."""
+        cached = self.get_cached(guild_id, user_id)
+        if cached is not None:
+            return cached
+
+        key = (guild_id, user_id)
+        messages = self._load(key)
+        with self._lock:
+            # An append may have raced with the load; it wins
+            conversation = self._conversations.get(key)
+            if conversation is None:
+                conversation = _Conversation(messages)
+                self._conversations[key] = conversation
+                self._bytes += conversation.size
+                self._evict()
+            return list(conversation.messages)
+
+    def append(self, guild_id: int, user_id: int, message: Dict[str, Any]) -> None:
+        """Add a message, keeping only the last max_messages of the conversation.
+
+        A conversation that is no longer in memory (evicted or idle since it
+        was read) is loaded first, so call this off the event loop when the
+        store is persistent.
+        """
+        key = (guild_id, user_id)
+        stored = None if self.persistent else []
+        while True:
+            with self._lock:
+                conversation = self._touch(key)
+                if conversation is None and stored is not None:
+                    conversation = self._conversations[key] = _Conversation(stored)
+                    self._bytes += conversation.size
+                if conversation is not None:
+                    conversation.messages.append(message)
+                    conversation.size += _message_size(message)
+                    self._bytes += _message_size(message)
+                    while len(conversation.messages) > self.max_messages:
+                        removed = _message_size(conversation.messages.pop(0))
+                        conversation.size -= removed
+                        self._bytes -= removed
+                    conversation.dirty = True
+                    self._evict()
+                    break
+            # Append to the stored history, never to an empty one
+            stored = self._load(key)
+        self._ensure_flusher()
+
+    def clear(self, guild_id: int, user_id: int) -> None:
+        """Forget a conversation, in memory and in storage."""
+        with self._lock:
+            conversation = self._conversations.pop((guild_id, user_id), None)
+            if conversation is not None:
+                self._bytes -= conversation.size
+            self._unwritten.pop((guild_id, user_id), None)
+        if self.deleter is not None:
+            self.deleter(guild_id, user_id)
+
+    def flush(self) -> int:
+        """Write every changed conversation and drop idle ones; returns how many were written."""
+        with self._lock:
+            self._evict()
+            pending = list(self._unwritten.items())
+            for key, conversation in self._conversations.items():
+                if conversation.dirty:
+                    conversation.dirty = False
+                    pending.append((key, list(conversation.messages)))
+        return self._write(pending)
+
+    def stop(self) -> int:
+        """Stop the background flusher and write remaining changes."""
+        self._stop_event.set()
+        thread = self._flush_thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout=self.flush_interval + 5)
+        self._flush_thread = None
+        return self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        """Get store statistics."""
+        with self._lock:
+            return {
+                "conversations": len(self._conversations),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evicted": self.evicted,
+                "unwritten": len(self._unwritten),
+                "expired": self.expired,
+                "written": self.written,
+            }
+
+    def _touch(self, key: ConversationKey) -> Optional[_Conversation]:
+        """Get a live conversation and mark it most recently used (lock held)."""
+        conversation = self._conversations.get(key)
+        if conversation is None:
+            return None
+        now = time.monotonic()
+        if now - conversation.last_access > self.idle_ttl:
+            # Expired but not swept yet; treat as gone once its changes are written
+            if conversation.dirty:
+                conversation.last_access = now
+            else:
+                del self._conversations[key]
+                self._bytes -= conversation.size
+                self.expired += 1
+                return None
+        conversation.last_access = now
+        self._conversations.move_to_end(key)
+        return conversation
+
+    def _load(self, key: ConversationKey) -> List[Dict[str, Any]]:
+        """Load a conversation that is not in memory (call without the lock held)."""
+        with self._lock:
+            self.misses += 1
+            unwritten = self._unwritten.get(key)
+            if unwritten is not None:
+                return list(unwritten)
+        return (self.loader(*key) or [])[-self.max_messages:]
+
+    def _evict(self) -> None:
+        """Drop idle conversations and LRU ones past the budget (lock held).
+
+        Changed ones are handed to the next flush instead of being written here.
+        """
+        now = time.monotonic()
+        while self._conversations:
+            key, conversation = next(iter(self._conversations.items()))
+            idle = now - conversation.last_access > self.idle_ttl
+            # Always keep the most recently used conversation
+            if not idle and (self._bytes <= self.max_bytes or len(self._conversations) == 1):
+                break
+            del self._conversations[key]
+            self._bytes -= conversation.size
+            if idle:
+                self.expired += 1
+            else:
+                self.evicted += 1
+            if conversation.dirty and self.writer is not None:
+                self._unwritten[key] = conversation.messages
+
+    def _write(self, pending: List[Tuple[ConversationKey, List[Dict[str, Any]]]]) -> int:
+        """Persist conversations outside the lock."""
+        if self.writer is None:
+            return 0
+        written = 0
+        for key, messages in pending:
+            try:
+                self.writer(key[0], key[1], messages)
+                written += 1
+            except Exception as e:
+                logger.error(f"Error writing conversation {key[0]}_{key[1]} from {self.name}: {e}")
+                continue
+            with self._lock:
+                # Loads read the held copy until it is in storage
+                if self._unwritten.get(key) is messages:
+                    del self._unwritten[key]
+        self.written += written
+        return written
+
+    def _ensure_flusher(self) -> None:
+        """Start the background flush thread if persistence is on and it is not running."""
+        if self._flush_thread is not None or self.writer is None or self.flush_interval <= 0:
+            return
+        with self._lock:
+            if self._flush_thread is not None:
+                return
+            self._stop_event.clear()
+            self._flush_thread = threading.Thread(
+                target=self._flush_loop, name=f"{self.name}-flusher", daemon=True
+            )
+            self._flush_thread.start()
+
+    def _flush_loop(self) -> None:
+        """Flush every flush_interval seconds until stopped."""
+        while not self._stop_event.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Error in {self.name} flush loop: {e}")
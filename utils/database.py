@@ -1,63 +1,456 @@
+import atexit
+import copy
 import logging
-from typing import Dict, Any, Optional, List
-from replit import db
+import os
+from typing import Dict, Any, Optional, List, Callable, Tuple
 import json
-from datetime import datetime
+from datetime import datetime, timedelta
+
+from utils import backup
+from utils.auction import AuctionHouse
+from utils.cache import WriteBackCache
+from utils.codec import profile_codec
+from utils.constants import RPG_CONSTANTS
+from utils.expiry import ExpiryIndex
+from utils.journal import WriteAheadJournal
+from utils.leaderboard import GuildLeaderboards, LeaderboardIndex
+from utils.luck_decay import LuckDecayJob
+from utils.metrics import instrumented, watch_errors
+from utils.migrations import profile_migrations
+from utils.patch import PatchOp, diff, incr, push, set_field
+from utils.storage import get_storage
 
 logger = logging.getLogger(__name__)
+watch_errors(logger)
+
+# Sorted per-category leaderboard indexes, updated on every profile write
+leaderboard_index = LeaderboardIndex(get_storage)
+guild_leaderboards = GuildLeaderboards(get_storage, leaderboard_index)
+
+# Auction listings, one record each, with expiry and per-item price indexes
+auction_house = AuctionHouse(get_storage)
+
+DAY = 24 * 60 * 60
+
+# Ephemeral records are deleted this many seconds after their last write
+KEY_TTLS = {
+    "party_": 30 * DAY,
+    "quest_": 30 * DAY,
+    "world_event_": 60 * DAY,
+    "conversation_": 30 * DAY,
+    "warnings_": 180 * DAY,
+}
+
+key_expiry = ExpiryIndex(get_storage, KEY_TTLS)
+
+def _write_expiring(key: str, value: Any):
+    """Write a key that has a TTL, pushing back its expiry first."""
+    # Touch before writing so a sweep racing with this write can't delete it
+    key_expiry.touch(key)
+    get_storage().set(key, value)
+
+def _delete_expiring(key: str):
+    """Delete a key that has a TTL and stop tracking it."""
+    get_storage().delete(key)
+    key_expiry.forget(key)
+
+def _flush_indexes():
+    """Persist leaderboard, guild membership and key expiry indexes."""
+    leaderboard_index.flush()
+    guild_leaderboards.flush()
+    key_expiry.flush()
+
+def _reindex_profile(user_id: str, data: Optional[Dict[str, Any]]):
+    """Re-rank a player after a profile write."""
+    leaderboard_index.update(user_id, data)
+    guild_leaderboards.update(user_id)
+
+# Profiles still stored as legacy plain JSON; their patches can't be sent in
+# compact form, so they are written in full once instead.
+_legacy_profiles = set()
+
+def _decode_profile(key: str, stored: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Decode a stored profile, noting whether it is still in legacy form."""
+    if profile_codec.is_current(stored):
+        _legacy_profiles.discard(key)
+    elif stored is not None:
+        _legacy_profiles.add(key)
+    return profile_codec.decode(stored)
+
+def _load_profile(key: str) -> Optional[Dict[str, Any]]:
+    """Read and decode a stored profile."""
+    return _decode_profile(key, get_storage().get(key))
+
+def _load_profiles(keys: List[str]) -> Dict[str, Dict[str, Any]]:
+    """Read and decode several stored profiles in one batch."""
+    stored = get_storage().get_many(keys)
+    return {key: _decode_profile(key, value) for key, value in stored.items()}
+
+def _store_profile(key: str, data: Dict[str, Any]):
+    """Write a full profile in compact form."""
+    get_storage().set(key, profile_codec.encode(data))
+    _legacy_profiles.discard(key)
+
+def _patch_profile(key: str, ops: List[PatchOp]) -> bool:
+    """Apply field-level ops to a stored compact profile."""
+    if key in _legacy_profiles:
+        return False
+    return get_storage().patch(key, profile_codec.encode_ops(ops))
+
+# Write-ahead journal for profile changes the cache has not flushed yet, so
+# acknowledged writes survive a crash. Records are the encoded profile.
+profile_journal = None
+if os.getenv("JOURNAL_ENABLED", "true").lower() in ("1", "true", "yes"):
+    profile_journal = WriteAheadJournal(
+        os.getenv("JOURNAL_DIR", "journal"),
+        segment_bytes=int(float(os.getenv("JOURNAL_SEGMENT_MB", 16)) * 1024 * 1024),
+        sync_interval=float(os.getenv("JOURNAL_SYNC_INTERVAL", 0.005)),
+        name="profile-journal"
+    )
+
+def _journal_profile(key: str, data: Dict[str, Any]) -> int:
+    """Append a profile change to the journal; returns its sequence number."""
+    return profile_journal.append(key, profile_codec.encode(data))
+
+def _checkpoint_journal(seq: int):
+    """Drop journal segments the cache has flushed to storage."""
+    profile_journal.checkpoint(seq)
+
+def _acknowledge():
+    """Wait until journaled profile changes are on disk before reporting success."""
+    if profile_journal is not None:
+        profile_journal.wait()
+
+# Write-back cache for player profiles: one store read per hot user, writes
+# are coalesced and flushed in the background.
+profile_cache = WriteBackCache(
+    loader=_load_profile,
+    loader_many=_load_profiles,
+    writer=_store_profile,
+    patcher=_patch_profile,
+    upgrader=profile_migrations.upgrade,
+    max_entries=int(os.getenv("PROFILE_CACHE_SIZE", 5000)),
+    flush_interval=float(os.getenv("PROFILE_CACHE_FLUSH_INTERVAL", 5)),
+    name="profile-cache",
+    after_flush=_flush_indexes,
+    on_change=_journal_profile if profile_journal is not None else None,
+    on_persisted=_checkpoint_journal if profile_journal is not None else None
+)
+
+# Daily luck decay over every profile, patched in pages
+luck_decay = LuckDecayJob(get_storage, profile_cache, rate=RPG_CONSTANTS['luck_decay'])
+
+def flush_profile_cache() -> int:
+    """Write all pending profile changes to storage."""
+    try:
+        return profile_cache.flush()
+    except Exception as e:
+        logger.error(f"Error flushing profile cache: {e}")
+        return 0
+
+def shutdown_database():
+    """Stop background writers and flush pending changes."""
+    try:
+        # Stop before the cache so its patches are in the final flush
+        luck_decay.stop()
+        written = profile_cache.stop()
+        logger.info(f"Flushed {written} cached profiles on shutdown")
+        key_expiry.stop()
+        if profile_journal is not None:
+            profile_journal.close()
+    except Exception as e:
+        logger.error(f"Error shutting down database: {e}")
+
+atexit.register(shutdown_database)
+
+def replay_profile_journal() -> int:
+    """Write journaled profile changes that may not have reached storage; returns how many.
+
+    Run once at startup, before anything writes profiles.
+    """
+    if profile_journal is None:
+        return 0
+    try:
+        position = profile_journal.position()
+        values = profile_journal.replay()
+        if values:
+            get_storage().set_many(values)
+            for key in values:
+                profile_cache.invalidate(key)
+                _legacy_profiles.discard(key)
+            _reindex_replayed(values)
+            logger.info(f"Replayed {len(values)} journaled profile changes")
+        profile_journal.checkpoint(position)
+        return len(values)
+    except Exception as e:
+        logger.error(f"Error replaying profile journal: {e}")
+        return 0
+
+def _reindex_replayed(values: Dict[str, Any]):
+    """Re-rank players whose replayed changes the persisted indexes never saw."""
+    # Indexes are persisted only after a cache flush, so they lag the journal.
+    # A missing index is rebuilt from storage, which already holds the replay.
+    if not leaderboard_index.loaded and not leaderboard_index.load():
+        return
+    for key, value in values.items():
+        data = profile_codec.decode(value)
+        if data:
+            profile_migrations.upgrade(data)
+        _reindex_profile(key[len("user_rpg_"):], data)
+    _flush_indexes()
 
 async def initialize_database():
     """Initialize the database with default settings."""
     try:
         # Initialize global settings if they don't exist
-        if "global_settings" not in db:
-            db["global_settings"] = {
+        db = get_storage()
+        if not db.exists("global_settings"):
+            db.set("global_settings", {
                 "bot_version": "1.0.0",
                 "maintenance_mode": False,
                 "total_users": 0,
                 "total_guilds": 0
-            }
+            })
+
+        # Backfill leaderboard indexes on the first start after upgrading
+        ensure_leaderboard_index()
+
+        # Track ephemeral keys and start deleting expired ones
+        start_key_expiry()
+
+        # Decay luck once per UTC day
+        start_luck_decay()
         
         logger.info("Database initialization complete")
     except Exception as e:
         logger.error(f"Database initialization failed: {e}")
         raise
 
+def start_key_expiry() -> bool:
+    """Load the key expiry index and start the background sweeper."""
+    try:
+        key_expiry.load()
+        key_expiry.start(
+            interval=float(os.getenv("TTL_SWEEP_INTERVAL", 300)),
+            batch_size=int(os.getenv("TTL_SWEEP_BATCH_SIZE", 100)),
+            rate=float(os.getenv("TTL_SWEEP_RATE", 50))
+        )
+        return True
+    except Exception as e:
+        logger.error(f"Error starting key expiry sweeper: {e}")
+        return False
+
+@instrumented()
+def sweep_expired_keys(limit: Optional[int] = None) -> Dict[str, int]:
+    """Delete expired ephemeral keys now; returns reclaimed counts per prefix."""
+    try:
+        reclaimed = key_expiry.sweep(
+            batch_size=int(os.getenv("TTL_SWEEP_BATCH_SIZE", 100)),
+            rate=float(os.getenv("TTL_SWEEP_RATE", 50)),
+            limit=limit
+        )
+        key_expiry.flush()
+        return reclaimed
+    except Exception as e:
+        logger.error(f"Error sweeping expired keys: {e}")
+        return {}
+
+def get_key_expiry_stats() -> Dict[str, Any]:
+    """Get tracked, due and reclaimed key counts per TTL prefix."""
+    try:
+        return key_expiry.stats()
+    except Exception as e:
+        logger.error(f"Error getting key expiry stats: {e}")
+        return {}
+
+def start_luck_decay() -> bool:
+    """Start the scheduler that runs the daily luck decay."""
+    try:
+        luck_decay.start(
+            interval=float(os.getenv("LUCK_DECAY_INTERVAL", 3600)),
+            page_size=int(os.getenv("LUCK_DECAY_PAGE_SIZE", 500))
+        )
+        return True
+    except Exception as e:
+        logger.error(f"Error starting luck decay: {e}")
+        return False
+
+@instrumented()
+def run_luck_decay(day: Optional[str] = None,
+                   progress: Optional[Callable[[int, int, int], Any]] = None) -> Dict[str, Any]:
+    """Decay every player's luck for a UTC day (today) unless already done; returns the run's state."""
+    try:
+        return luck_decay.run(day, page_size=int(os.getenv("LUCK_DECAY_PAGE_SIZE", 500)), progress=progress)
+    except Exception as e:
+        logger.error(f"Error running luck decay: {e}")
+        return {}
+
+def get_storage_stats() -> Dict[str, Any]:
+    """Get profile cache, journal, key expiry and luck decay statistics."""
+    try:
+        return {
+            "profile_cache": profile_cache.stats(),
+            "journal": profile_journal.stats() if profile_journal is not None else None,
+            "key_expiry": key_expiry.stats(),
+            "luck_decay": luck_decay.stats(),
+        }
+    except Exception as e:
+        logger.error(f"Error getting storage stats: {e}")
+        return {}
+
+@instrumented(size="result")
+def get_many(keys: List[str]) -> Dict[str, Any]:
+    """Get several keys in one batched read; missing keys map to None.
+
+    Profile keys (user_rpg_*) are served through the profile cache.
+    """
+    try:
+        profile_keys = [key for key in keys if key.startswith("user_rpg_")]
+        other_keys = [key for key in keys if not key.startswith("user_rpg_")]
+        values = profile_cache.get_many(profile_keys) if profile_keys else {}
+        if other_keys:
+            stored = get_storage().get_many(other_keys)
+            values.update({key: stored.get(key) for key in other_keys})
+        return values
+    except Exception as e:
+        logger.error(f"Error getting {len(keys)} keys: {e}")
+        return {key: None for key in keys}
+
+@instrumented(size="items")
+def set_many(items: Dict[str, Any]) -> bool:
+    """Write several keys in one batch. Profile keys go through the profile cache."""
+    try:
+        profiles = {key: value for key, value in items.items() if key.startswith("user_rpg_")}
+        others = {key: value for key, value in items.items() if not key.startswith("user_rpg_")}
+        if profiles:
+            profile_cache.put_many(profiles)
+            for key, data in profiles.items():
+                _reindex_profile(key[len("user_rpg_"):], data)
+            _acknowledge()
+        if others:
+            get_storage().set_many(others)
+        return True
+    except Exception as e:
+        logger.error(f"Error setting {len(items)} keys: {e}")
+        return False
+
+@instrumented(size="result")
+def get_many_user_rpg_data(user_ids: List[str]) -> Dict[str, Optional[Dict[str, Any]]]:
+    """Get several users' RPG data with one batched read for the uncached ones."""
+    values = get_many([f"user_rpg_{user_id}" for user_id in user_ids])
+    return {str(user_id): values.get(f"user_rpg_{user_id}") for user_id in user_ids}
+
+@instrumented(size="profiles")
+def update_many_user_rpg_data(profiles: Dict[str, Dict[str, Any]]) -> bool:
+    """Update several users' RPG data in one batch."""
+    return set_many({f"user_rpg_{user_id}": data for user_id, data in profiles.items()})
+
+@instrumented(key="user_rpg_{user_id}", size="result")
 def get_user_rpg_data(user_id: str) -> Optional[Dict[str, Any]]:
     """Get user's RPG data from database."""
     try:
         key = f"user_rpg_{user_id}"
-        if key in db:
-            return dict(db[key])
-        return None
+        return profile_cache.get(key)
     except Exception as e:
         logger.error(f"Error getting user RPG data for {user_id}: {e}")
         return None
 
+@instrumented(key="user_rpg_{user_id}", size="data")
 def update_user_rpg_data(user_id: str, data: Dict[str, Any]) -> bool:
     """Update user's RPG data in database."""
     try:
         key = f"user_rpg_{user_id}"
-        db[key] = data
+        profile_cache.put(key, data)
+        _reindex_profile(str(user_id), data)
+        _acknowledge()
         return True
     except Exception as e:
         logger.error(f"Error updating user RPG data for {user_id}: {e}")
         return False
 
+MUTATE_MAX_RETRIES = 5
+
+@instrumented(key="user_rpg_{user_id}", size="result")
+def mutate_user_rpg_data(user_id: str, fn: Callable[[Dict[str, Any]], Any]) -> Optional[Tuple[Dict[str, Any], Any]]:
+    """Atomically apply fn to user's RPG data and return (new data, fn result).
+
+    fn mutates the profile dict in place. The write only lands if nothing else
+    wrote the profile since it was read; otherwise fn is re-run on fresh data.
+    If fn leaves the profile unchanged nothing is written. Returns None if the
+    profile does not exist or the update keeps conflicting.
+    """
+    key = f"user_rpg_{user_id}"
+    try:
+        for _ in range(MUTATE_MAX_RETRIES):
+            data, version = profile_cache.get_versioned(key)
+            if data is None:
+                return None
+
+            original = copy.deepcopy(data)
+            result = fn(data)
+            if data == original:
+                return data, result
+
+            # Ship only the changed fields when the change is expressible as a patch
+            ops = diff(original, data)
+            if ops is None:
+                written = profile_cache.put_if_version(key, data, version)
+            else:
+                written = profile_cache.patch(key, ops, version=version) is not None
+            if written:
+                _reindex_profile(str(user_id), data)
+                _acknowledge()
+                return data, result
+
+        logger.error(f"Giving up on RPG data update for {user_id} after {MUTATE_MAX_RETRIES} conflicts")
+        return None
+    except Exception as e:
+        logger.error(f"Error mutating user RPG data for {user_id}: {e}")
+        return None
+
+@instrumented(key="user_rpg_{user_id}", size="ops")
+def patch_user_rpg_data(user_id: str, ops: List[PatchOp]) -> Optional[Dict[str, Any]]:
+    """Apply field-level patch ops to user's RPG data; returns the updated data."""
+    try:
+        key = f"user_rpg_{user_id}"
+        data = profile_cache.patch(key, ops)
+        if data is not None:
+            _reindex_profile(str(user_id), data)
+            _acknowledge()
+        return data
+    except Exception as e:
+        logger.error(f"Error patching user RPG data for {user_id}: {e}")
+        return None
+
+def incr_user_rpg_field(user_id: str, path: str, amount: float = 1) -> Optional[Dict[str, Any]]:
+    """Add amount to a numeric profile field such as 'coins' or 'stats.battles_won'."""
+    return patch_user_rpg_data(user_id, [incr(path, amount)])
+
+def set_user_rpg_field(user_id: str, path: str, value: Any) -> Optional[Dict[str, Any]]:
+    """Set a single profile field."""
+    return patch_user_rpg_data(user_id, [set_field(path, value)])
+
+def push_user_rpg_field(user_id: str, path: str, item: Any) -> Optional[Dict[str, Any]]:
+    """Append an item to a profile list such as 'achievements'."""
+    return patch_user_rpg_data(user_id, [push(path, item)])
+
+@instrumented(key="user_rpg_{user_id}")
 def ensure_user_exists(user_id: str) -> bool:
     """Ensure user exists in database, create if not."""
     try:
         key = f"user_rpg_{user_id}"
-        if key not in db:
+        if profile_cache.get(key) is None:
             return create_user_profile(user_id)
         return True
     except Exception as e:
         logger.error(f"Error ensuring user exists {user_id}: {e}")
         return False
 
+@instrumented(key="user_rpg_{user_id}")
 def create_user_profile(user_id: str) -> bool:
     """Create a new user profile with default stats."""
     try:
+        db = get_storage()
         default_profile = {
             "user_id": user_id,
             "level": 1,
@@ -70,7 +463,7 @@ def create_user_profile(user_id: str) -> bool:
             "mana": 50,
             "max_mana": 50,
             "coins": 100,
-            "inventory": [],
+            "inventory": {},  # item name -> quantity
             "materials": {},  # Crafting materials
             "equipped": {
                 "weapon": None,
@@ -109,6 +502,7 @@ def create_user_profile(user_id: str) -> bool:
             "last_gather": None,
             "last_quest": None,
             "luck_points": 0,
+            "last_luck_decay": None,  # UTC day luck last decayed
             "status_effects": {},
             "active_quests": [],
             "completed_quests": [],
@@ -121,16 +515,19 @@ def create_user_profile(user_id: str) -> bool:
             "seasonal_progress": {},
             "housing": None,
             "pets": [],
-            "created_at": str(db.get("timestamp", ""))
+            "created_at": str(db.get("timestamp", "")),
+            "schema_version": profile_migrations.version
         }
         
         key = f"user_rpg_{user_id}"
-        db[key] = default_profile
+        profile_cache.put(key, default_profile)
+        _reindex_profile(str(user_id), default_profile)
+        _acknowledge()
         
         # Update global user count
         global_settings = db.get("global_settings", {})
         global_settings["total_users"] = global_settings.get("total_users", 0) + 1
-        db["global_settings"] = global_settings
+        db.set("global_settings", global_settings)
         
         logger.info(f"Created new user profile for {user_id}")
         return True
@@ -138,45 +535,171 @@ def create_user_profile(user_id: str) -> bool:
         logger.error(f"Error creating user profile for {user_id}: {e}")
         return False
 
-def get_leaderboard(category: str, guild_id: int, limit: int = 10) -> List[Dict[str, Any]]:
-    """Get leaderboard data for a specific category."""
+def ensure_leaderboard_index() -> bool:
+    """Load the leaderboard indexes, building them from all profiles if missing."""
     try:
-        users = []
-        
-        # Get all user keys
-        user_keys = [key for key in db.keys() if key.startswith("user_rpg_")]
-        
-        for key in user_keys:
-            try:
-                user_data = dict(db[key])
-                user_id = user_data.get("user_id")
-                
-                if not user_id:
-                    continue
-                    
-                value = user_data.get(category, 0)
-                users.append({
-                    "user_id": user_id,
-                    "value": value
-                })
-            except Exception as e:
-                logger.warning(f"Error processing user data for leaderboard: {e}")
-                continue
-        
-        # Sort by value (descending)
-        users.sort(key=lambda x: x["value"], reverse=True)
-        
-        return users[:limit]
+        if leaderboard_index.loaded or leaderboard_index.load():
+            return True
+        rebuild_leaderboard_index()
+        return True
+    except Exception as e:
+        logger.error(f"Error loading leaderboard index: {e}")
+        return False
+
+def _scan_profiles():
+    """Yield (user_id, profile) for every stored RPG profile."""
+    db = get_storage()
+    for key in db.keys("user_rpg_"):
+        user_data = profile_codec.decode(db.get(key))
+        if user_data:
+            profile_migrations.upgrade(user_data)
+            yield key[len("user_rpg_"):], user_data
+
+@instrumented()
+def rebuild_leaderboard_index() -> int:
+    """Rebuild all leaderboard indexes from stored profiles; returns profiles scanned."""
+    try:
+        # Make sure cached changes are visible to the scan
+        flush_profile_cache()
+        count = leaderboard_index.rebuild(_scan_profiles)
+        guild_leaderboards.reset_indexes()
+        return count
+    except Exception as e:
+        logger.error(f"Error rebuilding leaderboard index: {e}")
+        return 0
+
+def list_profile_ids() -> List[str]:
+    """List the user ids of every stored RPG profile."""
+    try:
+        return [key[len("user_rpg_"):] for key in get_storage().keys("user_rpg_")]
+    except Exception as e:
+        logger.error(f"Error listing profiles: {e}")
+        return []
+
+def migrate_profile(user_id: str) -> bool:
+    """Upgrade one stored profile to the latest schema; True if it was rewritten."""
+    try:
+        return profile_cache.rewrite(f"user_rpg_{user_id}")
+    except Exception as e:
+        logger.error(f"Error migrating profile {user_id}: {e}")
+        return False
+
+@instrumented()
+def migrate_profiles(user_ids: Optional[List[str]] = None,
+                     progress: Optional[Callable[[int, int, int], Any]] = None,
+                     batch_size: int = 200, rebuild_index: bool = True) -> Dict[str, int]:
+    """Upgrade every stored profile, calling progress(done, total, migrated) per batch.
+
+    Leaderboards are rebuilt afterwards if anything changed, since migrations
+    can move ranked fields.
+    """
+    if user_ids is None:
+        user_ids = list_profile_ids()
+    total = len(user_ids)
+    migrated = 0
+    for start in range(0, total, batch_size):
+        for user_id in user_ids[start:start + batch_size]:
+            if migrate_profile(user_id):
+                migrated += 1
+        if progress is not None:
+            progress(min(start + batch_size, total), total, migrated)
+    if migrated and rebuild_index:
+        rebuild_leaderboard_index()
+    logger.info(f"Migrated {migrated} of {total} profiles to schema version {profile_migrations.version}")
+    return {"total": total, "migrated": migrated}
+
+@instrumented()
+def export_backup(path: str, prefixes: Optional[List[str]] = None, incremental: bool = False,
+                  checkpoint_path: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """Stream the store to a compressed JSONL backup (see utils.backup)."""
+    try:
+        # Cached profile changes belong in the snapshot
+        flush_profile_cache()
+        return backup.export_backup(
+            get_storage(), path, prefixes=prefixes, checkpoint_path=checkpoint_path,
+            incremental=incremental, pause=float(os.getenv("BACKUP_PAGE_PAUSE", 0.05))
+        )
+    except Exception as e:
+        logger.error(f"Error exporting backup to {path}: {e}")
+        return None
+
+@instrumented(size="result")
+def get_leaderboard(category: str, guild_id: Optional[int] = None, limit: int = 10) -> List[Dict[str, Any]]:
+    """Get leaderboard data for a category, scoped to a guild's players if guild_id is given.
+
+    Each entry carries the player's level and class, fetched in one batch.
+    """
+    try:
+        ensure_leaderboard_index()
+        if guild_id is None:
+            top = leaderboard_index.top(category, limit)
+        else:
+            top = guild_leaderboards.top(str(guild_id), category, limit)
+        profiles = get_many_user_rpg_data([user_id for user_id, _ in top])
+        leaderboard = []
+        for user_id, value in top:
+            profile = profiles.get(user_id) or {}
+            leaderboard.append({
+                "user_id": user_id,
+                "value": value,
+                "level": profile.get("level"),
+                "player_class": profile.get("player_class")
+            })
+        return leaderboard
     except Exception as e:
         logger.error(f"Error getting leaderboard for {category}: {e}")
         return []
 
+@instrumented()
+def get_leaderboard_rank(category: str, user_id: str, guild_id: Optional[int] = None) -> Optional[int]:
+    """Get a user's 1-based rank in a leaderboard category (globally or within a guild)."""
+    try:
+        ensure_leaderboard_index()
+        if guild_id is None:
+            return leaderboard_index.rank(category, str(user_id))
+        return guild_leaderboards.rank(str(guild_id), category, str(user_id))
+    except Exception as e:
+        logger.error(f"Error getting leaderboard rank for {user_id}: {e}")
+        return None
+
+@instrumented(key="guild_members_{guild_id}")
+def add_guild_member(guild_id: int, user_id: str, players_only: bool = False) -> bool:
+    """Record a player as a member of a guild for guild leaderboards."""
+    try:
+        ensure_leaderboard_index()
+        if players_only and not leaderboard_index.scores_for(str(user_id)):
+            return False
+        return guild_leaderboards.add_member(str(guild_id), str(user_id))
+    except Exception as e:
+        logger.error(f"Error adding {user_id} to guild {guild_id} members: {e}")
+        return False
+
+@instrumented(key="guild_members_{guild_id}")
+def remove_guild_member(guild_id: int, user_id: str) -> bool:
+    """Remove a player from a guild's leaderboard membership."""
+    try:
+        return guild_leaderboards.remove_member(str(guild_id), str(user_id))
+    except Exception as e:
+        logger.error(f"Error removing {user_id} from guild {guild_id} members: {e}")
+        return False
+
+def get_leaderboard_categories() -> List[str]:
+    """List the categories that currently have a leaderboard."""
+    try:
+        ensure_leaderboard_index()
+        return leaderboard_index.categories()
+    except Exception as e:
+        logger.error(f"Error listing leaderboard categories: {e}")
+        return []
+
+@instrumented(key="guild_{guild_id}", size="result")
 def get_guild_data(guild_id: int) -> Dict[str, Any]:
     """Get guild-specific data."""
     try:
         key = f"guild_{guild_id}"
-        if key in db:
-            return dict(db[key])
+        guild_data = get_storage().get(key)
+        if guild_data is not None:
+            return guild_data
         
         # Create default guild data
         default_guild = {
@@ -194,99 +717,103 @@ def get_guild_data(guild_id: int) -> Dict[str, Any]:
             "settings": {}
         }
         
-        db[key] = default_guild
+        get_storage().set(key, default_guild)
         return default_guild
     except Exception as e:
         logger.error(f"Error getting guild data for {guild_id}: {e}")
         return {}
 
+@instrumented(key="guild_{guild_id}", size="data")
 def update_guild_data(guild_id: int, data: Dict[str, Any]) -> bool:
     """Update guild data in database."""
     try:
         key = f"guild_{guild_id}"
-        db[key] = data
+        get_storage().set(key, data)
         return True
     except Exception as e:
         logger.error(f"Error updating guild data for {guild_id}: {e}")
         return False
 
+@instrumented(key="warnings_{guild_id}_{user_id}", size="result")
 def get_user_warnings(user_id: int, guild_id: int) -> List[Dict[str, Any]]:
     """Get user warnings for a specific guild."""
     try:
         key = f"warnings_{guild_id}_{user_id}"
-        if key in db:
-            return list(db[key])
-        return []
+        return get_storage().get(key, [])
     except Exception as e:
         logger.error(f"Error getting warnings for {user_id} in {guild_id}: {e}")
         return []
 
-def add_user_warning(user_id: int, guild_id: int, reason: str, moderator_id: int) -> bool:
-    """Add a warning to a user."""
+@instrumented(key="warnings_{guild_id}_{user_id}")
+def add_user_warning(user_id: int, guild_id: int, reason: str, moderator_id: int) -> int:
+    """Add a warning to a user and return their new warning count (0 on failure)."""
     try:
+        db = get_storage()
         key = f"warnings_{guild_id}_{user_id}"
         warnings = db.get(key, [])
         
         warning = {
             "reason": reason,
             "moderator_id": moderator_id,
-            "timestamp": str(db.get("timestamp", ""))
+            "timestamp": datetime.now().isoformat()
         }
         
         warnings.append(warning)
-        db[key] = warnings
+        _write_expiring(key, warnings)
         
-        return True
+        return len(warnings)
     except Exception as e:
         logger.error(f"Error adding warning for {user_id} in {guild_id}: {e}")
-        return False
+        return 0
 
+@instrumented(key="warnings_{guild_id}_{user_id}")
 def clear_user_warnings(user_id: int, guild_id: int) -> bool:
     """Clear all warnings for a user."""
     try:
         key = f"warnings_{guild_id}_{user_id}"
-        if key in db:
-            del db[key]
+        _delete_expiring(key)
         return True
     except Exception as e:
         logger.error(f"Error clearing warnings for {user_id} in {guild_id}: {e}")
         return False
 
+@instrumented(key="conversation_{guild_id}_{user_id}", size="result")
 def get_conversation_history(user_id: int, guild_id: int) -> List[Dict[str, Any]]:
     """Get AI conversation history for a user."""
     try:
         key = f"conversation_{guild_id}_{user_id}"
-        if key in db:
-            return list(db[key])
-        return []
+        return get_storage().get(key, [])
     except Exception as e:
         logger.error(f"Error getting conversation history for {user_id}: {e}")
         return []
 
+@instrumented(key="conversation_{guild_id}_{user_id}", size="history")
 def update_conversation_history(user_id: int, guild_id: int, history: List[Dict[str, Any]]) -> bool:
     """Update AI conversation history."""
     try:
         key = f"conversation_{guild_id}_{user_id}"
-        db[key] = history
+        _write_expiring(key, history)
         return True
     except Exception as e:
         logger.error(f"Error updating conversation history for {user_id}: {e}")
         return False
 
+@instrumented(key="conversation_{guild_id}_{user_id}")
 def clear_conversation_history(user_id: int, guild_id: int) -> bool:
     """Clear AI conversation history."""
     try:
         key = f"conversation_{guild_id}_{user_id}"
-        if key in db:
-            del db[key]
+        _delete_expiring(key)
         return True
     except Exception as e:
         logger.error(f"Error clearing conversation history for {user_id}: {e}")
         return False
 
+@instrumented(key="user_{user_id}", size="result")
 def get_user_data(user_id: int) -> Optional[Dict[str, Any]]:
     """Get user data from database."""
     try:
+        db = get_storage()
         user_data = db.get(f"user_{user_id}")
         if user_data is None:
             # Create default user data
@@ -300,23 +827,25 @@ def get_user_data(user_id: int) -> Optional[Dict[str, Any]]:
                 'reputation': 0,
                 'notes': []
             }
-            db[f"user_{user_id}"] = default_data
+            db.set(f"user_{user_id}", default_data)
             return default_data
         return user_data
     except Exception as e:
         logger.error(f"Error getting user data for {user_id}: {e}")
         return None
 
+@instrumented(key="user_{user_id}", size="data")
 def update_user_data(user_id: int, data: Dict[str, Any]) -> bool:
     """Update user data in database."""
     try:
         data['last_active'] = datetime.now().isoformat()
-        db[f"user_{user_id}"] = data
+        get_storage().set(f"user_{user_id}", data)
         return True
     except Exception as e:
         logger.error(f"Error updating user data for {user_id}: {e}")
         return False
 
+@instrumented(key="guild_{guild_id}")
 def create_guild_profile(guild_id: int, name: str = "Unknown Guild") -> bool:
     """Create a guild profile in database."""
     try:
@@ -333,34 +862,35 @@ def create_guild_profile(guild_id: int, name: str = "Unknown Guild") -> bool:
                 'timeouts_given': 0
             }
         }
-        db[f"guild_{guild_id}"] = guild_data
+        get_storage().set(f"guild_{guild_id}", guild_data)
         return True
     except Exception as e:
         logger.error(f"Error creating guild profile for {guild_id}: {e}")
         return False
 
 
+@instrumented(key="guild_rpg_{guild_id}", size="result")
 def get_guild_rpg_data(guild_id: str) -> Optional[Dict[str, Any]]:
     """Get guild's RPG data from database."""
     try:
         key = f"guild_rpg_{guild_id}"
-        if key in db:
-            return dict(db[key])
-        return None
+        return get_storage().get(key)
     except Exception as e:
         logger.error(f"Error getting guild RPG data for {guild_id}: {e}")
         return None
 
+@instrumented(key="guild_rpg_{guild_id}", size="data")
 def update_guild_rpg_data(guild_id: str, data: Dict[str, Any]) -> bool:
     """Update guild's RPG data in database."""
     try:
         key = f"guild_rpg_{guild_id}"
-        db[key] = data
+        get_storage().set(key, data)
         return True
     except Exception as e:
         logger.error(f"Error updating guild RPG data for {guild_id}: {e}")
         return False
 
+@instrumented(key="guild_rpg_{guild_id}")
 def create_guild_rpg_profile(guild_id: str, name: str, founder_id: str) -> bool:
     """Create a new guild RPG profile."""
     try:
@@ -383,33 +913,34 @@ def create_guild_rpg_profile(guild_id: str, name: str, founder_id: str) -> bool:
         }
         
         key = f"guild_rpg_{guild_id}"
-        db[key] = guild_profile
+        get_storage().set(key, guild_profile)
         return True
     except Exception as e:
         logger.error(f"Error creating guild RPG profile for {guild_id}: {e}")
         return False
 
+@instrumented(key="party_{party_id}", size="result")
 def get_party_data(party_id: str) -> Optional[Dict[str, Any]]:
     """Get party data from database."""
     try:
         key = f"party_{party_id}"
-        if key in db:
-            return dict(db[key])
-        return None
+        return get_storage().get(key)
     except Exception as e:
         logger.error(f"Error getting party data for {party_id}: {e}")
         return None
 
+@instrumented(key="party_{party_id}", size="data")
 def update_party_data(party_id: str, data: Dict[str, Any]) -> bool:
     """Update party data in database."""
     try:
         key = f"party_{party_id}"
-        db[key] = data
+        _write_expiring(key, data)
         return True
     except Exception as e:
         logger.error(f"Error updating party data for {party_id}: {e}")
         return False
 
+@instrumented()
 def create_party(leader_id: str, party_name: str = "Adventuring Party") -> str:
     """Create a new party and return party ID."""
     try:
@@ -435,69 +966,126 @@ def create_party(leader_id: str, party_name: str = "Adventuring Party") -> str:
         logger.error(f"Error creating party: {e}")
         return None
 
+@instrumented(key="quest_{quest_id}", size="result")
 def get_quest_data(quest_id: str) -> Optional[Dict[str, Any]]:
     """Get quest data from database."""
     try:
         key = f"quest_{quest_id}"
-        if key in db:
-            return dict(db[key])
-        return None
+        return get_storage().get(key)
     except Exception as e:
         logger.error(f"Error getting quest data for {quest_id}: {e}")
         return None
 
+@instrumented(key="quest_{quest_id}", size="data")
 def update_quest_data(quest_id: str, data: Dict[str, Any]) -> bool:
     """Update quest data in database."""
     try:
         key = f"quest_{quest_id}"
-        db[key] = data
+        _write_expiring(key, data)
         return True
     except Exception as e:
         logger.error(f"Error updating quest data for {quest_id}: {e}")
         return False
 
+@instrumented(key="world_event_{event_id}", size="result")
 def get_world_event_data(event_id: str) -> Optional[Dict[str, Any]]:
     """Get world event data from database."""
     try:
         key = f"world_event_{event_id}"
-        if key in db:
-            return dict(db[key])
-        return None
+        return get_storage().get(key)
     except Exception as e:
         logger.error(f"Error getting world event data for {event_id}: {e}")
         return None
 
+@instrumented(key="world_event_{event_id}", size="data")
 def update_world_event_data(event_id: str, data: Dict[str, Any]) -> bool:
     """Update world event data in database."""
     try:
         key = f"world_event_{event_id}"
-        db[key] = data
+        _write_expiring(key, data)
         return True
     except Exception as e:
         logger.error(f"Error updating world event data for {event_id}: {e}")
         return False
 
-def get_auction_listings() -> List[Dict[str, Any]]:
-    """Get all auction house listings."""
+@instrumented(size="result")
+def get_auction_listings(item_name: Optional[str] = None, limit: Optional[int] = None, offset: int = 0) -> List[Dict[str, Any]]:
+    """Get active auction listings: all of them, or one item's listings cheapest first."""
     try:
-        key = "auction_house"
-        if key in db:
-            return list(db[key])
-        return []
+        if item_name is None:
+            return auction_house.all(limit, offset)
+        return auction_house.cheapest(item_name, limit if limit is not None else auction_house.count(item_name), offset)
     except Exception as e:
         logger.error(f"Error getting auction listings: {e}")
         return []
 
+@instrumented()
+def get_cheapest_auction_listing(item_name: str) -> Optional[Dict[str, Any]]:
+    """Get the cheapest active listing of an item."""
+    try:
+        listings = auction_house.cheapest(item_name, 1)
+        return listings[0] if listings else None
+    except Exception as e:
+        logger.error(f"Error getting cheapest auction listing for {item_name}: {e}")
+        return None
+
+@instrumented(key="auction_listing_{listing_id}", size="result")
+def get_auction_listing(listing_id: str) -> Optional[Dict[str, Any]]:
+    """Get one auction listing."""
+    try:
+        return auction_house.get(listing_id)
+    except Exception as e:
+        logger.error(f"Error getting auction listing {listing_id}: {e}")
+        return None
+
+@instrumented()
+def get_auction_item_names() -> List[str]:
+    """List item names with active auction listings."""
+    try:
+        return auction_house.item_names()
+    except Exception as e:
+        logger.error(f"Error getting auction item names: {e}")
+        return []
+
+@instrumented(size="listing")
+def update_auction_listing(listing: Dict[str, Any]) -> bool:
+    """Update a single auction listing."""
+    try:
+        auction_house.update(listing)
+        return True
+    except Exception as e:
+        logger.error(f"Error updating auction listing {listing.get('listing_id')}: {e}")
+        return False
+
+@instrumented(size="listings")
 def update_auction_listings(listings: List[Dict[str, Any]]) -> bool:
-    """Update auction house listings."""
+    """Replace all auction house listings."""
     try:
-        key = "auction_house"
-        db[key] = listings
+        auction_house.replace_all(listings)
         return True
     except Exception as e:
         logger.error(f"Error updating auction listings: {e}")
         return False
 
+@instrumented(key="auction_listing_{listing_id}")
+def remove_auction_listing(listing_id: str) -> Optional[Dict[str, Any]]:
+    """Remove a sold or cancelled auction listing and return it."""
+    try:
+        return auction_house.remove(listing_id)
+    except Exception as e:
+        logger.error(f"Error removing auction listing {listing_id}: {e}")
+        return None
+
+@instrumented()
+def expire_auction_listings() -> List[Dict[str, Any]]:
+    """Remove auction listings past their expiry and return them."""
+    try:
+        return auction_house.expire()
+    except Exception as e:
+        logger.error(f"Error expiring auction listings: {e}")
+        return []
+
+@instrumented()
 def add_auction_listing(seller_id: str, item_name: str, price: int, duration: int = 86400) -> bool:
     """Add new auction listing."""
     try:
@@ -515,19 +1103,20 @@ def add_auction_listing(seller_id: str, item_name: str, price: int, duration: in
             "status": "active"
         }
         
-        listings = get_auction_listings()
-        listings.append(listing)
-        return update_auction_listings(listings)
+        auction_house.add(listing)
+        return True
     except Exception as e:
         logger.error(f"Error adding auction listing: {e}")
         return False
 
+@instrumented(key="seasonal_data", size="result")
 def get_seasonal_data() -> Dict[str, Any]:
     """Get current seasonal data."""
     try:
         key = "seasonal_data"
-        if key in db:
-            return dict(db[key])
+        seasonal_data = get_storage().get(key)
+        if seasonal_data is not None:
+            return seasonal_data
         
         # Create default seasonal data
         default_seasonal = {
@@ -537,17 +1126,18 @@ def get_seasonal_data() -> Dict[str, Any]:
             "year": 1,
             "active_events": []
         }
-        db[key] = default_seasonal
+        get_storage().set(key, default_seasonal)
         return default_seasonal
     except Exception as e:
         logger.error(f"Error getting seasonal data: {e}")
         return {}
 
+@instrumented(key="seasonal_data", size="data")
 def update_seasonal_data(data: Dict[str, Any]) -> bool:
     """Update seasonal data."""
     try:
         key = "seasonal_data"
-        db[key] = data
+        get_storage().set(key, data)
         return True
     except Exception as e:
         logger.error(f"Error updating seasonal data: {e}")
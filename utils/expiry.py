@@ -0,0 +1,304 @@
+"""
+Time-to-live tracking and garbage collection for ephemeral keys.
+
+Keys under a prefix with a declared TTL (parties, quests, conversations ...)
+expire ``ttl`` seconds after their last write. Writes go through ``touch``,
+which records the new expiry in an in-memory index: a dict of key -> expiry
+plus a min-heap with lazy deletion, so finding due keys only looks at the
+ones that are due.
+
+The index is persisted write-behind in hash buckets (``expiry_index_<n>``)
+so no single document grows with the key space. If the bot stopped without
+a final flush, expiries written since the last flush are lost, so on the
+next load every tracked key is given at least one full TTL from that flush
+and untracked keys are picked up by a prefix scan. Keys are never deleted
+early; at worst they live one TTL longer.
+
+A background sweeper deletes due keys in small batches, sleeping between
+batches to stay under ``rate`` deletions per second.
+"""
+import heapq
+import logging
+import threading
+import time
+import zlib
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+INDEX_KEY_PREFIX = "expiry_index_"
+DEFAULT_BUCKETS = 64
+
+
+class ExpiryIndex:
+    """Per-prefix TTLs with a persisted expiry index and a rate-limited sweeper."""
+
+    def __init__(self, storage: Callable[[], Any], ttls: Dict[str, float],
+                 buckets: int = DEFAULT_BUCKETS, key_prefix: str = INDEX_KEY_PREFIX,
+                 name: str = "key-expiry"):
+        self.storage = storage
+        # Longest prefix first, so "world_event_" wins over a shorter overlap
+        self.ttls = dict(sorted(ttls.items(), key=lambda item: -len(item[0])))
+        self.buckets = buckets
+        self.key_prefix = key_prefix
+        self.meta_key = f"{key_prefix}meta"
+        self.name = name
+
+        self._lock = threading.RLock()
+        self._loaded = False
+        # key -> expiry timestamp, split the same way as the persisted buckets
+        self._expiry: List[Dict[str, float]] = [{} for _ in range(buckets)]
+        self._count = 0
+        # Entries are left in place when a key is touched again and skipped when popped
+        self._heap: List[Tuple[float, str]] = []
+        self._dirty: Set[int] = set()
+        self._stop_event = threading.Event()
+        self._sweep_thread: Optional[threading.Thread] = None
+
+        self.reclaimed: Dict[str, int] = {prefix: 0 for prefix in self.ttls}
+        self.sweeps = 0
+        self.last_sweep_seconds = 0.0
+        self.last_sweep_at: Optional[float] = None
+
+    def ttl_for(self, key: str) -> Optional[float]:
+        """Get the TTL that applies to a key, or None if it never expires."""
+        prefix = self._prefix(key)
+        return None if prefix is None else self.ttls[prefix]
+
+    def load(self) -> int:
+        """Load the persisted index, backfilling it on first use; returns the tracked key count."""
+        with self._lock:
+            if self._loaded:
+                return self._count
+
+            db = self.storage()
+            now = time.time()
+            meta = db.get(self.meta_key)
+            if meta is not None and meta.get("buckets") == self.buckets:
+                saved_at = meta.get("saved_at", now)
+                for bucket in range(self.buckets):
+                    for key, expires_at in (db.get(self._bucket_key(bucket)) or {}).items():
+                        ttl = self.ttl_for(key)
+                        if ttl is None:
+                            # Its prefix no longer has a TTL
+                            self._dirty.add(bucket)
+                            continue
+                        if not meta.get("clean") and expires_at < saved_at + ttl:
+                            # Touches after the last flush were lost; never expire early
+                            expires_at = saved_at + ttl
+                            self._dirty.add(bucket)
+                        self._expiry[bucket][key] = expires_at
+                if not meta.get("clean"):
+                    self._backfill(db, now)
+            else:
+                self._backfill(db, now)
+
+            self._count = sum(len(keys) for keys in self._expiry)
+            self._rebuild_heap()
+            self._loaded = True
+            logger.info(f"Loaded {self._count} expiring keys into {self.name}")
+
+        # Until the next clean shutdown, a restart must assume touches were lost
+        self.flush(clean=False, force=True)
+        return self._count
+
+    def touch(self, key: str, now: Optional[float] = None) -> None:
+        """Push back a key's expiry after a write (no-op for keys without a TTL)."""
+        ttl = self.ttl_for(key)
+        if ttl is None:
+            return
+        self.load()
+        expires_at = (time.time() if now is None else now) + ttl
+        bucket = self._bucket(key)
+        with self._lock:
+            if key not in self._expiry[bucket]:
+                self._count += 1
+            self._expiry[bucket][key] = expires_at
+            heapq.heappush(self._heap, (expires_at, key))
+            self._dirty.add(bucket)
+            self._compact()
+        if self._stop_event.is_set():
+            # Written after the final flush (late shutdown writers); persist now
+            self.flush(clean=True)
+
+    def forget(self, key: str) -> None:
+        """Stop tracking a key that was deleted."""
+        if self.ttl_for(key) is None:
+            return
+        self.load()
+        bucket = self._bucket(key)
+        with self._lock:
+            if self._expiry[bucket].pop(key, None) is not None:
+                self._count -= 1
+                self._dirty.add(bucket)
+                self._compact()
+
+    def expires_at(self, key: str) -> Optional[float]:
+        """Get a key's expiry timestamp, if it is tracked."""
+        self.load()
+        with self._lock:
+            return self._expiry[self._bucket(key)].get(key)
+
+    def sweep(self, now: Optional[float] = None, batch_size: int = 100, rate: float = 50.0,
+              limit: Optional[int] = None) -> Dict[str, int]:
+        """Delete due keys in rate-limited batches; returns reclaimed counts per prefix."""
+        self.load()
+        started = time.perf_counter()
+        now = time.time() if now is None else now
+        reclaimed: Dict[str, int] = {}
+        failed: List[Tuple[float, str]] = []
+        db = self.storage()
+
+        while limit is None or sum(reclaimed.values()) < limit:
+            deleted = 0
+            for _ in range(batch_size):
+                with self._lock:
+                    key = self._pop_due(now)
+                    if key is None:
+                        break
+                    # Delete under the lock so a concurrent touch+write lands after it
+                    bucket = self._bucket(key)
+                    try:
+                        db.delete(key)
+                    except Exception as e:
+                        logger.error(f"Error deleting expired key {key} in {self.name}: {e}")
+                        failed.append((self._expiry[bucket][key], key))
+                        continue
+                    del self._expiry[bucket][key]
+                    self._count -= 1
+                    self._dirty.add(bucket)
+                prefix = self._prefix(key)
+                reclaimed[prefix] = reclaimed.get(prefix, 0) + 1
+                deleted += 1
+            if deleted < batch_size:
+                break
+            if self._stop_event.wait(batch_size / rate if rate > 0 else 0):
+                break
+
+        with self._lock:
+            # Retried on the next sweep
+            for entry in failed:
+                heapq.heappush(self._heap, entry)
+            for prefix, count in reclaimed.items():
+                self.reclaimed[prefix] = self.reclaimed.get(prefix, 0) + count
+            self.sweeps += 1
+            self.last_sweep_seconds = time.perf_counter() - started
+            self.last_sweep_at = now
+        if reclaimed:
+            logger.info(f"{self.name} reclaimed {sum(reclaimed.values())} expired keys "
+                        f"in {self.last_sweep_seconds:.1f}s: {reclaimed}")
+        return reclaimed
+
+    def flush(self, clean: bool = False, force: bool = False) -> int:
+        """Persist dirty buckets; clean=True marks the index complete (on shutdown)."""
+        with self._lock:
+            if not self._loaded or (not self._dirty and not force and not clean):
+                return 0
+            pending = {bucket: dict(self._expiry[bucket]) for bucket in self._dirty}
+            self._dirty.clear()
+
+        db = self.storage()
+        try:
+            db.set_many({self._bucket_key(bucket): keys for bucket, keys in pending.items()})
+            db.set(self.meta_key, {"buckets": self.buckets, "saved_at": time.time(), "clean": clean})
+        except Exception as e:
+            logger.error(f"Error persisting {self.name} index: {e}")
+            with self._lock:
+                self._dirty.update(pending)
+            return 0
+        return len(pending)
+
+    def start(self, interval: float = 300.0, batch_size: int = 100, rate: float = 50.0) -> None:
+        """Start the background sweeper if it is not running."""
+        if self._sweep_thread is not None or interval <= 0:
+            return
+        with self._lock:
+            if self._sweep_thread is not None:
+                return
+            self._stop_event.clear()
+            self._sweep_thread = threading.Thread(
+                target=self._sweep_loop, args=(interval, batch_size, rate),
+                name=f"{self.name}-sweeper", daemon=True
+            )
+            self._sweep_thread.start()
+
+    def stop(self) -> None:
+        """Stop the sweeper and persist the index as complete."""
+        self._stop_event.set()
+        thread = self._sweep_thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout=30)
+        self._sweep_thread = None
+        self.flush(clean=True)
+
+    def stats(self) -> Dict[str, Any]:
+        """Get tracking and reclaim statistics."""
+        now = time.time()
+        with self._lock:
+            tracked: Dict[str, int] = {prefix: 0 for prefix in self.ttls}
+            due = 0
+            for keys in self._expiry:
+                for key, expires_at in keys.items():
+                    tracked[self._prefix(key)] += 1
+                    if expires_at <= now:
+                        due += 1
+            return {
+                "tracked": tracked,
+                "due": due,
+                "reclaimed": dict(self.reclaimed),
+                "sweeps": self.sweeps,
+                "last_sweep_seconds": self.last_sweep_seconds,
+                "last_sweep_at": self.last_sweep_at,
+            }
+
+    def _sweep_loop(self, interval: float, batch_size: int, rate: float) -> None:
+        """Sweep and persist the index every interval seconds until stopped."""
+        while not self._stop_event.wait(interval):
+            try:
+                self.sweep(batch_size=batch_size, rate=rate)
+                self.flush()
+            except Exception as e:
+                logger.error(f"Error in {self.name} sweeper: {e}")
+
+    def _backfill(self, db: Any, now: float) -> None:
+        """Track stored keys the index doesn't know, from now (lock held)."""
+        added = 0
+        for prefix, ttl in self.ttls.items():
+            for key in db.keys(prefix):
+                bucket = self._bucket(key)
+                if key not in self._expiry[bucket] and self._prefix(key) == prefix:
+                    self._expiry[bucket][key] = now + ttl
+                    self._dirty.add(bucket)
+                    added += 1
+        if added:
+            logger.info(f"{self.name} started tracking {added} existing keys")
+
+    def _pop_due(self, now: float) -> Optional[str]:
+        """Pop the next key whose current expiry has passed (lock held)."""
+        while self._heap and self._heap[0][0] <= now:
+            expires_at, key = heapq.heappop(self._heap)
+            if self._expiry[self._bucket(key)].get(key) == expires_at:
+                return key
+        return None
+
+    def _compact(self) -> None:
+        """Rebuild the heap once stale entries dominate it (lock held)."""
+        if len(self._heap) > 2 * self._count + 64:
+            self._rebuild_heap()
+
+    def _rebuild_heap(self) -> None:
+        """Build the heap from the live expiries (lock held)."""
+        self._heap = [(expires_at, key) for keys in self._expiry for key, expires_at in keys.items()]
+        heapq.heapify(self._heap)
+
+    def _prefix(self, key: str) -> Optional[str]:
+        for prefix in self.ttls:
+            if key.startswith(prefix):
+                return prefix
+        return None
+
+    def _bucket(self, key: str) -> int:
+        return zlib.crc32(key.encode()) % self.buckets
+
+    def _bucket_key(self, bucket: int) -> str:
+        return f"{self.key_prefix}{bucket}"
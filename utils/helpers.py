@@ -5,6 +5,9 @@ from typing import Dict, List, Any, Optional, Union
 from datetime import datetime, timedelta
 import logging
 
+from utils.catalog import catalog
+from utils.inventory import to_inventory, format_item
+
 logger = logging.getLogger(__name__)
 
 def create_embed(title: str, description: str, color: int = 0x7289DA, thumbnail_url: str = None) -> discord.Embed:
@@ -129,14 +132,15 @@ def format_number(number: Union[int, float]) -> str:
     else:
         return str(int(number))
 
-def create_inventory_display(inventory: List[str], equipped: Dict[str, str] = None) -> str:
+def create_inventory_display(inventory: Dict[str, int], equipped: Dict[str, str] = None) -> str:
     """Create a formatted inventory display."""
+    inventory = to_inventory(inventory)
     if not inventory:
         return "🎒 **Empty inventory**\n*Go shopping or complete adventures to get items!*"
 
     # Group items by type
     item_groups = {}
-    for item in inventory:
+    for item, quantity in inventory.items():
         # Simple categorization - you can expand this
         if any(weapon in item.lower() for weapon in ['sword', 'axe', 'staff', 'blade']):
             category = "⚔️ Weapons"
@@ -149,14 +153,14 @@ def create_inventory_display(inventory: List[str], equipped: Dict[str, str] = No
 
         if category not in item_groups:
             item_groups[category] = []
-        item_groups[category].append(item)
+        item_groups[category].append((item, quantity))
 
     display_lines = []
     for category, items in item_groups.items():
         display_lines.append(f"\n**{category}**")
-        for item in items[:5]:  # Show first 5 items per category
+        for item, quantity in items[:5]:  # Show first 5 items per category
             equipped_marker = " ⚡" if equipped and item in equipped.values() else ""
-            display_lines.append(f"• {item}{equipped_marker}")
+            display_lines.append(f"• {format_item(item, quantity)}{equipped_marker}")
         if len(items) > 5:
             display_lines.append(f"• ... and {len(items) - 5} more")
 
@@ -195,7 +199,14 @@ def create_leaderboard_display(leaderboard_data: List[Dict[str, Any]],
         else:
             formatted_value = str(value)
 
-        leaderboard_text += f"{medal} **{username}** - {formatted_value}\n"
+        details = []
+        if entry.get('level') is not None and 'level' not in title.lower():
+            details.append(f"Lv.{entry['level']}")
+        if entry.get('player_class'):
+            details.append(str(entry['player_class']).title())
+        suffix = f" ({' '.join(details)})" if details else ""
+
+        leaderboard_text += f"{medal} **{username}**{suffix} - {formatted_value}\n"
 
     embed.description = leaderboard_text
     embed.set_footer(text=f"Updated: {datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')} UTC")
@@ -487,7 +498,7 @@ def check_weapon_unlock_conditions(user_id: str, weapon_name: str) -> tuple[bool
                 failed_conditions.append(f"Must be {condition['class']} class")
 
         elif condition["type"] == "item_required":
-            inventory = player_data.get("inventory", [])
+            inventory = player_data.get("inventory", {})
             if condition["item"] not in inventory:
                 failed_conditions.append(f"Must have {condition['item']}")
 
@@ -515,7 +526,7 @@ def check_chrono_weave_unlock(user_id: str) -> tuple[bool, str]:
         return False, "Must complete Chrono Whispers quest"
 
     # Check ancient relics
-    inventory = player_data.get("inventory", [])
+    inventory = player_data.get("inventory", {})
     required_relics = ["relic_of_past", "relic_of_future", "relic_of_present"]
     missing_relics = [relic for relic in required_relics if relic not in inventory]
 
@@ -526,12 +537,11 @@ def check_chrono_weave_unlock(user_id: str) -> tuple[bool, str]:
 
 def calculate_weapon_stats(weapon_name: str, player_data: dict) -> dict:
     """Calculate effective weapon stats based on player data."""
-    from utils.constants import WEAPONS
-
-    if weapon_name not in WEAPONS:
+    item = catalog.lookup("weapons", weapon_name)
+    if item is None:
         return {"attack": 0, "defense": 0}
 
-    weapon = WEAPONS[weapon_name]
+    weapon = item.data
     stats = {
         "attack": weapon.get("attack", 0),
         "defense": weapon.get("defense", 0)
@@ -557,12 +567,11 @@ def calculate_weapon_stats(weapon_name: str, player_data: dict) -> dict:
 
 def format_weapon_info(weapon_name: str) -> str:
     """Format weapon information for display."""
-    from utils.constants import WEAPONS, RARITY_COLORS
-
-    if weapon_name not in WEAPONS:
+    item = catalog.lookup("weapons", weapon_name)
+    if item is None:
         return f"Unknown weapon: {weapon_name}"
 
-    weapon = WEAPONS[weapon_name]
+    weapon = item.data
     rarity = weapon.get("rarity", "common")
 
     info = f"**{weapon_name}** ({rarity.title()})\n"
@@ -628,10 +637,10 @@ def clear_item_cache():
 
 def validate_shop_data() -> Dict[str, Any]:
     """Validate shop data for duplicates and errors."""
-    from utils.constants import SHOP_ITEMS
-    
+    shop_items = catalog.find(source="shop")
+
     validation_results = {
-        "total_items": len(SHOP_ITEMS),
+        "total_items": len(shop_items),
         "duplicates_found": [],
         "missing_data": [],
         "valid": True
@@ -640,7 +649,8 @@ def validate_shop_data() -> Dict[str, Any]:
     seen_names = set()
     
     # Check for required fields and name duplicates
-    for item_id, item_data in SHOP_ITEMS.items():
+    for item in shop_items:
+        item_id, item_data = item.key, item.data
         # Check required fields
         if not item_data.get('name'):
             validation_results["missing_data"].append(f"Item {item_id} missing name")
@@ -0,0 +1,90 @@
+"""
+Player inventories as counted multisets.
+
+An inventory is a dict of item name -> quantity, so adding, removing and
+checking for an item are O(1), and a profile write only patches the entries
+that changed instead of rewriting a whole list. An item whose quantity drops
+to zero is removed from the map.
+
+Each distinct item takes one slot; a profile holds at most
+``RPG_CONSTANTS['max_inventory_size']`` slots. Stacking more of an item a
+player already has never needs a new slot.
+
+Profiles stored with list inventories are converted by the profile
+migrations; ``get_inventory`` converts any list it still meets as well.
+"""
+from typing import Any, Dict, Iterable, List
+
+from utils.constants import RPG_CONSTANTS
+
+Inventory = Dict[str, int]
+
+MAX_SLOTS = RPG_CONSTANTS['max_inventory_size']
+
+
+def to_inventory(items: Any) -> Inventory:
+    """Convert a stored inventory (a legacy list of names or a map) to a map."""
+    if isinstance(items, dict):
+        return {name: int(quantity) for name, quantity in items.items() if quantity and quantity > 0}
+    inventory: Inventory = {}
+    for name in items or []:
+        inventory[name] = inventory.get(name, 0) + 1
+    return inventory
+
+
+def get_inventory(player_data: Dict[str, Any]) -> Inventory:
+    """Get a profile's inventory map, converting a legacy list in place."""
+    inventory = player_data.get('inventory')
+    if not isinstance(inventory, dict):
+        inventory = player_data['inventory'] = to_inventory(inventory)
+    return inventory
+
+
+def item_count(inventory: Inventory, item: str) -> int:
+    """Get how many of an item the inventory holds."""
+    return inventory.get(item, 0)
+
+
+def has_item(inventory: Inventory, item: str, quantity: int = 1) -> bool:
+    """Check whether the inventory holds at least quantity of an item."""
+    return inventory.get(item, 0) >= quantity
+
+
+def can_add(inventory: Inventory, item: str, max_slots: int = MAX_SLOTS) -> bool:
+    """Check whether an item fits: it stacks on an existing slot or a slot is free."""
+    return item in inventory or len(inventory) < max_slots
+
+
+def add_item(inventory: Inventory, item: str, quantity: int = 1, max_slots: int = MAX_SLOTS) -> bool:
+    """Add quantity of an item; returns False (adding nothing) if no slot is free."""
+    if not can_add(inventory, item, max_slots):
+        return False
+    inventory[item] = inventory.get(item, 0) + quantity
+    return True
+
+
+def add_items(inventory: Inventory, items: Iterable[str], max_slots: int = MAX_SLOTS) -> List[str]:
+    """Add one of each item in order; returns the items that didn't fit."""
+    return [item for item in items if not add_item(inventory, item, 1, max_slots)]
+
+
+def remove_item(inventory: Inventory, item: str, quantity: int = 1) -> bool:
+    """Remove quantity of an item; returns False (removing nothing) if there isn't enough."""
+    held = inventory.get(item, 0)
+    if held < quantity:
+        return False
+    if held == quantity:
+        del inventory[item]
+    else:
+        inventory[item] = held - quantity
+    return True
+
+
+def total_items(inventory: Inventory) -> int:
+    """Count every item, stacks included."""
+    return sum(inventory.values())
+
+
+def format_item(item: str, quantity: int) -> str:
+    """Format an inventory entry as 'Item' or 'Item x3'."""
+    return item if quantity == 1 else f"{item} x{quantity}"
@@ -0,0 +1,232 @@
+"""
+Append-only write-ahead journal for buffered document writes.
+
+Every change to a write-back cached document is appended to a local journal
+as the document's full new value, before the change is acknowledged to the
+caller. Appends are buffered and made durable by a group commit: a sync
+thread fsyncs the journal every ``sync_interval`` seconds and wakes every
+writer whose record is now on disk, so many concurrent writes share one
+fsync. If an fsync fails, waiting writers get the error instead of an
+acknowledgement; the sync thread keeps retrying and the first successful
+fsync clears it.
+
+The journal is split into segment files, rotated once they pass
+``segment_bytes``. After the cache has flushed everything up to a sequence
+number to storage, ``checkpoint`` deletes the segments that hold nothing
+newer. On startup ``replay`` returns the last journaled value of every key
+that may not have reached storage.
+
+Records hold full values rather than patch ops, so replaying a record that
+did reach storage is harmless.
+"""
+import json
+import logging
+import os
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_SUFFIX = ".log"
+
+
+class WriteAheadJournal:
+    """Segmented, fsync-batched append-only journal."""
+
+    def __init__(self, directory: str, segment_bytes: int = 16 * 1024 * 1024,
+                 sync_interval: float = 0.005, name: str = "journal"):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.sync_interval = sync_interval
+        self.name = name
+        os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._synced_cond = threading.Condition(self._lock)
+        # Closed segments as (path, last_seq)
+        self._segments: List[Tuple[str, int]] = []
+        self._file = None
+        self._file_path: Optional[str] = None
+        self._file_size = 0
+        self._seq = 0
+        self._synced_seq = 0
+        # Error of the last failed fsync and the last record it covered;
+        # raised to writers waiting on those records until a sync succeeds
+        self._sync_error: Optional[Exception] = None
+        self._failed_seq = 0
+        self._stop_event = threading.Event()
+        self._sync_thread: Optional[threading.Thread] = None
+
+        for path in self._segment_paths():
+            last_seq = self._last_seq(path)
+            self._segments.append((path, last_seq))
+            self._seq = max(self._seq, last_seq)
+        self._synced_seq = self._seq
+
+        self.appended = 0
+        self.syncs = 0
+
+    def replay(self) -> Dict[str, Any]:
+        """Get the last journaled value of every key, oldest change first."""
+        values: Dict[str, Any] = {}
+        with self._lock:
+            paths = [path for path, _ in self._segments]
+            if self._file_path is not None:
+                self._file.flush()
+                paths.append(self._file_path)
+        for path in paths:
+            for record in self._read(path):
+                values.pop(record["key"], None)
+                values[record["key"]] = record["value"]
+        return values
+
+    def append(self, key: str, value: Any) -> int:
+        """Buffer a record and return its sequence number (not yet durable)."""
+        with self._lock:
+            self._seq += 1
+            line = json.dumps({"seq": self._seq, "key": key, "value": value}, separators=(",", ":")) + "\n"
+            if self._file is None:
+                self._open_segment()
+            self._file.write(line)
+            self._file_size += len(line)
+            self.appended += 1
+            seq = self._seq
+            if self._file_size >= self.segment_bytes:
+                self._rotate()
+        self._ensure_syncer()
+        return seq
+
+    def wait(self, seq: Optional[int] = None) -> None:
+        """Block until every record up to seq (default: all appended so far) is on disk.
+
+        Raises RuntimeError if the journal can't be synced.
+        """
+        with self._lock:
+            target = self._seq if seq is None else seq
+            if self.sync_interval <= 0:
+                self._sync()
+                return
+            while self._synced_seq < target:
+                if self._sync_error is not None and self._failed_seq >= target:
+                    raise RuntimeError(f"{self.name} fsync failed: {self._sync_error}") from self._sync_error
+                self._synced_cond.wait()
+
+    def position(self) -> int:
+        """Get the sequence number of the last appended record."""
+        with self._lock:
+            return self._seq
+
+    def checkpoint(self, seq: int) -> int:
+        """Delete segments whose records are all at or before seq; returns segments removed."""
+        with self._lock:
+            if self._file is not None and self._seq <= seq:
+                self._rotate()
+            removed = [path for path, last_seq in self._segments if last_seq <= seq]
+            self._segments = [(path, last_seq) for path, last_seq in self._segments if last_seq > seq]
+        for path in removed:
+            try:
+                os.remove(path)
+            except OSError as e:
+                logger.error(f"Error removing {self.name} segment {path}: {e}")
+        return len(removed)
+
+    def close(self) -> None:
+        """Sync and close the current segment and stop the sync thread."""
+        self._stop_event.set()
+        thread = self._sync_thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout=self.sync_interval + 5)
+        self._sync_thread = None
+        with self._lock:
+            if self._file is not None:
+                self._rotate()
+
+    def stats(self) -> Dict[str, Any]:
+        """Get journal statistics."""
+        with self._lock:
+            return {
+                "seq": self._seq,
+                "synced_seq": self._synced_seq,
+                "segments": len(self._segments) + (1 if self._file is not None else 0),
+                "appended": self.appended,
+                "syncs": self.syncs,
+                "sync_error": None if self._sync_error is None else str(self._sync_error),
+            }
+
+    def _open_segment(self) -> None:
+        """Start a new segment named after its first sequence number (lock held)."""
+        self._file_path = os.path.join(self.directory, f"{self._seq:020d}{SEGMENT_SUFFIX}")
+        self._file = open(self._file_path, "a", encoding="utf-8")
+        self._file_size = 0
+
+    def _rotate(self) -> None:
+        """Sync and close the current segment (lock held)."""
+        self._sync()
+        self._file.close()
+        self._segments.append((self._file_path, self._seq))
+        self._file = None
+        self._file_path = None
+        self._file_size = 0
+
+    def _sync(self) -> None:
+        """Make every buffered record durable and wake waiters (lock held)."""
+        if self._synced_seq >= self._seq:
+            return
+        if self._file is not None:
+            try:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+            except Exception as e:
+                self._sync_error = e
+                self._failed_seq = self._seq
+                self._synced_cond.notify_all()
+                raise
+        self._synced_seq = self._seq
+        self._sync_error = None
+        self.syncs += 1
+        self._synced_cond.notify_all()
+
+    def _ensure_syncer(self) -> None:
+        """Start the group-commit thread if it is not running."""
+        if self._sync_thread is not None or self.sync_interval <= 0:
+            return
+        with self._lock:
+            if self._sync_thread is not None:
+                return
+            self._stop_event.clear()
+            self._sync_thread = threading.Thread(
+                target=self._sync_loop, name=f"{self.name}-sync", daemon=True
+            )
+            self._sync_thread.start()
+
+    def _sync_loop(self) -> None:
+        """fsync pending records every sync_interval seconds until stopped."""
+        while not self._stop_event.wait(self.sync_interval):
+            try:
+                with self._lock:
+                    self._sync()
+            except Exception as e:
+                logger.error(f"Error syncing {self.name}: {e}")
+
+    def _segment_paths(self) -> List[str]:
+        return sorted(
+            os.path.join(self.directory, name)
+            for name in os.listdir(self.directory) if name.endswith(SEGMENT_SUFFIX)
+        )
+
+    def _read(self, path: str):
+        """Yield the records of a segment, stopping at a torn final write."""
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    logger.warning(f"Ignoring torn record at the end of {path}")
+                    return
+                yield record
+
+    def _last_seq(self, path: str) -> int:
+        last_seq = 0
+        for record in self._read(path):
+            last_seq = record["seq"]
+        return last_seq
@@ -0,0 +1,575 @@
+"""
+Incrementally maintained leaderboard indexes.
+
+Each category (``level``, ``coins``, ``pvp_rating``, ``stats.<name>`` ...) is
+kept in an indexable skip list ordered by score, so top-k and rank lookups
+are O(log n) instead of a scan over every profile. Profile writes update the
+indexes in place. Each category is persisted write-behind in hash buckets
+(``leaderboard_index_<category>_<n>``), so a score change rewrites only its
+bucket and no single document grows with the player count. Indexes stored
+in another layout are rebuilt from the profiles on load.
+
+Guild leaderboards use a persisted guild -> players membership index. A
+guild's sorted indexes are built on its first leaderboard query from the
+scores already held by the global indexes, then kept current on every write.
+"""
+import logging
+import random
+import threading
+import zlib
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+INDEX_KEY_PREFIX = "leaderboard_index_"
+INDEX_META_KEY = f"{INDEX_KEY_PREFIX}meta"
+MEMBERS_KEY_PREFIX = "guild_members_"
+DEFAULT_BUCKETS = 64
+
+# Top-level profile fields that get a leaderboard; every numeric entry under
+# ``stats`` is indexed as ``stats.<name>`` as well.
+TRACKED_FIELDS = ("level", "xp", "coins", "pvp_rating", "pvp_wins")
+
+_MAX_LEVEL = 32
+
+
+def extract_scores(profile: Dict[str, Any]) -> Dict[str, float]:
+    """Get the score of every leaderboard category present in a profile."""
+    scores = {}
+    for field in TRACKED_FIELDS:
+        value = profile.get(field)
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            scores[field] = value
+
+    stats = profile.get("stats")
+    if isinstance(stats, dict):
+        for name, value in stats.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                scores[f"stats.{name}"] = value
+    return scores
+
+
+class _Node:
+    """Skip list node; width[i] is the number of entries next[i] skips over."""
+
+    __slots__ = ("key", "next", "width")
+
+    def __init__(self, key: Optional[Tuple[float, str]], level: int):
+        self.key = key
+        self.next: List[Optional["_Node"]] = [None] * level
+        self.width = [1] * level
+
+
+class SortedIndex:
+    """Indexable skip list of members ordered by descending score."""
+
+    def __init__(self):
+        self._head = _Node(None, _MAX_LEVEL)
+        self._level = 1
+        self._size = 0
+        self._scores: Dict[str, float] = {}
+        # Private generator so node heights don't consume the game RNG
+        self._rng = random.Random()
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __contains__(self, member: str) -> bool:
+        return member in self._scores
+
+    def score(self, member: str) -> Optional[float]:
+        """Get a member's score, or None if it is not ranked."""
+        return self._scores.get(member)
+
+    def items(self) -> Dict[str, float]:
+        """Get a copy of the member -> score mapping."""
+        return dict(self._scores)
+
+    def set(self, member: str, score: float) -> bool:
+        """Insert or move a member; returns False if the score is unchanged."""
+        current = self._scores.get(member)
+        if current is not None:
+            if current == score:
+                return False
+            self._remove_key((-current, member))
+        self._insert_key((-score, member))
+        self._scores[member] = score
+        return True
+
+    def discard(self, member: str) -> bool:
+        """Remove a member if present."""
+        current = self._scores.pop(member, None)
+        if current is None:
+            return False
+        self._remove_key((-current, member))
+        return True
+
+    def rank(self, member: str) -> Optional[int]:
+        """Get a member's 1-based rank, or None if it is not ranked."""
+        current = self._scores.get(member)
+        if current is None:
+            return None
+
+        key = (-current, member)
+        rank = 0
+        node = self._head
+        for i in reversed(range(self._level)):
+            while node.next[i] is not None and node.next[i].key <= key:
+                rank += node.width[i]
+                node = node.next[i]
+            if node.key == key:
+                return rank
+        return None
+
+    def top(self, limit: int, offset: int = 0) -> List[Tuple[str, float]]:
+        """Get up to limit (member, score) pairs starting after offset entries."""
+        if limit <= 0 or offset >= self._size:
+            return []
+
+        # Walk down to the entry just before the requested window
+        traversed = 0
+        node = self._head
+        for i in reversed(range(self._level)):
+            while node.next[i] is not None and traversed + node.width[i] <= offset:
+                traversed += node.width[i]
+                node = node.next[i]
+
+        results = []
+        node = node.next[0]
+        while node is not None and len(results) < limit:
+            results.append((node.key[1], -node.key[0]))
+            node = node.next[0]
+        return results
+
+    def _random_level(self) -> int:
+        level = 1
+        while level < _MAX_LEVEL and self._rng.random() < 0.5:
+            level += 1
+        return level
+
+    def _insert_key(self, key: Tuple[float, str]) -> None:
+        update: List[_Node] = [self._head] * _MAX_LEVEL
+        rank = [0] * _MAX_LEVEL
+        node = self._head
+        for i in reversed(range(self._level)):
+            rank[i] = rank[i + 1] if i + 1 < self._level else 0
+            while node.next[i] is not None and node.next[i].key < key:
+                rank[i] += node.width[i]
+                node = node.next[i]
+            update[i] = node
+
+        level = self._random_level()
+        if level > self._level:
+            for i in range(self._level, level):
+                rank[i] = 0
+                update[i] = self._head
+                self._head.width[i] = self._size
+            self._level = level
+
+        new_node = _Node(key, level)
+        for i in range(level):
+            new_node.next[i] = update[i].next[i]
+            update[i].next[i] = new_node
+            new_node.width[i] = update[i].width[i] - (rank[0] - rank[i])
+            update[i].width[i] = rank[0] - rank[i] + 1
+
+        for i in range(level, self._level):
+            update[i].width[i] += 1
+        self._size += 1
+
+    def _remove_key(self, key: Tuple[float, str]) -> None:
+        update: List[_Node] = [self._head] * _MAX_LEVEL
+        node = self._head
+        for i in reversed(range(self._level)):
+            while node.next[i] is not None and node.next[i].key < key:
+                node = node.next[i]
+            update[i] = node
+
+        target = node.next[0]
+        if target is None or target.key != key:
+            return
+
+        for i in range(self._level):
+            if update[i].next[i] is target:
+                update[i].width[i] += target.width[i] - 1
+                update[i].next[i] = target.next[i]
+            else:
+                update[i].width[i] -= 1
+
+        while self._level > 1 and self._head.next[self._level - 1] is None:
+            self._level -= 1
+        self._size -= 1
+
+
+class LeaderboardIndex:
+    """Per-category sorted indexes with write-behind persistence."""
+
+    def __init__(self, storage: Callable[[], Any], key_prefix: str = INDEX_KEY_PREFIX,
+                 buckets: int = DEFAULT_BUCKETS):
+        self.storage = storage
+        self.key_prefix = key_prefix
+        self.meta_key = f"{key_prefix}meta"
+        self.buckets = buckets
+
+        self._indexes: Dict[str, SortedIndex] = {}
+        # category -> member -> score, split the same way as the persisted buckets
+        self._shards: Dict[str, List[Dict[str, float]]] = {}
+        self._dirty: Set[Tuple[str, int]] = set()
+        # The category list changed, so the meta key must be rewritten
+        self._meta_dirty = False
+        # Keys of an older layout, deleted once the new layout is persisted
+        self._stale_keys: Set[str] = set()
+        self._lock = threading.RLock()
+        self._loaded = False
+        # Scores written while a rebuild is scanning, replayed after the swap
+        self._rebuild_log: Optional[Dict[str, Dict[str, float]]] = None
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    def load(self) -> bool:
+        """Load persisted indexes; returns False if they must be (re)built first."""
+        with self._lock:
+            if self._loaded:
+                return True
+
+            db = self.storage()
+            meta = db.get(self.meta_key)
+            if meta is None:
+                return False
+            if meta.get("buckets") != self.buckets:
+                # Another layout: drop its keys once the rebuilt indexes are persisted
+                for category in meta.get("categories", []):
+                    if meta.get("buckets") is None:
+                        self._stale_keys.add(f"{self.key_prefix}{category}")
+                    else:
+                        self._stale_keys.update(self._bucket_key(category, bucket)
+                                                for bucket in range(self.buckets, meta["buckets"]))
+                return False
+
+            indexes = {}
+            shards = {}
+            for category in meta.get("categories", []):
+                keys = [self._bucket_key(category, bucket) for bucket in range(self.buckets)]
+                stored = db.get_many(keys)
+                index = SortedIndex()
+                buckets = [dict(stored.get(key) or {}) for key in keys]
+                for members in buckets:
+                    for member, score in members.items():
+                        index.set(member, score)
+                indexes[category] = index
+                shards[category] = buckets
+
+            self._indexes = indexes
+            self._shards = shards
+            self._dirty.clear()
+            self._meta_dirty = False
+            self._loaded = True
+            logger.info(f"Loaded {len(indexes)} leaderboard indexes")
+            return True
+
+    def update(self, user_id: str, profile: Optional[Dict[str, Any]]) -> None:
+        """Re-rank a user after their profile was written (None removes them)."""
+        scores = extract_scores(profile) if profile else {}
+        with self._lock:
+            if self._rebuild_log is not None:
+                self._rebuild_log[user_id] = scores
+            if self._loaded:
+                self._apply(user_id, scores)
+
+    def top(self, category: str, limit: int = 10, offset: int = 0) -> List[Tuple[str, float]]:
+        """Get the top (user_id, score) pairs of a category."""
+        with self._lock:
+            index = self._indexes.get(category)
+            return index.top(limit, offset) if index else []
+
+    def rank(self, category: str, user_id: str) -> Optional[int]:
+        """Get a user's 1-based rank in a category."""
+        with self._lock:
+            index = self._indexes.get(category)
+            return index.rank(user_id) if index else None
+
+    def size(self, category: str) -> int:
+        """Get the number of ranked users in a category."""
+        with self._lock:
+            index = self._indexes.get(category)
+            return len(index) if index else 0
+
+    def categories(self) -> List[str]:
+        """List all indexed categories."""
+        with self._lock:
+            return sorted(self._indexes)
+
+    def scores_for(self, user_id: str) -> Dict[str, float]:
+        """Get a user's current score in every category they are ranked in."""
+        with self._lock:
+            scores = {}
+            for category, index in self._indexes.items():
+                score = index.score(user_id)
+                if score is not None:
+                    scores[category] = score
+            return scores
+
+    def rebuild(self, profiles: Callable[[], Iterable[Tuple[str, Dict[str, Any]]]]) -> int:
+        """Rebuild every index from a full profile scan and persist it."""
+        with self._lock:
+            self._rebuild_log = {}
+
+        try:
+            indexes: Dict[str, SortedIndex] = {}
+            shards: Dict[str, List[Dict[str, float]]] = {}
+            count = 0
+            for user_id, profile in profiles():
+                bucket = self._bucket(user_id)
+                for category, score in extract_scores(profile).items():
+                    if category not in indexes:
+                        indexes[category] = SortedIndex()
+                        shards[category] = [{} for _ in range(self.buckets)]
+                    indexes[category].set(user_id, score)
+                    shards[category][bucket][user_id] = score
+                count += 1
+
+            with self._lock:
+                stale = set(self._indexes) - set(indexes)
+                self._indexes = indexes
+                self._shards = shards
+                self._loaded = True
+                for user_id, scores in self._rebuild_log.items():
+                    self._apply(user_id, scores)
+                # Rewrite every bucket; empty ones (and stale categories) are deleted
+                self._dirty = {(category, bucket) for category in set(self._indexes) | stale
+                               for bucket in range(self.buckets)}
+                self._meta_dirty = True
+        finally:
+            with self._lock:
+                self._rebuild_log = None
+
+        self.flush()
+        logger.info(f"Rebuilt leaderboard indexes from {count} profiles")
+        return count
+
+    def flush(self) -> int:
+        """Persist dirty buckets and return how many were written or deleted."""
+        with self._lock:
+            if not self._dirty and not self._meta_dirty and not self._stale_keys:
+                return 0
+            dirty, self._dirty = self._dirty, set()
+            writes: Dict[str, Dict[str, float]] = {}
+            deletes: List[str] = []
+            for category, bucket in dirty:
+                members = self._shards[category][bucket] if category in self._shards else None
+                if members:
+                    writes[self._bucket_key(category, bucket)] = dict(members)
+                else:
+                    deletes.append(self._bucket_key(category, bucket))
+            meta = {"categories": sorted(self._indexes), "buckets": self.buckets} if self._meta_dirty else None
+            stale, self._stale_keys = self._stale_keys, set()
+            self._meta_dirty = False
+
+        db = self.storage()
+        try:
+            if writes:
+                db.set_many(writes)
+            for key in deletes:
+                db.delete(key)
+            # Meta last, and the old layout only after it, so a crash never
+            # leaves meta pointing at keys that aren't written yet
+            if meta is not None:
+                db.set(self.meta_key, meta)
+            for key in stale:
+                db.delete(key)
+        except Exception as e:
+            logger.error(f"Error persisting leaderboard indexes: {e}")
+            with self._lock:
+                self._dirty |= dirty
+                self._stale_keys |= stale
+                self._meta_dirty = self._meta_dirty or meta is not None
+            return 0
+        return len(writes) + len(deletes)
+
+    def _apply(self, user_id: str, scores: Dict[str, float]) -> None:
+        """Move a user to their new scores in every index (lock held)."""
+        bucket = self._bucket(user_id)
+        for category, index in self._indexes.items():
+            if category not in scores and index.discard(user_id):
+                self._shards[category][bucket].pop(user_id, None)
+                self._dirty.add((category, bucket))
+
+        for category, score in scores.items():
+            index = self._indexes.get(category)
+            if index is None:
+                index = self._indexes[category] = SortedIndex()
+                self._shards[category] = [{} for _ in range(self.buckets)]
+                self._meta_dirty = True
+            if index.set(user_id, score):
+                self._shards[category][bucket][user_id] = score
+                self._dirty.add((category, bucket))
+
+    def _bucket(self, user_id: str) -> int:
+        return zlib.crc32(user_id.encode()) % self.buckets
+
+    def _bucket_key(self, category: str, bucket: int) -> str:
+        return f"{self.key_prefix}{category}_{bucket}"
+
+
+class GuildLeaderboards:
+    """Guild membership index with lazily built per-guild sorted indexes."""
+
+    def __init__(self, storage: Callable[[], Any], scores: LeaderboardIndex,
+                 key_prefix: str = MEMBERS_KEY_PREFIX):
+        self.storage = storage
+        self.scores = scores
+        self.key_prefix = key_prefix
+        self.meta_key = f"{key_prefix}meta"
+
+        self._members: Dict[str, Set[str]] = {}
+        self._user_guilds: Dict[str, Set[str]] = {}
+        self._indexes: Dict[str, Dict[str, SortedIndex]] = {}
+        self._dirty: Set[str] = set()
+        self._lock = threading.RLock()
+        self._loaded = False
+
+    def load(self) -> None:
+        """Load the persisted membership index."""
+        with self._lock:
+            if self._loaded:
+                return
+
+            db = self.storage()
+            meta = db.get(self.meta_key) or {}
+            for guild_id in meta.get("guilds", []):
+                members = set(db.get(self._guild_key(guild_id)) or [])
+                self._members[guild_id] = members
+                for user_id in members:
+                    self._user_guilds.setdefault(user_id, set()).add(guild_id)
+
+            self._loaded = True
+            logger.info(f"Loaded guild membership for {len(self._members)} guilds")
+
+    def add_member(self, guild_id: str, user_id: str) -> bool:
+        """Record that a player belongs to a guild; returns True if it was new."""
+        with self._lock:
+            self.load()
+            members = self._members.setdefault(guild_id, set())
+            if user_id in members:
+                return False
+
+            members.add(user_id)
+            self._user_guilds.setdefault(user_id, set()).add(guild_id)
+            self._dirty.add(guild_id)
+
+            indexes = self._indexes.get(guild_id)
+            if indexes is not None:
+                self._apply(indexes, user_id, self.scores.scores_for(user_id))
+            return True
+
+    def remove_member(self, guild_id: str, user_id: str) -> bool:
+        """Forget a player's membership in a guild."""
+        with self._lock:
+            self.load()
+            members = self._members.get(guild_id)
+            if not members or user_id not in members:
+                return False
+
+            members.discard(user_id)
+            guilds = self._user_guilds.get(user_id)
+            if guilds is not None:
+                guilds.discard(guild_id)
+                if not guilds:
+                    del self._user_guilds[user_id]
+            self._dirty.add(guild_id)
+
+            for index in self._indexes.get(guild_id, {}).values():
+                index.discard(user_id)
+            return True
+
+    def is_member(self, guild_id: str, user_id: str) -> bool:
+        """Check whether a player is recorded as a member of a guild."""
+        with self._lock:
+            self.load()
+            return user_id in self._members.get(guild_id, ())
+
+    def update(self, user_id: str) -> None:
+        """Re-rank a user in every guild index built so far."""
+        with self._lock:
+            guilds = self._user_guilds.get(user_id)
+            if not guilds:
+                return
+            scores = None
+            for guild_id in guilds:
+                indexes = self._indexes.get(guild_id)
+                if indexes is None:
+                    continue
+                if scores is None:
+                    scores = self.scores.scores_for(user_id)
+                self._apply(indexes, user_id, scores)
+
+    def top(self, guild_id: str, category: str, limit: int = 10, offset: int = 0) -> List[Tuple[str, float]]:
+        """Get the top (user_id, score) pairs of a category within a guild."""
+        with self._lock:
+            index = self._guild_indexes(guild_id).get(category)
+            return index.top(limit, offset) if index else []
+
+    def rank(self, guild_id: str, category: str, user_id: str) -> Optional[int]:
+        """Get a user's 1-based rank in a category within a guild."""
+        with self._lock:
+            index = self._guild_indexes(guild_id).get(category)
+            return index.rank(user_id) if index else None
+
+    def reset_indexes(self) -> None:
+        """Drop built guild indexes so they are rebuilt from fresh scores."""
+        with self._lock:
+            self._indexes.clear()
+
+    def flush(self) -> int:
+        """Persist changed guild member lists and return how many were written."""
+        with self._lock:
+            if not self._dirty:
+                return 0
+            pending = {guild_id: sorted(self._members.get(guild_id, ())) for guild_id in self._dirty}
+            guilds = sorted(guild_id for guild_id, members in self._members.items() if members)
+            self._dirty.clear()
+
+        db = self.storage()
+        written = 0
+        for guild_id, members in pending.items():
+            try:
+                if members:
+                    db.set(self._guild_key(guild_id), members)
+                else:
+                    db.delete(self._guild_key(guild_id))
+                written += 1
+            except Exception as e:
+                logger.error(f"Error persisting members of guild {guild_id}: {e}")
+                with self._lock:
+                    self._dirty.add(guild_id)
+
+        db.set(self.meta_key, {"guilds": guilds})
+        return written
+
+    def _guild_indexes(self, guild_id: str) -> Dict[str, SortedIndex]:
+        """Get a guild's indexes, building them from global scores if needed (lock held)."""
+        self.load()
+        indexes = self._indexes.get(guild_id)
+        if indexes is None:
+            indexes = {}
+            for user_id in self._members.get(guild_id, ()):
+                self._apply(indexes, user_id, self.scores.scores_for(user_id))
+            self._indexes[guild_id] = indexes
+        return indexes
+
+    @staticmethod
+    def _apply(indexes: Dict[str, SortedIndex], user_id: str, scores: Dict[str, float]) -> None:
+        """Move a user to their new scores in one guild's indexes (lock held)."""
+        for category, index in indexes.items():
+            if category not in scores:
+                index.discard(user_id)
+        for category, score in scores.items():
+            index = indexes.get(category)
+            if index is None:
+                index = indexes[category] = SortedIndex()
+            index.set(user_id, score)
+
+    def _guild_key(self, guild_id: str) -> str:
+        return f"{self.key_prefix}{guild_id}"
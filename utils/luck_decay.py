@@ -0,0 +1,142 @@
+"""
+Daily decay of every player's luck points.
+
+Once per UTC day, positive luck decays by ``rate`` (``int(luck * rate)``).
+The job pages through profile keys in sorted order. For each page it reads
+the uncached profiles in one batch and writes field-level patches only for
+the players whose luck changed. Cached profiles are patched in the cache.
+Each changed profile also records the day in ``last_luck_decay``, so a
+player is never decayed twice on the same day.
+
+Progress is checkpointed under ``state_key`` after every page, so a run
+cut short resumes after the last finished page, and a finished day is not
+scanned again.
+"""
+import logging
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+from utils.patch import PatchOp, set_field
+
+logger = logging.getLogger(__name__)
+
+STATE_KEY = "luck_decay_state"
+DEFAULT_PAGE_SIZE = 500
+
+
+def decayed_luck(luck_points: int, rate: float) -> int:
+    """Get luck points after one day of decay (only positive luck decays)."""
+    return int(luck_points * rate) if luck_points > 0 else luck_points
+
+
+def utc_day(now: Optional[float] = None) -> str:
+    """Get the UTC date as YYYY-MM-DD."""
+    return datetime.fromtimestamp(time.time() if now is None else now, timezone.utc).strftime("%Y-%m-%d")
+
+
+class LuckDecayJob:
+    """Idempotent daily luck decay over every stored profile."""
+
+    def __init__(self, storage: Callable[[], Any], cache: Any, rate: float,
+                 key_prefix: str = "user_rpg_", state_key: str = STATE_KEY,
+                 name: str = "luck-decay"):
+        self.storage = storage
+        self.cache = cache
+        self.rate = rate
+        self.key_prefix = key_prefix
+        self.state_key = state_key
+        self.name = name
+
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.last_run: Optional[Dict[str, Any]] = None
+
+    def run(self, day: Optional[str] = None, page_size: int = DEFAULT_PAGE_SIZE,
+            progress: Optional[Callable[[int, int, int], Any]] = None) -> Dict[str, Any]:
+        """Decay luck for day (today, UTC) unless already done; returns the run's state.
+
+        progress(scanned, total, decayed) is called after every page.
+        """
+        day = day or utc_day()
+        with self._lock:
+            db = self.storage()
+            state = db.get(self.state_key) or {}
+            if state.get("day") == day and state.get("done"):
+                return dict(state, skipped=True)
+            if state.get("day") != day:
+                state = {"day": day, "last_key": None, "scanned": 0, "decayed": 0, "seconds": 0.0, "done": False}
+
+            started = time.perf_counter()
+            keys = sorted(db.keys(self.key_prefix))
+            total = len(keys)
+            if state["last_key"] is not None:
+                keys = [key for key in keys if key > state["last_key"]]
+            compute = self._decay_ops(day)
+
+            for start in range(0, len(keys), page_size):
+                if self._stop_event.is_set():
+                    break
+                page = keys[start:start + page_size]
+                state["decayed"] += self.cache.patch_stored(page, compute)
+                state["scanned"] += len(page)
+                state["last_key"] = page[-1]
+                state["seconds"] += time.perf_counter() - started
+                started = time.perf_counter()
+                db.set(self.state_key, state)
+                if progress is not None:
+                    progress(min(total, state["scanned"]), total, state["decayed"])
+            else:
+                state["done"] = True
+                state["seconds"] += time.perf_counter() - started
+                db.set(self.state_key, state)
+                logger.info(f"{self.name} for {day}: decayed {state['decayed']} of {state['scanned']} "
+                            f"players in {state['seconds']:.1f}s")
+
+            self.last_run = dict(state)
+            return dict(state)
+
+    def start(self, interval: float = 3600.0, page_size: int = DEFAULT_PAGE_SIZE) -> None:
+        """Check every interval seconds whether today's decay has run, and run it if not."""
+        if self._thread is not None or interval <= 0:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(
+            target=self._loop, args=(interval, page_size), name=self.name, daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the scheduler, letting a running pass finish its current page."""
+        self._stop_event.set()
+        thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout=30)
+        self._thread = None
+
+    def stats(self) -> Dict[str, Any]:
+        """Get the state of the most recent run."""
+        return {"rate": self.rate, "last_run": self.last_run}
+
+    def _decay_ops(self, day: str) -> Callable[[Dict[str, Any]], Optional[List[PatchOp]]]:
+        """Build the per-profile patch computation for one day."""
+        def compute(profile: Dict[str, Any]) -> Optional[List[PatchOp]]:
+            if profile.get("last_luck_decay") == day:
+                return None
+            luck_points = profile.get("luck_points") or 0
+            new_luck = decayed_luck(luck_points, self.rate)
+            if new_luck == luck_points:
+                return None
+            return [set_field("luck_points", new_luck), set_field("last_luck_decay", day)]
+        return compute
+
+    def _loop(self, interval: float, page_size: int) -> None:
+        """Run the day's decay once the day changes, until stopped."""
+        while not self._stop_event.is_set():
+            try:
+                self.run(page_size=page_size)
+            except Exception as e:
+                logger.error(f"Error in {self.name}: {e}")
+            self._stop_event.wait(interval)
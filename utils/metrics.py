@@ -0,0 +1,282 @@
+"""
+Latency and throughput instrumentation for storage-facing calls.
+
+Functions wrapped with ``instrumented`` record, per operation:
+
+- call and error counts (a call that logs an error through an instrumented
+  module's logger counts as failed, since these functions return defaults
+  instead of raising);
+- a latency histogram with logarithmic buckets (about 5% resolution), from
+  which p50/p95/p99 are read;
+- an estimate of the bytes moved, measured on a sample of calls.
+
+Calls with a key (``key="user_rpg_{user_id}"``, formatted from the call's
+arguments) also feed a space-saving sketch of the hottest keys, which keeps
+memory fixed at ``HOT_KEY_CAPACITY`` counters however many keys are seen.
+
+Storage time is also attributed to the bot command that caused it (set with
+``command_context``), counting only outermost instrumented calls so nested
+calls aren't counted twice.
+"""
+import contextvars
+import functools
+import inspect
+import json
+import logging
+import math
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Bucket i holds latencies up to BUCKET_BASE ** i microseconds
+BUCKET_BASE = 1.05
+HOT_KEY_CAPACITY = 100
+# Measure the byte size of one call in this many
+SIZE_SAMPLE_EVERY = 16
+
+current_command: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("current_command", default=None)
+
+_local = threading.local()
+
+
+class LatencyHistogram:
+    """Log-bucketed latency histogram with percentile estimates."""
+
+    __slots__ = ("buckets", "count", "total", "max")
+
+    def __init__(self):
+        self.buckets: Dict[int, int] = {}
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds: float) -> None:
+        micros = max(seconds * 1e6, 1.0)
+        bucket = math.ceil(math.log(micros, BUCKET_BASE))
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def percentile(self, fraction: float) -> float:
+        """Get the latency in seconds below which ``fraction`` of calls fall."""
+        if not self.count:
+            return 0.0
+        rank = fraction * self.count
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                return min(BUCKET_BASE ** bucket / 1e6, self.max)
+        return self.max
+
+
+class SpaceSaving:
+    """Space-saving heavy-hitters sketch over a bounded number of counters."""
+
+    def __init__(self, capacity: int = HOT_KEY_CAPACITY):
+        self.capacity = capacity
+        # key -> [count, overestimate]
+        self.counters: Dict[str, List[int]] = {}
+
+    def add(self, key: str) -> None:
+        counter = self.counters.get(key)
+        if counter is not None:
+            counter[0] += 1
+            return
+        if len(self.counters) < self.capacity:
+            self.counters[key] = [1, 0]
+            return
+        # Replace the smallest counter; the newcomer inherits its count as error
+        victim = min(self.counters, key=lambda k: self.counters[k][0])
+        count = self.counters.pop(victim)[0]
+        self.counters[key] = [count + 1, count]
+
+    def top(self, limit: int = 10) -> List[Tuple[str, int, int]]:
+        """Get (key, estimated count, maximum overestimate), hottest first."""
+        ranked = sorted(self.counters.items(), key=lambda item: -item[1][0])
+        return [(key, count, error) for key, (count, error) in ranked[:limit]]
+
+
+class _Operation:
+    """Counters of one instrumented operation."""
+
+    __slots__ = ("calls", "errors", "latency", "sampled_calls", "sampled_bytes")
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.latency = LatencyHistogram()
+        self.sampled_calls = 0
+        self.sampled_bytes = 0
+
+
+class MetricsRegistry:
+    """Thread-safe store of per-operation, per-command and hot-key metrics."""
+
+    def __init__(self, hot_key_capacity: int = HOT_KEY_CAPACITY):
+        self._lock = threading.Lock()
+        self._operations: Dict[str, _Operation] = {}
+        # command -> [invocations, storage calls, storage seconds]
+        self._commands: Dict[str, List[float]] = {}
+        self.hot_keys = SpaceSaving(hot_key_capacity)
+        self.started_at = time.time()
+
+    def record(self, operation: str, seconds: float, failed: bool, key: Optional[str] = None,
+               size: Optional[int] = None, command: Optional[str] = None) -> None:
+        with self._lock:
+            stats = self._operations.get(operation)
+            if stats is None:
+                stats = self._operations[operation] = _Operation()
+            stats.calls += 1
+            stats.latency.record(seconds)
+            if failed:
+                stats.errors += 1
+            if size is not None:
+                stats.sampled_calls += 1
+                stats.sampled_bytes += size
+            if key is not None:
+                self.hot_keys.add(key)
+            if command is not None:
+                counters = self._commands.setdefault(command, [0, 0, 0.0])
+                counters[1] += 1
+                counters[2] += seconds
+
+    def command_started(self, command: str) -> None:
+        """Count an invocation of a bot command."""
+        with self._lock:
+            self._commands.setdefault(command, [0, 0, 0.0])[0] += 1
+
+    def snapshot(self, hot_keys: int = 10) -> Dict[str, Any]:
+        """Get every metric as plain data, latencies in milliseconds."""
+        with self._lock:
+            operations = {}
+            for name, stats in self._operations.items():
+                latency = stats.latency
+                average_bytes = stats.sampled_bytes / stats.sampled_calls if stats.sampled_calls else 0
+                operations[name] = {
+                    "calls": stats.calls,
+                    "errors": stats.errors,
+                    "error_rate": stats.errors / stats.calls,
+                    "total_ms": latency.total * 1000,
+                    "mean_ms": latency.total / stats.calls * 1000,
+                    "p50_ms": latency.percentile(0.50) * 1000,
+                    "p95_ms": latency.percentile(0.95) * 1000,
+                    "p99_ms": latency.percentile(0.99) * 1000,
+                    "max_ms": latency.max * 1000,
+                    "avg_bytes": round(average_bytes),
+                    "est_bytes": round(average_bytes * stats.calls),
+                }
+            commands = {
+                name: {
+                    "invocations": int(invocations),
+                    "storage_calls": int(calls),
+                    "storage_ms": seconds * 1000,
+                    "storage_ms_per_invocation": seconds * 1000 / invocations if invocations else 0.0,
+                }
+                for name, (invocations, calls, seconds) in self._commands.items()
+            }
+            return {
+                "since": self.started_at,
+                "operations": operations,
+                "commands": commands,
+                "hot_keys": [
+                    {"key": key, "count": count, "error": error}
+                    for key, count, error in self.hot_keys.top(hot_keys)
+                ],
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._operations.clear()
+            self._commands.clear()
+            self.hot_keys = SpaceSaving(self.hot_keys.capacity)
+            self.started_at = time.time()
+
+
+registry = MetricsRegistry()
+
+
+class _ErrorCounter(logging.Handler):
+    """Counts error records logged on the current thread."""
+
+    def __init__(self):
+        super().__init__(level=logging.ERROR)
+
+    def emit(self, record: logging.LogRecord) -> None:
+        _local.errors = getattr(_local, "errors", 0) + 1
+
+
+_error_counter = _ErrorCounter()
+
+
+def watch_errors(module_logger: logging.Logger) -> None:
+    """Count errors logged by a module toward its instrumented calls."""
+    if _error_counter not in module_logger.handlers:
+        module_logger.addHandler(_error_counter)
+
+
+def _byte_size(value: Any) -> int:
+    try:
+        return len(json.dumps(value, separators=(",", ":"), default=str))
+    except (TypeError, ValueError):
+        return 0
+
+
+def instrumented(operation: Optional[str] = None, key: Optional[str] = None,
+                 size: Optional[str] = None) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+    """Record latency, errors, sampled sizes and hot keys of every call.
+
+    key is a format string over the call's arguments naming the storage key
+    it touches; size names the argument whose JSON size is sampled, or
+    "result" for the return value.
+    """
+    def decorator(func: Callable[..., Any]) -> Callable[..., Any]:
+        name = operation or func.__name__
+        signature = inspect.signature(func) if key or (size and size != "result") else None
+        calls = 0
+
+        @functools.wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            nonlocal calls
+            depth = getattr(_local, "depth", 0)
+            errors = getattr(_local, "errors", 0)
+            _local.depth = depth + 1
+            failed = True
+            started = time.perf_counter()
+            try:
+                result = func(*args, **kwargs)
+                failed = getattr(_local, "errors", 0) != errors
+                return result
+            finally:
+                elapsed = time.perf_counter() - started
+                _local.depth = depth
+                try:
+                    arguments = None
+                    if signature is not None:
+                        bound = signature.bind(*args, **kwargs)
+                        bound.apply_defaults()
+                        arguments = bound.arguments
+                    calls += 1
+                    sampled = None
+                    if size and calls % SIZE_SAMPLE_EVERY == 1 and not failed:
+                        sampled = _byte_size(result if size == "result" else arguments.get(size))
+                    registry.record(
+                        name, elapsed, failed,
+                        key=key.format(**arguments) if key else None,
+                        size=sampled,
+                        command=current_command.get() if depth == 0 else None
+                    )
+                except Exception as e:
+                    logger.debug(f"Error recording metrics for {name}: {e}")
+
+        return wrapper
+    return decorator
+
+
+def command_context(command: str) -> None:
+    """Attribute the current task's storage calls to a bot command."""
+    current_command.set(command)
+    registry.command_started(command)
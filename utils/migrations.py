@@ -0,0 +1,95 @@
+"""
+Lazy, versioned migrations for stored documents.
+
+Each document carries a ``schema_version`` field. A registry holds one
+migration per version step; ``upgrade`` runs every step between a document's
+version and the latest one, in order. Migrations run when a document is
+first read (see the profile cache's ``upgrader``), and the upgraded form is
+written back by the normal cache flush. A bulk pass can rewrite the rest in
+the background, so there is never a stop-the-world migration.
+
+Migrations receive a plain document and modify it in place. They must be
+idempotent: a document may be upgraded again if a write-back was lost.
+"""
+import copy
+from typing import Any, Callable, Dict
+
+from utils.codec import Nested, PROFILE_SCHEMA_V1
+from utils.inventory import to_inventory
+
+VERSION_FIELD = "schema_version"
+
+Migration = Callable[[Dict[str, Any]], None]
+
+
+class MigrationRegistry:
+    """Ordered migration steps for one kind of document."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._steps: Dict[int, Migration] = {}
+
+    @property
+    def version(self) -> int:
+        """The schema version documents are upgraded to."""
+        return max(self._steps) + 1 if self._steps else 0
+
+    def register(self, from_version: int) -> Callable[[Migration], Migration]:
+        """Decorator registering the step that upgrades from_version to from_version + 1."""
+        def decorator(fn: Migration) -> Migration:
+            if from_version in self._steps:
+                raise ValueError(f"{self.name} migration from version {from_version} already registered")
+            self._steps[from_version] = fn
+            return fn
+        return decorator
+
+    def needs_upgrade(self, document: Dict[str, Any]) -> bool:
+        """Check whether a document is behind the latest schema version."""
+        return document.get(VERSION_FIELD, 0) < self.version
+
+    def upgrade(self, document: Dict[str, Any]) -> bool:
+        """Upgrade a document in place; returns True if anything was changed."""
+        version = document.get(VERSION_FIELD, 0)
+        if version >= self.version:
+            return False
+        for step in range(version, self.version):
+            migration = self._steps.get(step)
+            if migration is None:
+                raise ValueError(f"No {self.name} migration from version {step}")
+            migration(document)
+            document[VERSION_FIELD] = step + 1
+        return True
+
+
+def _fill_defaults(document: Dict[str, Any], fields) -> None:
+    """Add any schema field missing from a document, recursing into nested objects."""
+    for name, default in fields:
+        if isinstance(default, Nested):
+            value = document.get(name)
+            if not isinstance(value, dict):
+                value = document[name] = {}
+            _fill_defaults(value, default.fields)
+        elif name not in document:
+            document[name] = copy.deepcopy(default)
+
+
+profile_migrations = MigrationRegistry("profile")
+
+
+@profile_migrations.register(0)
+def _profile_v0_to_v1(profile: Dict[str, Any]) -> None:
+    """Fill fields added to create_user_profile since a record was created and
+    move PvP counters out of stats to the top-level fields."""
+    stats = profile.get("stats")
+    if isinstance(stats, dict):
+        for name in ("pvp_wins", "pvp_losses"):
+            if name in stats:
+                # Both copies counted the same battles; keep the larger
+                profile[name] = max(profile.get(name) or 0, stats.pop(name) or 0)
+    _fill_defaults(profile, PROFILE_SCHEMA_V1)
+
+
+@profile_migrations.register(1)
+def _profile_v1_to_v2(profile: Dict[str, Any]) -> None:
+    """Store the inventory as item name -> quantity instead of a list of names."""
+    profile["inventory"] = to_inventory(profile.get("inventory"))
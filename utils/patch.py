@@ -0,0 +1,116 @@
+"""
+Field-level patches for JSON documents.
+
+A patch is a list of ``(op, path, value)`` operations applied in order, where
+``path`` is a dotted field path such as ``coins`` or ``stats.battles_won``:
+
+- ``set``: replace the value at path
+- ``incr``: add a number to the value at path (missing counts as 0)
+- ``push``: append an item to the list at path (missing counts as [])
+- ``unset``: remove the field at path (value is ignored)
+
+Missing parent objects are created on the way down, so applying a patch never
+fails on a partially initialised document.
+"""
+import copy
+from typing import Any, Dict, List, Optional, Tuple
+
+PatchOp = Tuple[str, str, Any]
+
+OPS = ("set", "incr", "push", "unset")
+
+
+def set_field(path: str, value: Any) -> PatchOp:
+    """Build a set operation."""
+    return ("set", path, value)
+
+
+def incr(path: str, amount: float = 1) -> PatchOp:
+    """Build an increment operation."""
+    return ("incr", path, amount)
+
+
+def push(path: str, item: Any) -> PatchOp:
+    """Build a list append operation."""
+    return ("push", path, item)
+
+
+def unset(path: str) -> PatchOp:
+    """Build a field removal operation."""
+    return ("unset", path, None)
+
+
+def split_path(path: str) -> List[str]:
+    """Split a dotted path into its field names."""
+    parts = path.split(".")
+    if not all(parts):
+        raise ValueError(f"Invalid patch path '{path}'")
+    return parts
+
+
+def apply_patch(document: Dict[str, Any], ops: List[PatchOp]) -> Dict[str, Any]:
+    """Apply ops to document in place and return it."""
+    for op, path, value in ops:
+        if op not in OPS:
+            raise ValueError(f"Unknown patch operation '{op}'")
+
+        *parents, field = split_path(path)
+        target = document
+        for name in parents:
+            child = target.get(name)
+            if not isinstance(child, dict):
+                if op == "unset":
+                    break
+                child = target[name] = {}
+            target = child
+        else:
+            if op == "set":
+                target[field] = copy.deepcopy(value)
+            elif op == "incr":
+                target[field] = (target.get(field) or 0) + value
+            elif op == "push":
+                items = target.get(field)
+                if not isinstance(items, list):
+                    items = target[field] = []
+                items.append(copy.deepcopy(value))
+            else:
+                target.pop(field, None)
+    return document
+
+
+def diff(old: Dict[str, Any], new: Dict[str, Any], prefix: str = "") -> Optional[List[PatchOp]]:
+    """Compute ops that turn old into new, or None if a field name can't be a path.
+
+    Nested objects are diffed field by field, and lists that only grew at the
+    end become pushes, so the patch carries just the changed leaves.
+    """
+    ops: List[PatchOp] = []
+    for name, value in new.items():
+        if not isinstance(name, str) or not name or "." in name:
+            return None
+
+        path = f"{prefix}{name}"
+        if name not in old:
+            ops.append(set_field(path, value))
+            continue
+
+        previous = old[name]
+        if previous == value:
+            continue
+        if isinstance(previous, dict) and isinstance(value, dict):
+            nested = diff(previous, value, f"{path}.")
+            if nested is None:
+                return None
+            ops.extend(nested)
+        elif (isinstance(previous, list) and isinstance(value, list)
+              and len(value) > len(previous) and value[:len(previous)] == previous):
+            ops.extend(push(path, item) for item in value[len(previous):])
+        else:
+            ops.append(set_field(path, value))
+
+    for name in old:
+        if name not in new:
+            if not isinstance(name, str) or not name or "." in name:
+                return None
+            ops.append(unset(f"{prefix}{name}"))
+    return ops
@@ -1,13 +1,121 @@
+import bisect
+import json
 import random
 import logging
-from typing import Dict, Any, List, Optional, Union
+import secrets
+from functools import lru_cache
+from typing import Callable, Dict, Any, List, Optional, Sequence, Tuple, Union
 from datetime import datetime
 
 from utils.database import get_user_rpg_data, update_user_rpg_data
-from utils.constants import LUCK_LEVELS
+from utils.constants import LUCK_LEVELS, RARITY_WEIGHTS, RPG_CONSTANTS
+from utils.luck_decay import decayed_luck, utc_day
 
 logger = logging.getLogger(__name__)
 
+@lru_cache(maxsize=256)
+def _alias_table(weights: Tuple[float, ...]) -> Tuple[Tuple[float, ...], Tuple[int, ...]]:
+    """Build a Vose alias table (probabilities, aliases) for a weight tuple.
+
+    Negative weights count as zero; if no weight is positive, every outcome
+    is equally likely.
+    """
+    n = len(weights)
+    weights = [max(weight, 0.0) for weight in weights]
+    total = sum(weights)
+    if total <= 0:
+        return (1.0,) * n, tuple(range(n))
+
+    scaled = [weight * n / total for weight in weights]
+    prob = [1.0] * n
+    alias = list(range(n))
+    small = [i for i, p in enumerate(scaled) if p < 1.0]
+    large = [i for i, p in enumerate(scaled) if p >= 1.0]
+    while small and large:
+        less, more = small.pop(), large.pop()
+        prob[less] = scaled[less]
+        alias[less] = more
+        scaled[more] += scaled[less] - 1.0
+        (small if scaled[more] < 1.0 else large).append(more)
+    # Whatever is left is 1 up to rounding error
+    return tuple(prob), tuple(alias)
+
+def _alias_draw(table: Tuple[Tuple[float, ...], Tuple[int, ...]], rng: Any = random) -> int:
+    """Draw an index from an alias table with a single random number."""
+    prob, alias = table
+    u = rng.random() * len(prob)
+    index = int(u)
+    return index if u - index < prob[index] else alias[index]
+
+class AliasSampler:
+    """Weighted sampler over fixed outcomes: O(n) to build, O(1) per draw."""
+
+    __slots__ = ("outcomes", "_table")
+
+    def __init__(self, outcomes: Sequence[Any], weights: Sequence[float]):
+        if len(outcomes) != len(weights):
+            raise ValueError("outcomes and weights must have the same length")
+        if not outcomes:
+            raise ValueError("AliasSampler needs at least one outcome")
+        self.outcomes = tuple(outcomes)
+        self._table = _alias_table(tuple(float(weight) for weight in weights))
+
+    @classmethod
+    def from_weights(cls, weights: Dict[Any, float]) -> "AliasSampler":
+        """Build a sampler from an outcome -> weight mapping."""
+        return cls(list(weights), list(weights.values()))
+
+    def sample(self, rng: Any = random) -> Any:
+        """Draw one outcome; rng is any object with a random() method."""
+        return self.outcomes[_alias_draw(self._table, rng)]
+
+# Item rarity draws, using the exact RARITY_WEIGHTS (tiny weights included)
+rarity_sampler = AliasSampler.from_weights(RARITY_WEIGHTS)
+
+# Log prefix of session records, parsed by scripts/replay_session.py
+SESSION_LOG_PREFIX = "RNG session "
+
+class SessionRNG(random.Random):
+    """Private random stream for one game session (a battle, adventure or lootbox opening).
+
+    Every roll of the session draws from this stream instead of the global
+    ``random`` module, so the session is fully determined by its seed and
+    inputs. ``record`` logs both, which lets scripts/replay_session.py
+    re-execute the session offline.
+    """
+
+    def __init__(self, kind: str, user_id: str, seed: Optional[int] = None):
+        self.kind = kind
+        self.user_id = str(user_id)
+        self.seed_value = secrets.randbits(64) if seed is None else int(seed)
+        super().__init__(self.seed_value)
+
+    def record(self, **details: Any) -> Dict[str, Any]:
+        """Log the session's seed with its inputs and outcome as one JSON line."""
+        entry = {'kind': self.kind, 'user_id': self.user_id, 'seed': self.seed_value, **details}
+        logger.info(SESSION_LOG_PREFIX + json.dumps(entry, sort_keys=True, default=str))
+        return entry
+
+    def attempt(self, fn: Callable[[Any], Any]) -> Callable[[Any], Any]:
+        """Wrap a mutate callback so a retried attempt redraws the same numbers.
+
+        mutate_user_rpg_data re-runs its callback when the write conflicts;
+        rewinding the stream keeps the recorded session in step with what
+        the player actually got.
+        """
+        state = self.getstate()
+
+        def run(data: Any) -> Any:
+            self.setstate(state)
+            return fn(data)
+        return run
+
+def start_session(kind: str, user_id: str, seed: Optional[int] = None) -> SessionRNG:
+    """Start a seeded session stream, logging its seed right away."""
+    rng = SessionRNG(kind, user_id, seed)
+    logger.debug(f"Started {kind} session for {rng.user_id} with seed {rng.seed_value}")
+    return rng
+
 def get_user_luck_points(user_id: str) -> int:
     """Get user's current luck points."""
     try:
@@ -35,51 +143,82 @@ def add_luck_points(user_id: str, points: int) -> bool:
         logger.error(f"Error adding luck points for {user_id}: {e}")
         return False
 
-def get_luck_status(user_id: str) -> Dict[str, Any]:
+# Luck levels sorted by lower bound, for bisecting on luck points
+_LUCK_BANDS = sorted((data['min'], data['max'], level) for level, data in LUCK_LEVELS.items())
+_LUCK_MINIMUMS = [band[0] for band in _LUCK_BANDS]
+
+def get_luck_level(luck_points: int) -> str:
+    """Get the luck level whose range holds luck_points ('normal' outside every range)."""
+    index = bisect.bisect_right(_LUCK_MINIMUMS, luck_points) - 1
+    if index >= 0 and luck_points <= _LUCK_BANDS[index][1]:
+        return _LUCK_BANDS[index][2]
+    return 'normal'
+
+class LuckContext:
+    """A player's luck, resolved once so luck-aware rolls don't read storage.
+
+    Build it from profile data already loaded for the interaction and pass
+    it as ``luck=`` to the helpers below; without one they load the profile
+    themselves.
+    """
+
+    __slots__ = ("points", "level", "emoji", "bonus_percent", "multiplier")
+
+    def __init__(self, luck_points: int = 0):
+        self.points = luck_points
+        self.level = get_luck_level(luck_points)
+        luck_data = LUCK_LEVELS[self.level]
+        self.emoji = luck_data['emoji']
+        self.bonus_percent = luck_data['bonus_percent']
+        self.multiplier = 1 + self.bonus_percent / 100
+
+    @classmethod
+    def from_player_data(cls, player_data: Optional[Dict[str, Any]]) -> "LuckContext":
+        """Resolve luck from a loaded profile."""
+        return cls((player_data or {}).get('luck_points', 0))
+
+    @classmethod
+    def for_user(cls, user_id: str) -> "LuckContext":
+        """Resolve luck by loading a user's profile."""
+        return cls(get_user_luck_points(user_id))
+
+    def as_status(self) -> Dict[str, Any]:
+        """Get the luck status dict returned by get_luck_status."""
+        return {
+            'level': self.level,
+            'points': self.points,
+            'emoji': self.emoji,
+            'bonus_percent': self.bonus_percent
+        }
+
+def get_luck_status(user_id: str, luck: Optional[LuckContext] = None) -> Dict[str, Any]:
     """Get user's luck status with level and bonus."""
-    luck_points = get_user_luck_points(user_id)
-    
-    # Determine luck level
-    luck_level = 'normal'
-    for level, data in LUCK_LEVELS.items():
-        if data['min'] <= luck_points <= data['max']:
-            luck_level = level
-            break
-    
-    luck_data = LUCK_LEVELS[luck_level]
-    
-    return {
-        'level': luck_level,
-        'points': luck_points,
-        'emoji': luck_data['emoji'],
-        'bonus_percent': luck_data['bonus_percent']
-    }
-
-def roll_with_luck(user_id: str, base_chance: float) -> bool:
+    return (luck or LuckContext.for_user(user_id)).as_status()
+
+def roll_with_luck(user_id: str, base_chance: float, luck: Optional[LuckContext] = None,
+                   rng: Any = random) -> bool:
     """Roll with luck bonus applied."""
     try:
-        luck_status = get_luck_status(user_id)
-        bonus_percent = luck_status['bonus_percent']
+        luck = luck or LuckContext.for_user(user_id)
         
         # Apply luck bonus to chance
-        modified_chance = base_chance * (1 + bonus_percent / 100)
+        modified_chance = base_chance * luck.multiplier
         modified_chance = max(0.0, min(1.0, modified_chance))  # Clamp between 0 and 1
         
-        return random.random() < modified_chance
+        return rng.random() < modified_chance
     except Exception as e:
         logger.error(f"Error rolling with luck for {user_id}: {e}")
-        return random.random() < base_chance
+        return rng.random() < base_chance
 
-def generate_loot_with_luck(user_id: str, base_loot: Dict[str, int]) -> Dict[str, int]:
+def generate_loot_with_luck(user_id: str, base_loot: Dict[str, int], luck: Optional[LuckContext] = None) -> Dict[str, int]:
     """Generate loot with luck bonuses applied."""
     try:
-        luck_status = get_luck_status(user_id)
-        bonus_percent = luck_status['bonus_percent']
+        luck = luck or LuckContext.for_user(user_id)
+        bonus_multiplier = luck.multiplier
         
         enhanced_loot = {}
         for item, amount in base_loot.items():
             # Apply luck bonus
-            bonus_multiplier = 1 + (bonus_percent / 100)
             enhanced_amount = int(amount * bonus_multiplier)
             enhanced_loot[item] = max(1, enhanced_amount)  # Minimum 1
             
@@ -88,64 +227,59 @@ def generate_loot_with_luck(user_id: str, base_loot: Dict[str, int]) -> Dict[str
         logger.error(f"Error generating loot with luck for {user_id}: {e}")
         return base_loot
 
-def check_rare_event(user_id: str, base_chance: float = 0.01) -> bool:
+def check_rare_event(user_id: str, base_chance: float = 0.01, luck: Optional[LuckContext] = None,
+                     rng: Any = random) -> bool:
     """Check if a rare event occurs with luck bonus."""
-    return roll_with_luck(user_id, base_chance)
+    return roll_with_luck(user_id, base_chance, luck, rng)
 
-def weighted_random_choice(items: List[Dict[str, Any]], weight_key: str = 'weight') -> Optional[Dict[str, Any]]:
+def weighted_random_choice(items: List[Dict[str, Any]], weight_key: str = 'weight',
+                           rng: Any = random) -> Optional[Dict[str, Any]]:
     """Choose a random item from a weighted list."""
     try:
         if not items:
             return None
-            
-        total_weight = sum(item.get(weight_key, 1) for item in items)
-        if total_weight <= 0:
-            return random.choice(items)
-            
-        random_value = random.uniform(0, total_weight)
-        current_weight = 0
-        
-        for item in items:
-            current_weight += item.get(weight_key, 1)
-            if random_value <= current_weight:
-                return item
-                
-        return items[-1]  # Fallback to last item
+
+        # Alias tables are cached per weight tuple, so repeated draws over the
+        # same weights (encounter tables, loot tables) cost O(n) only once
+        weights = tuple(float(item.get(weight_key, 1)) for item in items)
+        return items[_alias_draw(_alias_table(weights), rng)]
     except Exception as e:
         logger.error(f"Error in weighted random choice: {e}")
-        return random.choice(items) if items else None
+        return rng.choice(items) if items else None
 
-def calculate_critical_chance(user_id: str, base_chance: float = 0.1) -> float:
+def calculate_critical_chance(user_id: str, base_chance: float = 0.1, luck: Optional[LuckContext] = None) -> float:
     """Calculate critical hit chance with luck bonus."""
     try:
-        luck_status = get_luck_status(user_id)
-        bonus_percent = luck_status['bonus_percent']
+        luck = luck or LuckContext.for_user(user_id)
         
         # Apply luck bonus to critical chance
-        modified_chance = base_chance * (1 + bonus_percent / 100)
+        modified_chance = base_chance * luck.multiplier
         return max(0.0, min(1.0, modified_chance))  # Clamp between 0 and 1
     except Exception as e:
         logger.error(f"Error calculating critical chance for {user_id}: {e}")
         return base_chance
 
-def roll_critical_hit(user_id: str, base_chance: float = 0.1) -> bool:
+def roll_critical_hit(user_id: str, base_chance: float = 0.1, luck: Optional[LuckContext] = None,
+                      rng: Any = random) -> bool:
     """Roll for critical hit with luck bonus."""
-    critical_chance = calculate_critical_chance(user_id, base_chance)
-    return random.random() < critical_chance
+    critical_chance = calculate_critical_chance(user_id, base_chance, luck)
+    return rng.random() < critical_chance
 
-def decay_luck_daily(user_id: str, decay_rate: float = 0.95) -> bool:
-    """Apply daily luck decay."""
+def decay_luck_daily(user_id: str, decay_rate: float = RPG_CONSTANTS['luck_decay']) -> bool:
+    """Apply today's luck decay to one user (the daily job does every player)."""
     try:
         player_data = get_user_rpg_data(user_id)
         if not player_data:
             return False
             
         current_luck = player_data.get('luck_points', 0)
+        today = utc_day()
         
-        # Only decay if luck is positive
-        if current_luck > 0:
-            new_luck = int(current_luck * decay_rate)
+        # Only decay if luck is positive, and once per UTC day
+        new_luck = decayed_luck(current_luck, decay_rate)
+        if new_luck != current_luck and player_data.get('last_luck_decay') != today:
             player_data['luck_points'] = new_luck
+            player_data['last_luck_decay'] = today
             return update_user_rpg_data(user_id, player_data)
             
         return True
@@ -153,7 +287,8 @@ def decay_luck_daily(user_id: str, decay_rate: float = 0.95) -> bool:
         logger.error(f"Error decaying luck for {user_id}: {e}")
         return False
 
-def generate_random_encounter(user_id: str, location: str) -> Optional[Dict[str, Any]]:
+def generate_random_encounter(user_id: str, location: str, luck: Optional[LuckContext] = None,
+                              rng: Any = random) -> Optional[Dict[str, Any]]:
     """Generate a random encounter with luck affecting rarity."""
     try:
         # Base encounter chances
@@ -166,8 +301,7 @@ def generate_random_encounter(user_id: str, location: str) -> Optional[Dict[str,
         ]
         
         # Modify weights based on luck
-        luck_status = get_luck_status(user_id)
-        bonus_percent = luck_status['bonus_percent']
+        bonus_percent = (luck or LuckContext.for_user(user_id)).bonus_percent
         
         if bonus_percent > 0:
             # Increase rare encounter weights
@@ -181,16 +315,16 @@ def generate_random_encounter(user_id: str, location: str) -> Optional[Dict[str,
                     encounter['weight'] *= (1 + bonus_percent / 100)
                     encounter['weight'] = max(1, encounter['weight'])
         
-        return weighted_random_choice(encounters)
+        return weighted_random_choice(encounters, rng=rng)
     except Exception as e:
         logger.error(f"Error generating random encounter for {user_id}: {e}")
         return None
 
-def apply_luck_effect(user_id: str, effect_type: str, base_value: Union[int, float]) -> Union[int, float]:
+def apply_luck_effect(user_id: str, effect_type: str, base_value: Union[int, float],
+                      luck: Optional[LuckContext] = None) -> Union[int, float]:
     """Apply luck effect to a value."""
     try:
-        luck_status = get_luck_status(user_id)
-        bonus_percent = luck_status['bonus_percent']
+        bonus_percent = (luck or LuckContext.for_user(user_id)).bonus_percent
         
         if effect_type == 'reward':
             # Positive luck increases rewards
@@ -210,10 +344,10 @@ def apply_luck_effect(user_id: str, effect_type: str, base_value: Union[int, flo
         logger.error(f"Error applying luck effect for {user_id}: {e}")
         return base_value
 
-def get_luck_description(user_id: str) -> str:
+def get_luck_description(user_id: str, luck: Optional[LuckContext] = None) -> str:
     """Get a description of user's current luck status."""
     try:
-        luck_status = get_luck_status(user_id)
+        luck_status = get_luck_status(user_id, luck)
         level = luck_status['level']
         points = luck_status['points']
         emoji = luck_status['emoji']
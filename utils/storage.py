@@ -0,0 +1,326 @@
+"""
+Pluggable key-value storage backends for the bot.
+
+The backend is selected with the STORAGE_BACKEND environment variable:
+``replit`` (default) talks to Replit DB over HTTP, ``sqlite`` uses a local
+SQLite file in WAL mode (path from SQLITE_DB_PATH).
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from utils.patch import PatchOp, apply_patch, split_path
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BACKEND = "replit"
+DEFAULT_SQLITE_PATH = "bot_data.sqlite3"
+# Keys per statement in batched SQLite reads (SQLite caps bound parameters)
+SQLITE_BATCH_SIZE = 500
+
+_MISSING = object()
+
+
+class StorageBackend:
+    """Base interface every storage backend implements."""
+
+    name = "base"
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Return the stored value for key, or default if it does not exist."""
+        raise NotImplementedError
+
+    def set(self, key: str, value: Any) -> None:
+        """Store a JSON-serializable value under key."""
+        raise NotImplementedError
+
+    def delete(self, key: str) -> None:
+        """Delete key if it exists."""
+        raise NotImplementedError
+
+    def exists(self, key: str) -> bool:
+        """Check whether key exists."""
+        return self.get(key, _MISSING) is not _MISSING
+
+    def keys(self, prefix: str = "") -> List[str]:
+        """List all keys starting with prefix."""
+        raise NotImplementedError
+
+    def get_many(self, keys: List[str]) -> Dict[str, Any]:
+        """Return the stored values of several keys; missing keys are left out."""
+        values = {}
+        for key in keys:
+            value = self.get(key, _MISSING)
+            if value is not _MISSING:
+                values[key] = value
+        return values
+
+    def set_many(self, items: Dict[str, Any]) -> None:
+        """Store several JSON-serializable values."""
+        for key, value in items.items():
+            self.set(key, value)
+
+    def patch(self, key: str, ops: List[PatchOp]) -> bool:
+        """Apply field-level patch ops to a stored document; False if key is missing."""
+        document = self.get(key, _MISSING)
+        if document is _MISSING:
+            return False
+        self.set(key, apply_patch(document, ops))
+        return True
+
+    def close(self) -> None:
+        """Release any resources held by the backend."""
+
+    # Mapping-style helpers so existing ``db[key]`` code keeps working
+    def __contains__(self, key: str) -> bool:
+        return self.exists(key)
+
+    def __getitem__(self, key: str) -> Any:
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        self.set(key, value)
+
+    def __delitem__(self, key: str) -> None:
+        self.delete(key)
+
+
+class ReplitBackend(StorageBackend):
+    """Replit DB backend (remote HTTP key-value store)."""
+
+    name = "replit"
+
+    def __init__(self, concurrency: Optional[int] = None):
+        from replit import db
+        if db is None:
+            raise RuntimeError("Replit DB is not available (REPLIT_DB_URL not set)")
+        self._db = db
+        # Replit DB has no batch endpoint; batches are sent as concurrent requests
+        self._pool = ThreadPoolExecutor(
+            max_workers=concurrency or int(os.getenv("REPLIT_DB_CONCURRENCY", 8)),
+            thread_name_prefix="replit-db"
+        )
+
+    def get(self, key: str, default: Any = None) -> Any:
+        try:
+            # get_raw skips the Observed* wrappers, which write back on mutation
+            return json.loads(self._db.get_raw(key))
+        except KeyError:
+            return default
+
+    def set(self, key: str, value: Any) -> None:
+        self._db[key] = value
+
+    def delete(self, key: str) -> None:
+        try:
+            del self._db[key]
+        except KeyError:
+            pass
+
+    def exists(self, key: str) -> bool:
+        return key in self._db
+
+    def keys(self, prefix: str = "") -> List[str]:
+        return list(self._db.prefix(prefix))
+
+    def get_many(self, keys: List[str]) -> Dict[str, Any]:
+        keys = list(dict.fromkeys(keys))
+        values = self._pool.map(lambda key: self.get(key, _MISSING), keys)
+        return {key: value for key, value in zip(keys, values) if value is not _MISSING}
+
+    def set_many(self, items: Dict[str, Any]) -> None:
+        # list() drains the iterator so write errors are raised here
+        list(self._pool.map(lambda item: self.set(*item), items.items()))
+
+    def close(self) -> None:
+        self._pool.shutdown(wait=True)
+
+
+class SQLiteBackend(StorageBackend):
+    """Local SQLite backend running in WAL mode."""
+
+    name = "sqlite"
+
+    def __init__(self, path: str = DEFAULT_SQLITE_PATH):
+        self.path = path
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS kv ("
+            "key TEXT PRIMARY KEY, "
+            "value TEXT NOT NULL"
+            ") WITHOUT ROWID"
+        )
+
+    def get(self, key: str, default: Any = None) -> Any:
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM kv WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return default
+        return json.loads(row[0])
+
+    def set(self, key: str, value: Any) -> None:
+        payload = json.dumps(value)
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO kv (key, value) VALUES (?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+                (key, payload)
+            )
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM kv WHERE key = ?", (key,))
+
+    def get_many(self, keys: List[str]) -> Dict[str, Any]:
+        keys = list(dict.fromkeys(keys))
+        rows = []
+        with self._lock:
+            for start in range(0, len(keys), SQLITE_BATCH_SIZE):
+                chunk = keys[start:start + SQLITE_BATCH_SIZE]
+                placeholders = ", ".join("?" * len(chunk))
+                rows.extend(self._conn.execute(
+                    f"SELECT key, value FROM kv WHERE key IN ({placeholders})", chunk
+                ).fetchall())
+        return {key: json.loads(value) for key, value in rows}
+
+    def set_many(self, items: Dict[str, Any]) -> None:
+        payloads = [(key, json.dumps(value)) for key, value in items.items()]
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    "INSERT INTO kv (key, value) VALUES (?, ?) "
+                    "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+                    payloads
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def exists(self, key: str) -> bool:
+        with self._lock:
+            row = self._conn.execute("SELECT 1 FROM kv WHERE key = ?", (key,)).fetchone()
+        return row is not None
+
+    def patch(self, key: str, ops: List[PatchOp]) -> bool:
+        statements = []
+        for op, path, value in ops:
+            parts = split_path(path)
+            if any('"' in part for part in parts):
+                # Not expressible as a JSON path label; patch in Python instead
+                return super().patch(key, ops)
+            # Create missing parent objects the same way apply_patch does
+            if op != "unset":
+                for depth in range(1, len(parts)):
+                    parent = self._json_path(parts[:depth])
+                    statements.append((
+                        "UPDATE kv SET value = json_set(value, ?, json('{}')) "
+                        "WHERE key = ? AND json_type(value, ?) IS NOT 'object'",
+                        (parent, key, parent)
+                    ))
+            statements.append(self._patch_statement(key, op, self._json_path(parts), value))
+
+        with self._lock:
+            if self._conn.execute("SELECT 1 FROM kv WHERE key = ?", (key,)).fetchone() is None:
+                return False
+            self._conn.execute("BEGIN")
+            try:
+                for sql, params in statements:
+                    self._conn.execute(sql, params)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return True
+
+    @staticmethod
+    def _json_path(parts: List[str]) -> str:
+        return "$" + "".join(f'."{part}"' for part in parts)
+
+    @staticmethod
+    def _patch_statement(key: str, op: str, path: str, value: Any):
+        """Build the UPDATE applying one patch op with SQLite's JSON functions."""
+        if op == "set":
+            return "UPDATE kv SET value = json_set(value, ?, json(?)) WHERE key = ?", (path, json.dumps(value), key)
+        if op == "incr":
+            return (
+                "UPDATE kv SET value = json_set(value, ?, coalesce(json_extract(value, ?), 0) + ?) WHERE key = ?",
+                (path, path, value, key)
+            )
+        if op == "push":
+            return (
+                "UPDATE kv SET value = json_set(value, ?, json(json_insert("
+                "CASE WHEN json_type(value, ?) = 'array' THEN json_extract(value, ?) ELSE '[]' END, "
+                "'$[#]', json(?)))) WHERE key = ?",
+                (path, path, path, json.dumps(value), key)
+            )
+        if op == "unset":
+            return "UPDATE kv SET value = json_remove(value, ?) WHERE key = ?", (path, key)
+        raise ValueError(f"Unknown patch operation '{op}'")
+
+    def keys(self, prefix: str = "") -> List[str]:
+        with self._lock:
+            if not prefix:
+                rows = self._conn.execute("SELECT key FROM kv ORDER BY key").fetchall()
+            else:
+                # Range scan keeps the primary key index in play (LIKE would not)
+                rows = self._conn.execute(
+                    "SELECT key FROM kv WHERE key >= ? AND key < ? ORDER BY key",
+                    (prefix, prefix + "\U0010ffff")
+                ).fetchall()
+        return [row[0] for row in rows]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+BACKENDS = {
+    ReplitBackend.name: ReplitBackend,
+    SQLiteBackend.name: SQLiteBackend,
+}
+
+_storage: Optional[StorageBackend] = None
+_storage_lock = threading.Lock()
+
+
+def create_backend(name: str, **options: Any) -> StorageBackend:
+    """Instantiate a storage backend by name."""
+    name = name.lower()
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown storage backend '{name}' (available: {', '.join(BACKENDS)})")
+    if name == SQLiteBackend.name and "path" not in options:
+        options["path"] = os.getenv("SQLITE_DB_PATH", DEFAULT_SQLITE_PATH)
+    return BACKENDS[name](**options)
+
+
+def get_storage() -> StorageBackend:
+    """Get the process-wide storage backend selected by STORAGE_BACKEND."""
+    global _storage
+    if _storage is None:
+        with _storage_lock:
+            if _storage is None:
+                name = os.getenv("STORAGE_BACKEND", DEFAULT_BACKEND)
+                _storage = create_backend(name)
+                logger.info(f"Using '{_storage.name}' storage backend")
+    return _storage
+
+
+def close_storage() -> None:
+    """Close the process-wide storage backend."""
+    global _storage
+    with _storage_lock:
+        if _storage is not None:
+            _storage.close()
+            _storage = None
@@ -0,0 +1,178 @@
+"""
+Bulk copy of every key from one storage backend to another.
+
+Used to move a populated bot off Replit DB onto the local SQLite store while
+the bot is stopped. Keys are enumerated per prefix and copied in sorted
+order, one page at a time:
+
+- pages are fetched with the source's ``get_many`` (concurrent requests on
+  Replit DB, bounded by its pool size) while the previous page is written;
+- each page is written to the target with one ``set_many`` (a single
+  transaction on SQLite);
+- after every page, a checkpoint records the last copied key of the prefix
+  with a running count and checksum, so an interrupted copy resumes where it
+  stopped.
+
+``verify_copy`` then compares key counts per prefix on both sides and the
+target's checksum against the one computed while reading the source.
+
+Checksums are the sum of CRC32s of each key and its canonical JSON value,
+so they don't depend on the order keys are read in.
+"""
+import json
+import logging
+import os
+import time
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_VERSION = 1
+DEFAULT_BATCH_SIZE = 2000
+# Pages fetched ahead of the one being written
+DEFAULT_PREFETCH = 2
+CHECKSUM_MOD = 2 ** 64
+
+
+def _record_checksum(key: str, value: Any) -> int:
+    """CRC32 of a key and its value's canonical JSON form."""
+    payload = json.dumps(value, sort_keys=True, separators=(",", ":"))
+    return zlib.crc32(f"{key}\0{payload}".encode())
+
+
+def _owner(key: str, prefixes: List[str]) -> Optional[str]:
+    """Get the longest listed prefix a key falls under."""
+    best = None
+    for prefix in prefixes:
+        if key.startswith(prefix) and (best is None or len(prefix) > len(best)):
+            best = prefix
+    return best
+
+
+def _prefix_keys(storage: Any, prefix: str, prefixes: List[str]) -> List[str]:
+    """List a prefix's keys in sorted order, leaving out keys a longer prefix owns."""
+    return sorted(key for key in storage.keys(prefix) if _owner(key, prefixes) == prefix)
+
+
+def load_checkpoint(path: Optional[str]) -> Dict[str, Any]:
+    """Load a copy checkpoint, or an empty one if there is none yet."""
+    if path and os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            checkpoint = json.load(f)
+        if checkpoint.get("version") != CHECKPOINT_VERSION:
+            raise ValueError(f"{path} is not a version {CHECKPOINT_VERSION} copy checkpoint")
+        return checkpoint
+    return {"version": CHECKPOINT_VERSION, "prefixes": {}}
+
+
+def _save_checkpoint(path: str, checkpoint: Dict[str, Any]) -> None:
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp_path, path)
+
+
+def copy_store(source: Any, target: Any, prefixes: Optional[List[str]] = None,
+               batch_size: int = DEFAULT_BATCH_SIZE, checkpoint_path: Optional[str] = None,
+               prefetch: int = DEFAULT_PREFETCH,
+               progress: Optional[Callable[[str, int, int], Any]] = None) -> Dict[str, Any]:
+    """Copy keys from source to target, resuming from the checkpoint if there is one.
+
+    progress(prefix, done, total) is called after every page.
+    """
+    started = time.perf_counter()
+    prefixes = prefixes or [""]
+    checkpoint = load_checkpoint(checkpoint_path)
+    copied = 0
+
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix="copy-read") as reader:
+        for prefix in prefixes:
+            state = checkpoint["prefixes"].setdefault(
+                prefix, {"last_key": None, "count": 0, "checksum": 0, "done": False}
+            )
+            if state["done"]:
+                logger.info(f"Prefix '{prefix}' already copied, skipping")
+                continue
+
+            keys = _prefix_keys(source, prefix, prefixes)
+            total = len(keys)
+            if state["last_key"] is not None:
+                keys = [key for key in keys if key > state["last_key"]]
+            pages = deque(keys[start:start + batch_size] for start in range(0, len(keys), batch_size))
+
+            # Keep a few reads in flight while the current page is written
+            pending = deque()
+            processed = 0
+            while pages or pending:
+                while pages and len(pending) < prefetch:
+                    page = pages.popleft()
+                    pending.append((page, reader.submit(source.get_many, page)))
+                page, future = pending.popleft()
+                values = future.result()
+
+                target.set_many(values)
+                for key, value in values.items():
+                    state["checksum"] = (state["checksum"] + _record_checksum(key, value)) % CHECKSUM_MOD
+                state["count"] += len(values)
+                state["last_key"] = page[-1]
+                copied += len(values)
+                if checkpoint_path:
+                    _save_checkpoint(checkpoint_path, checkpoint)
+                processed += len(page)
+                if progress is not None:
+                    progress(prefix, total - len(keys) + processed, total)
+
+            state["done"] = True
+            if checkpoint_path:
+                _save_checkpoint(checkpoint_path, checkpoint)
+            logger.info(f"Copied {state['count']} keys under '{prefix}'")
+
+    elapsed = time.perf_counter() - started
+    return {"copied": copied, "seconds": elapsed, "prefixes": checkpoint["prefixes"]}
+
+
+def _checksum_keys(storage: Any, keys: List[str], batch_size: int) -> Dict[str, int]:
+    """Read keys in pages and get their count and order-independent checksum."""
+    count = 0
+    checksum = 0
+    for start in range(0, len(keys), batch_size):
+        for key, value in storage.get_many(keys[start:start + batch_size]).items():
+            checksum = (checksum + _record_checksum(key, value)) % CHECKSUM_MOD
+            count += 1
+    return {"count": count, "checksum": checksum}
+
+
+def verify_copy(source: Any, target: Any, prefixes: Optional[List[str]] = None,
+                batch_size: int = DEFAULT_BATCH_SIZE, checkpoint_path: Optional[str] = None,
+                deep: bool = False) -> Dict[str, Any]:
+    """Compare key counts and checksums per prefix between source and target.
+
+    The source checksum comes from the copy checkpoint; with deep=True (or
+    without a checkpoint) the source is read again instead.
+    """
+    prefixes = prefixes or [""]
+    checkpoint = load_checkpoint(checkpoint_path)
+    results = {}
+    for prefix in prefixes:
+        source_keys = _prefix_keys(source, prefix, prefixes)
+        target_keys = _prefix_keys(target, prefix, prefixes)
+        state = checkpoint["prefixes"].get(prefix)
+        if deep or state is None or not state.get("done"):
+            expected = _checksum_keys(source, source_keys, batch_size)
+        else:
+            expected = {"count": state["count"], "checksum": state["checksum"]}
+        actual = _checksum_keys(target, source_keys, batch_size)
+        missing = sorted(set(source_keys) - set(target_keys))
+        checksum_match = expected == actual
+        results[prefix] = {
+            "source_keys": len(source_keys),
+            "target_keys": len(target_keys),
+            "copied_keys": expected["count"],
+            "checksum_match": checksum_match,
+            "missing": missing[:20],
+            "ok": checksum_match and not missing and expected["count"] == len(source_keys),
+        }
+    return {"ok": all(result["ok"] for result in results.values()), "prefixes": results}
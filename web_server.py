@@ -6,6 +6,9 @@ import psutil
 import os
 from datetime import datetime
 
+from utils import metrics
+from utils.database import get_storage_stats
+
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
@@ -88,6 +91,17 @@ def status():
         'users': bot_status['users']
     })
 
+@app.route('/metrics')
+def storage_metrics():
+    """Storage call latency, throughput, hot keys and per-command I/O."""
+    try:
+        snapshot = metrics.registry.snapshot(hot_keys=20)
+        snapshot['storage'] = get_storage_stats()
+        return jsonify(snapshot)
+    except Exception as e:
+        logger.error(f"Metrics endpoint error: {e}")
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
 def run_flask_app():
     """Run Flask app in a separate thread."""
     try: